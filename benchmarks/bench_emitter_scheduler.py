@@ -0,0 +1,99 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Compares a task per modlog channel against the shared emitter scheduler, for many channels where only a few are
+# busy at a time. Delivery throughput is capped by Discord's global rate limit of 50 requests per second either way.
+# Usage: python -m benchmarks.bench_emitter_scheduler
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from lightning.utils.emitters import EmitterScheduler, TextChannelEmitter
+
+CHANNELS = 20_000
+# Channels that get an event in each round
+BUSY = 200
+ROUNDS = 5
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+        self._state = SimpleNamespace(http=SimpleNamespace())
+        self.sent = 0
+
+    async def send(self, **kwargs) -> None:
+        # A request to Discord
+        await asyncio.sleep(0.05)
+        self.sent += 1
+
+
+async def run(name: str, scheduled: bool) -> None:
+    gc.collect()
+    tracemalloc.start()
+    channels = [FakeChannel(i) for i in range(CHANNELS)]
+    scheduler = EmitterScheduler(idle_timeout=3600)
+    emitters = []
+    for channel in channels:
+        emitter = TextChannelEmitter(channel)
+        if scheduled:
+            scheduler.add(channel.id, emitter)
+        else:
+            emitter.start()
+        emitters.append(emitter)
+
+    if scheduled:
+        scheduler.start()
+    await asyncio.sleep(0)
+    memory, _ = tracemalloc.get_traced_memory()
+    tasks = len(asyncio.all_tasks()) - 1
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for burst in range(ROUNDS):
+        for emitter in rng.sample(emitters, BUSY):
+            await emitter.put("event")
+        # Let everything queued go out before the next burst
+        while sum(channel.sent for channel in channels) < (burst + 1) * BUSY:
+            await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    print(f"{name:<10} {tasks:>7,} tasks  {memory / 2**20:7.1f} MiB  {ROUNDS * BUSY:,} messages in {elapsed:6.3f}s "
+          f"({ROUNDS * BUSY / elapsed:,.0f}/s)")
+
+    if scheduled:
+        print(f"{'':<10} {scheduler.active} active and {scheduler.idle:,} idle emitters afterwards")
+        scheduler.idle_timeout = 0
+        print(f"{'':<10} {scheduler.reap():,} reaped once they've been idle for idle_timeout")
+        scheduler.close()
+    else:
+        for emitter in emitters:
+            emitter.close()
+    await asyncio.sleep(0)
+
+
+async def main() -> None:
+    print(f"{CHANNELS:,} channels, {BUSY} busy per round")
+    await run("per task", scheduled=False)
+    await run("scheduled", scheduled=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Measures modlog rendering for a join/leave and role change flood in a guild with several log channels, rendering
+# per channel like ModLog used to against rendering once per format through ModLog.emit.
+# Usage: python -m benchmarks.bench_modlog_render
+import asyncio
+import datetime
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, List, Type
+
+from lightning.cogs.modlog.cog import ModLog
+from lightning.enums import LoggingType
+from lightning.models import LoggingConfig
+
+EVENTS = 5_000
+# Big guilds tend to have a few channels per format, e.g. a public log and a staff log
+FORMATS = ["minimal with timestamp", "minimal with timestamp", "minimal without timestamp", "emoji", "emoji",
+           "embed", "embed"]
+
+
+class FakeRole:
+    def __init__(self, role_id: int) -> None:
+        self.id = role_id
+        self.name = f"Role *{role_id}*"
+        self.mention = f"<@&{role_id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+class FakeGuild:
+    id = 1
+
+
+class FakeMember:
+    def __init__(self, member_id: int, roles: List[FakeRole]) -> None:
+        self.id = member_id
+        self.name = f"user_{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.created_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        self.joined_at = datetime.datetime.now(datetime.timezone.utc)
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.discordapp.com/embed/avatars/{member_id % 5}.png")
+        self.roles = roles
+        self.guild = FakeGuild
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeEmitter:
+    def __init__(self) -> None:
+        self.entries = 0
+
+    async def put(self, content=None, **kwargs) -> None:
+        self.entries += 1
+
+
+def role_change_event(member_id: int, roles: List[FakeRole]) -> SimpleNamespace:
+    before = FakeMember(member_id, roles[:8])
+    after = FakeMember(member_id, roles[1:8] + [roles[random.randrange(8, len(roles))]])
+    return SimpleNamespace(entry=None, before=before, after=after, moderator=None, reason=None, guild=FakeGuild,
+                           added_roles=[r for r in after.roles if r not in before.roles],
+                           removed_roles=[r for r in before.roles if r not in after.roles])
+
+
+class PerChannelModLog(ModLog):
+    async def emit(self, guild, feature, render) -> None:
+        # What the listeners did before, rendering the event again for every channel
+        for emitter, record in await self.get_records(guild, feature):
+            message = render(record['format'])
+            if message is not None:
+                await emitter.put(**message)
+
+
+def make_cog(cls: Type[ModLog]) -> ModLog:
+    config = LoggingConfig([{'channel_id': channel_id, 'types': int(LoggingType.all), 'format': fmt,
+                             'webhook_url': None} for channel_id, fmt in enumerate(FORMATS)])
+    emitters = [FakeEmitter() for _ in FORMATS]
+
+    async def get_records(guild, feature):
+        return [(emitters[channel_id], rec) for channel_id, rec in config.get_channels_with_feature(feature)]
+
+    async def wait_until_ready():
+        pass
+
+    bot_config = SimpleNamespace(bot=SimpleNamespace(durable_modlog=False))
+    cog = cls(SimpleNamespace(config=bot_config, wait_until_ready=wait_until_ready))
+    cog.get_records = get_records
+    return cog
+
+
+async def bench(name: str, events: List[Any], run: Callable[[Any], Awaitable[None]]) -> None:
+    start = time.perf_counter()
+    for event in events:
+        await run(event)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {len(events):>7,} events  {elapsed:6.3f}s  {len(events) / elapsed:>9,.0f} events/s")
+
+
+async def main() -> None:
+    roles = [FakeRole(1000 + i) for i in range(30)]
+    members = [FakeMember(10_000 + i, roles[:3]) for i in range(EVENTS)]
+    role_events = [role_change_event(20_000 + i, roles) for i in range(EVENTS)]
+    print(f"{len(FORMATS)} log channels: {', '.join(FORMATS)}")
+
+    for name, cls in (("per channel", PerChannelModLog), ("once per format", ModLog)):
+        cog = make_cog(cls)
+        await bench(f"joins, {name}", members, lambda m: cog._log_member_join_leave(m, LoggingType.MEMBER_JOIN))
+        await bench(f"roles, {name}", role_events,
+                    lambda e: cog._log_role_changes(LoggingType.MEMBER_ROLE_ADD, e))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
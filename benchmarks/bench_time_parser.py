@@ -0,0 +1,118 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Compares HumanTime against plain parsedatetime for correctness and speed.
+# Usage: python -m benchmarks.bench_time_parser
+import datetime
+import random
+import time
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+
+import parsedatetime as pdt
+
+from lightning.utils.time import HumanTime, fast_parse
+
+# Durations and times people give reminders, timebans, timemutes and mod flags
+CORPUS = [
+    "in 2h", "in 2 hours", "2 hours", "in 10 minutes", "10 mins", "10 min", "30m", "45 minutes", "in 30s",
+    "in 30 seconds", "90 seconds", "an hour", "in an hour", "a day", "in a week", "1 hour 30 minutes",
+    "in 1 hour 30 minutes", "1 day 2 hours", "2d", "3 days", "in 3 days", "7 days", "2 weeks", "1w", "in 2 weeks",
+    "1 week 2 days", "12h", "24 hours", "In 5 Minutes", "in  2  hours", "tomorrow", "today", "tomorrow 5pm",
+    "tomorrow at 5pm", "tomorrow at 17:30", "tomorrow 9am", "today 5pm", "today at 11:45pm", "5pm", "at 5pm",
+    "5:30pm", "12am", "12pm", "12:15am", "17:30", "at 08:00", "noon", "at noon", "2025-05-01", "2025-05-01 17:00",
+    "2025-12-31 23:59:30", "2025-05-01 5pm", "next week", "next friday", "friday", "on monday", "in 2 months",
+    "1 year", "tonight", "midnight", "this evening", "1.5 hours", "in 1 hr", "3 hrs", "next month", "june 1st",
+    "jan 5 at 3pm", "end of day", "asdf", "soon",
+]
+# Inputs the old path got wrong on purpose
+KNOWN_FIXES = {"2025-05-01T17:00", "2025-05-01T17:00:00"}
+TIMEZONES = [ZoneInfo("UTC"), ZoneInfo("America/New_York"), ZoneInfo("Asia/Tokyo")]
+CALLS = 20_000
+
+
+class OldHumanTime:
+    """HumanTime before the fast path, straight to parsedatetime."""
+    calendar = pdt.Calendar(version=pdt.VERSION_CONTEXT_STYLE)
+
+    def __init__(self, argument: str, *, now: datetime.datetime, tz: datetime.tzinfo) -> None:
+        dt, status = self.calendar.parseDT(argument, sourceTime=now)
+        if not status.hasDateOrTime:
+            raise ValueError(argument)
+
+        if not status.hasTime:
+            dt = dt.replace(hour=now.hour, minute=now.minute, second=now.second, microsecond=now.microsecond)
+
+        self.dt = dt.replace(tzinfo=tz)
+
+
+def parse(cls: Callable, argument: str, now: datetime.datetime, tz: datetime.tzinfo) -> Optional[datetime.datetime]:
+    try:
+        return cls(argument, now=now, tz=tz).dt
+    except Exception:
+        return None
+
+
+def compare() -> None:
+    mismatches = 0
+    checks = 0
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for _ in range(200):
+        # Messages arrive in UTC, the user's timezone is only attached afterwards
+        now = start + datetime.timedelta(seconds=random.randrange(365 * 86400), microseconds=random.randrange(10**6))
+        tz = random.choice(TIMEZONES)
+        for argument in CORPUS:
+            checks += 1
+            old, new = parse(OldHumanTime, argument, now, tz), parse(HumanTime, argument, now, tz)
+            if old != new:
+                mismatches += 1
+                print(f"MISMATCH {argument!r} at {now}: old {old} new {new}")
+
+    for argument in sorted(KNOWN_FIXES):
+        print(f"{argument!r:<24} old {parse(OldHumanTime, argument, start, TIMEZONES[0])}  "
+              f"new {parse(HumanTime, argument, start, TIMEZONES[0])}")
+
+    covered = sum(fast_parse(argument, start) is not None for argument in CORPUS)
+    print(f"{checks:,} comparisons, {mismatches} mismatches. The fast path covers {covered}/{len(CORPUS)} inputs.")
+
+
+def bench(name: str, cls: Callable) -> None:
+    # A steady stream of commands, ten a second, drawn from the corpus with common forms weighted up
+    arguments = random.Random(0).choices(CORPUS, weights=[1 / (n + 1) ** 0.5 for n in range(len(CORPUS))], k=CALLS)
+    now = datetime.datetime(2025, 3, 1, 12, tzinfo=datetime.timezone.utc)
+    latencies = []
+    for argument in arguments:
+        now += datetime.timedelta(seconds=0.1)
+        start = time.perf_counter()
+        parse(cls, argument, now, TIMEZONES[1])
+        latencies.append(time.perf_counter() - start)
+
+    total = sum(latencies)
+    latencies.sort()
+    p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    print(f"{name:<6} {CALLS:>7,} parses  {total:6.3f}s  {CALLS / total:>9,.0f} parses/s  "
+          f"p50 {p50 * 1e6:8.1f}us  p99 {p99 * 1e6:8.1f}us")
+
+
+def main() -> None:
+    compare()
+    print()
+    bench("old", OldHumanTime)
+    bench("new", HumanTime)
+
+
+if __name__ == "__main__":
+    main()
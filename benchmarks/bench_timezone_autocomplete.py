@@ -0,0 +1,67 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Measures timezone autocomplete latency per keystroke, fuzzy matching every key against the prefix index.
+# Usage: python -m benchmarks.bench_timezone_autocomplete
+import time
+from typing import Callable, List
+from zoneinfo import available_timezones
+
+import rapidfuzz
+
+from lightning.utils.timezones import TimezoneIndex
+
+# What users type, one keystroke at a time
+QUERIES = ["America/New_York", "new york", "los angeles", "london", "Europe/Berlin", "tokyo", "EST", "pst",
+           "kolkatta", "sydney", "utc", "sao paulo", "Asia/Singapore", "berln", "chicago"]
+KEYSTROKES = [query[:i] for query in QUERIES for i in range(1, len(query) + 1)]
+ROUNDS = 20
+
+
+def bench(name: str, search: Callable[[str], List[str]]) -> None:
+    latencies = []
+    for _ in range(ROUNDS):
+        for keystroke in KEYSTROKES:
+            start = time.perf_counter()
+            search(keystroke)
+            latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    print(f"{name:<8} {len(latencies):>7,} lookups  p50 {p50 * 1e6:9.1f}us  p99 {p99 * 1e6:9.1f}us")
+
+
+def main() -> None:
+    keys = available_timezones()
+
+    def fuzzy(query: str) -> List[str]:
+        return [key for key, _, _ in rapidfuzz.process.extract(query, keys, limit=25, score_cutoff=60)]
+
+    start = time.perf_counter()
+    index = TimezoneIndex(keys)
+    print(f"Built an index of {len(keys):,} timezones in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    bench("fuzzy", fuzzy)
+    bench("index", index.search)
+
+    print()
+    for query in ("new york", "pst", "berln", "angeles"):
+        print(f"{query!r:<10} fuzzy: {', '.join(fuzzy(query)[:3])}")
+        print(f"{'':<10} index: {', '.join(index.search(query)[:3])}")
+
+
+if __name__ == "__main__":
+    main()
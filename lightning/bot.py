@@ -23,9 +23,11 @@ import logging
 import pathlib
 import secrets
 import sys
+import time
 import traceback
 from datetime import datetime
-from typing import TYPE_CHECKING, List, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
 
 import aiohttp
 import asyncpg
@@ -34,15 +36,19 @@ import redis.asyncio as aioredis
 import sentry_sdk
 from discord import app_commands
 from discord.ext import commands, menus
-from sanctum import HTTPClient
 
-from lightning import cache, errors
+from lightning import cache, errors, queries, tracing
 from lightning.config import Config
 from lightning.context import LightningContext
 from lightning.meta import __version__ as version
+from lightning.metrics import LISTENER_ERRORS_COUNTER, LISTENER_TIMING_HIST, TimingWindow
 from lightning.models import GuildBotConfig
 from lightning.storage import Storage
+from lightning.utils.api import CachedHTTPClient
 from lightning.utils.emitters import WebhookEmbedEmitter
+from lightning.utils.localapi import LocalHTTPClient
+from lightning.utils.loopmonitor import LoopMonitor
+from lightning.utils.timezones import UserTimezoneCache
 
 if TYPE_CHECKING:
     from lightning.cogs.listeners.events import ListenerEvents
@@ -105,7 +111,7 @@ class Tree(app_commands.CommandTree):
 class LightningBot(commands.AutoShardedBot):
     pool: asyncpg.Pool
     redis_pool: aioredis.Redis
-    api: HTTPClient
+    api: CachedHTTPClient
     aiosession: aiohttp.ClientSession
     user: discord.ClientUser
 
@@ -131,6 +137,15 @@ class LightningBot(commands.AutoShardedBot):
 
         self.blacklisted_users = Storage("config/user_blacklist.json")
 
+        # (cog, listener, event) -> timings for the last hour
+        self.listener_timings: TimingWindow[Tuple[str, str, str]] = TimingWindow()
+        self._listener_labels: Dict[Tuple[Callable, str], Tuple[str, str, str]] = {}
+        self.loop_monitor = LoopMonitor(slow_threshold=config.bot.slow_callback_threshold,
+                                        stall_threshold=config.bot.loop_stall_threshold)
+        self.tracer = tracing.Tracer(sample_rate=config.bot.trace_sample_rate,
+                                     slow_threshold=config.bot.slow_command_threshold)
+        tracing.instrument_http(self.http)
+
     async def load_cogs(self) -> None:
         def _transform_path(p):
             return str(p).replace("/", ".").replace("\\", ".")
@@ -160,7 +175,16 @@ class LightningBot(commands.AutoShardedBot):
                 log.error(f"Failed to load {cog}", exc_info=e)
 
     async def setup_hook(self):
-        self.api = HTTPClient(self.config.tokens.api.url, self.config.tokens.api.key)
+        self.loop_monitor.start()
+        api = self.config.tokens.api
+        options = {"ttls": None if api.cache else {}, "request_timeout": api.request_timeout,
+                   "max_retries": api.max_retries, "breaker_threshold": api.circuit_breaker_threshold,
+                   "breaker_timeout": api.circuit_breaker_timeout}
+        if api.url == "local":
+            log.warning("Using the local stand-in for the Sanctum API")
+            self.api = LocalHTTPClient(self.pool, **options)
+        else:
+            self.api = CachedHTTPClient(api.url, api.key, **options)
 
         if self.config.bot.user_agent:
             headers = {"User-Agent": self.config.bot.user_agent}
@@ -173,7 +197,9 @@ class LightningBot(commands.AutoShardedBot):
         self._error_logger = WebhookEmbedEmitter(self.config.logging.bot_errors, session=self.aiosession)
         self._error_logger.start()
 
-        await self.fill_redis_timezone_cache()
+        self.timezones = UserTimezoneCache(self.pool, self.redis_pool)
+        log.info(f"Warmed {await self.timezones.warm()} user timezones")
+        self.timezones.start()
 
     @cache.cached('guild_bot_config', cache.Strategy.raw)
     async def get_guild_bot_config(self, guild_id: int) -> Optional[GuildBotConfig]:
@@ -189,19 +215,11 @@ class LightningBot(commands.AutoShardedBot):
         Optional[GuildBotConfig]
             The guild's bot configuration or None
         """
-        query = """SELECT * FROM guild_config WHERE guild_id=$1;"""
-        record = await self.pool.fetchrow(query, guild_id)
+        record = await self.pool.fetchrow(queries.GET_GUILD_CONFIG, guild_id)
         return GuildBotConfig(self, record) if record else None
 
-    async def fill_redis_timezone_cache(self):
-        records = await self.pool.fetch("SELECT * FROM user_settings;")
-        for record in records:
-            if record['timezone']:
-                await self.redis_pool.set(f"lightning:user_settings:{record['user_id']}:timezone", record['timezone'])
-
-    async def get_user_timezone(self, user_id: int) -> Optional[str]:
-        r: Optional[str] = await self.redis_pool.get(f"lightning:user_settings:{user_id}:timezone")
-        return r
+    async def get_user_timezone(self, user_id: int) -> Optional[ZoneInfo]:
+        return await self.timezones.get(user_id)
 
     def ignore_modlog_event(self, guild_id: int, event_name: str, key: str):
         cog: ListenerEvents = self.get_cog("ListenerEvents")  # type: ignore
@@ -235,6 +253,46 @@ class LightningBot(commands.AutoShardedBot):
             log.debug(f"Trying to load {cog.__module__} ({str(cog)})")
             await self.add_cog(cog)
 
+    def _get_listener_labels(self, coro: Callable[..., Coroutine[Any, Any, Any]],
+                             event_name: str) -> Tuple[str, str, str]:
+        # Bound methods are keyed by their function so unloaded cogs aren't kept alive
+        key = (getattr(coro, "__func__", coro), event_name)
+        labels = self._listener_labels.get(key)
+        if labels is None:
+            owner = getattr(coro, "__self__", None)
+            if isinstance(owner, commands.Cog):
+                cog = owner.qualified_name
+            elif owner is self:
+                cog = self.__class__.__name__
+            else:
+                cog = getattr(coro, "__module__", None) or "unknown"
+
+            labels = self._listener_labels[key] = (cog, getattr(coro, "__name__", repr(coro)), event_name)
+        return labels
+
+    async def _run_event(self, coro: Callable[..., Coroutine[Any, Any, Any]], event_name: str, *args: Any,
+                         **kwargs: Any) -> None:
+        labels = self._get_listener_labels(coro, event_name)
+
+        async def timed(*args: Any, **kwargs: Any) -> None:
+            # Listeners dispatched while a command is running shouldn't show up in its trace
+            tracing.current_trace.set(None)
+            start = time.perf_counter()
+            failed = False
+            try:
+                await coro(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                LISTENER_TIMING_HIST.labels(*labels).observe(duration)
+                if failed:
+                    LISTENER_ERRORS_COUNTER.labels(*labels).inc()
+                self.listener_timings.record(labels, duration, failed=failed)
+
+        await super()._run_event(timed, event_name, *args, **kwargs)
+
     async def on_ready(self) -> None:
         summary = f"{len(self.guilds)} guild(s) and {len(self.users)} user(s)"
         log.info(f'READY: {str(self.user)} ({self.user.id}) and can see {summary}.')
@@ -279,19 +337,36 @@ class LightningBot(commands.AutoShardedBot):
         else:
             del self.command_spammers[author]
 
+    async def get_prefix(self, message: discord.Message, /) -> Union[List[str], str]:
+        with tracing.span("prefix"):
+            return await super().get_prefix(message)
+
     async def get_context(self, message: Union[discord.Message, discord.Interaction], *, cls=LightningContext):
-        return await super().get_context(message, cls=cls)
+        with tracing.span("get_context"):
+            return await super().get_context(message, cls=cls)
 
     async def process_command_usage(self, message):
         if str(message.author.id) in self.blacklisted_users:
             return
 
-        ctx = await self.get_context(message)
+        trace, token = self.tracer.start()
+        try:
+            ctx = await self.get_context(message)
+        except Exception:
+            self.tracer.discard(token)
+            raise
+
         if ctx.command is None:
+            self.tracer.discard(token)
             return
 
-        await self.auto_blacklist_check(message)
-        await self.invoke(ctx)
+        try:
+            await self.auto_blacklist_check(message)
+            with tracing.span("invoke"):
+                await self.invoke(ctx)
+        finally:
+            self.tracer.finish(trace, token, command=ctx.command.qualified_name if ctx.command else "unknown",
+                               failed=ctx.command_failed)
 
     async def on_message(self, message):
         if message.author.bot:
@@ -460,6 +535,8 @@ class LightningBot(commands.AutoShardedBot):
 
     async def close(self) -> None:
         log.info("Shutting down...")
+        self.loop_monitor.stop()
+        self.timezones.stop()
         log.info("Closing database...")
         await self.pool.close()
         await self.aiosession.close()
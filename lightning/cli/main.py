@@ -97,6 +97,10 @@ async def launch_bot(config: Config) -> None:
     if config.bot.owner_ids:
         kwargs['owner_ids'] = config.bot.owner_ids
 
+    if config.bot.shard_ids is not None:
+        kwargs['shard_ids'] = config.bot.shard_ids
+        kwargs['shard_count'] = config.bot.shard_count
+
     if config.bot.game:
         kwargs['activity'] = discord.Game(config.bot.game)
 
@@ -107,7 +111,8 @@ async def launch_bot(config: Config) -> None:
         bot.command_prefix = config.bot.beta_prefix
 
     try:
-        bot.pool = await create_pool(bot.config['tokens']['postgres']['uri'], command_timeout=60)
+        bot.pool = await create_pool(config.tokens.postgres.uri, command_timeout=60,
+                                     slow_query_threshold=config.tokens.postgres.slow_query_threshold)
         bot.redis_pool = redis.Redis(host=bot.config.tokens.redis.host, port=bot.config.tokens.redis.port,
                                      db=bot.config.tokens.redis.db, password=bot.config.tokens.redis.password,
                                      decode_responses=True)
@@ -178,3 +178,35 @@ async def reset_migrations():
     m.config["applied"] = []
     m.save()
     typer.echo("Reset your migrations config")
+
+
+@parser.command('backfill-rollups')
+@asyncd
+async def backfill_rollups():
+    """Rebuilds the command usage rollups from the command_stats history that is still retained"""
+    from lightning.cogs.stats import DAILY_ROLLUP_QUERY, HOURLY_ROLLUP_QUERY
+
+    m = Migrator()
+    conn = await asyncpg.connect(m.config["postgres_uri"])
+
+    # Partitions are expired a month at a time, so days before this are no longer in command_stats and
+    # their rollups have to be kept.
+    oldest = await conn.fetchval("SELECT MIN(used_at)::date FROM command_stats;")
+    if oldest is None:
+        await conn.close()
+        typer.echo("There is no command history to backfill from!")
+        return
+
+    # The bot waits on this lock before merging into the rollups, so no batches are counted twice or lost.
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE command_usage_daily, command_usage_hourly IN EXCLUSIVE MODE;")
+        await conn.execute("DELETE FROM command_usage_daily WHERE day >= $1;", oldest)
+        await conn.execute("DELETE FROM command_usage_hourly WHERE day >= $1;", oldest)
+        typer.echo(f"Building daily rollups since {oldest}...")
+        await conn.execute(DAILY_ROLLUP_QUERY.format(staging="command_stats"))
+        typer.echo(f"Building hourly rollups since {oldest}...")
+        await conn.execute(HOURLY_ROLLUP_QUERY.format(staging="command_stats"))
+
+    total = await conn.fetchval("SELECT COALESCE(SUM(uses), 0)::bigint FROM command_usage_hourly;")
+    await conn.close()
+    typer.secho(f"Backfilled rollups for {total} commands!", fg=typer.colors.GREEN)
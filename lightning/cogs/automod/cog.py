@@ -28,7 +28,7 @@ from sanctum.exceptions import DataConflict, NotFound
 from unidecode import unidecode
 
 from lightning import (CommandLevel, GuildContext, LightningBot, LightningCog,
-                       LightningContext, cache, hybrid_group)
+                       LightningContext, cache, hybrid_group, queries)
 from lightning.cogs.automod import ui
 from lightning.cogs.automod.converters import (AutoModDuration,
                                                AutoModDurationResponse,
@@ -352,6 +352,7 @@ class AutoMod(LightningCog, required=["Moderation"]):
                        warn_threshold=EXCLUDED.warn_threshold,
                        warn_punishment=EXCLUDED.warn_punishment;"""
         await self.bot.pool.execute(query, guild.id, limit, punishment.upper())
+        self.bot.api.invalidate(f"/guilds/{guild.id}")
 
     @automod_warn_threshold.command(name='set', level=CommandLevel.Admin)
     @is_server_manager()
@@ -400,6 +401,7 @@ class AutoMod(LightningCog, required=["Moderation"]):
         # Remove old configuration
         query = "UPDATE guild_mod_config SET warn_ban=NULL, warn_kick=NULL WHERE guild_id=$1;"
         await self.bot.pool.execute(query, ctx.guild.id)
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await cog.get_mod_config.invalidate(ctx.guild.id)
 
         await ctx.send("Migrated to the new warn thresholds!")
@@ -416,6 +418,7 @@ class AutoMod(LightningCog, required=["Moderation"]):
             await ctx.send("This server never had a warn threshold set up!")
             return
 
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await ctx.send("Removed warn threshold!")
         await self.get_automod_config.invalidate(ctx.guild.id)
 
@@ -425,6 +428,7 @@ class AutoMod(LightningCog, required=["Moderation"]):
                    ON CONFLICT (guild_id)
                    DO NOTHING;"""
         await self.bot.pool.execute(query, guild.id)
+        self.bot.api.invalidate(f"/guilds/{guild.id}")
 
     @automod.command(level=CommandLevel.Admin, name="gatekeeper")
     @is_server_manager()
@@ -739,9 +743,7 @@ class AutoMod(LightningCog, required=["Moderation"]):
         await self.handle_name_changing(after, record)
 
     async def get_warn_count(self, guild_id: int, user_id: int) -> int:
-        query = "SELECT COUNT(*) FROM infractions WHERE user_id=$1 AND guild_id=$2 AND action=$3;"
-        rev = await self.bot.pool.fetchval(query, user_id, guild_id,
-                                           ActionType.WARN.value)
+        rev = await self.bot.pool.fetchval(queries.GET_WARN_COUNT, user_id, guild_id, ActionType.WARN.value)
         return rev or 0
 
     # Warn Thresholds
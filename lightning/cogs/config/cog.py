@@ -25,7 +25,7 @@ from discord import app_commands
 from discord.ext import commands
 
 from lightning import (CommandLevel, GuildContext, LightningCog, cache, group,
-                       hybrid_group)
+                       hybrid_group, queries)
 from lightning.cogs.config import ui
 from lightning.converters import Role, ValidCommandName, convert_to_level_value
 from lightning.formatters import plural
@@ -47,20 +47,22 @@ class Configuration(LightningCog):
 
     async def get_mod_config(self, ctx, *, connection=None) -> Optional[GuildModConfig]:
         connection = connection or self.bot.pool
-        query = """SELECT * FROM guild_mod_config WHERE guild_id=$1"""
-        ret = await connection.fetchrow(query, ctx.guild.id)
+        ret = await connection.fetchrow(queries.GET_GUILD_MOD_CONFIG, ctx.guild.id)
         if not ret:
             return None
         return GuildModConfig(ret, self.bot)
 
     async def invalidate_config(self, ctx: GuildContext, *, config_name="mod_config") -> bool:
         """Function to reduce duplication for invalidating a cached guild mod config"""
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         c = cache.registry.get(config_name)
         return await c.invalidate(str(ctx.guild.id))
 
     async def remove_config_key(self, guild_id: int, key: str, *, table='guild_config') -> str:
         query = f"UPDATE {table} SET {key} = NULL WHERE guild_id=$1;"
-        return await self.bot.pool.execute(query, guild_id)
+        resp = await self.bot.pool.execute(query, guild_id)
+        self.bot.api.invalidate(f"/guilds/{guild_id}")
+        return resp
 
     @hybrid_group(invoke_without_command=True, level=CommandLevel.Admin)
     @hybrid_guild_permissions(manage_guild=True)
@@ -81,7 +83,9 @@ class Configuration(LightningCog):
                     VALUES ($1, $2)
                     ON CONFLICT (guild_id)
                     DO UPDATE SET {key} = EXCLUDED.{key};"""
-        return await self.bot.pool.execute(query, guild_id, value)
+        resp = await self.bot.pool.execute(query, guild_id, value)
+        self.bot.api.invalidate(f"/guilds/{guild_id}")
+        return resp
 
     @config.command(level=CommandLevel.Admin)
     @commands.bot_has_permissions(manage_roles=True)
@@ -428,6 +432,7 @@ class Configuration(LightningCog):
         """Resets all permission configuration."""
         query = "UPDATE guild_config SET permissions = permissions - 'LEVELS' WHERE guild_id=$1;"
         await self.bot.pool.execute(query, ctx.guild.id)
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
         await ctx.tick(True)
 
@@ -509,5 +514,6 @@ class Configuration(LightningCog):
         """Removes all command overrides for this server"""
         query = "UPDATE guild_config SET permissions = permissions - 'COMMAND_OVERRIDES' WHERE guild_id=$1;"
         await self.bot.pool.execute(query, ctx.guild.id)
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
         await ctx.tick(True)
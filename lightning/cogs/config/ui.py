@@ -132,6 +132,7 @@ class Prefix(UpdateableMenu, ExitableMenu):
                        prefixes = EXCLUDED.prefixes;
                 """
         await interaction.client.pool.execute(query, interaction.guild_id, list(prefixes))
+        interaction.client.api.invalidate(f"/guilds/{interaction.guild_id}")
         await self.ctx.bot.get_guild_bot_config.invalidate(self.ctx.guild.id)
 
     @discord.ui.button(label="Remove prefix", style=discord.ButtonStyle.danger)
@@ -159,6 +160,7 @@ class Prefix(UpdateableMenu, ExitableMenu):
                     """
             await interaction.client.pool.execute(query, interaction.guild_id, list(prefixes))
 
+        interaction.client.api.invalidate(f"/guilds/{interaction.guild_id}")
         await self.ctx.bot.get_guild_bot_config.invalidate(self.ctx.guild.id)
 
 
@@ -210,12 +212,14 @@ class ModFooter(UpdateableMenu, ExitableMenu):
                    ON CONFLICT (guild_id)
                    DO UPDATE SET footer_message=EXCLUDED.footer_message;"""
         await itx.client.pool.execute(query, itx.guild_id, modal.footer.value)
+        itx.client.api.invalidate(f"/guilds/{itx.guild_id}")
         await itx.followup.send("Set the footer!", ephemeral=True)
 
         await self.invalidate(itx)
         await self.update(interaction=itx)
 
     async def invalidate(self, itx: discord.Interaction[LightningBot]):
+        itx.client.api.invalidate(f"/guilds/{itx.guild_id}")
         cog: Optional[Mod] = itx.client.get_cog("Moderation")  # type: ignore
         if not cog:
             return
@@ -29,7 +29,7 @@ from discord.ext import commands
 from spacy.matcher import Matcher
 
 from lightning import (CommandLevel, GuildContext, LightningBot, LightningCog,
-                       hybrid_group)
+                       hybrid_group, queries)
 from lightning.events import LightningAutoModInfractionEvent
 from lightning.utils.checks import is_server_manager
 
@@ -267,8 +267,7 @@ class AntiScam(LightningCog):
         """Gets the first spoke timestamp for a user in a guild."""
         res = await self.bot.redis_pool.get(f"lightning:first_sent:{guild_id}:{user_id}")
         if res is None:
-            query = "SELECT first_spoke_at FROM spoke_tracking WHERE guild_id=$1 AND user_id=$2;"
-            val = await self.bot.pool.fetchval(query, guild_id, user_id)
+            val = await self.bot.pool.fetchval(queries.GET_FIRST_SPOKE, guild_id, user_id)
             return val.replace(tzinfo=timezone.utc) if val else None
         return datetime.fromisoformat(res)
 
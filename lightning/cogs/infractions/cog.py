@@ -199,6 +199,7 @@ class Infractions(LightningCog, required=['Moderation']):
 
         query = """UPDATE infractions SET user_id=$1 WHERE guild_id=$2 AND user_id=$3;"""
         resp = await self.bot.pool.execute(query, new_user.id, ctx.guild.id, old_user.id)
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         resp = resp.split()
 
         await ctx.send(f"Transferred {resp[-1]} infractions to {new_user.mention}")
@@ -313,6 +314,9 @@ class Infractions(LightningCog, required=['Moderation']):
     async def deactivate_infractions_on_timer_completion(self, timer):
         query = "UPDATE infractions SET active='f' WHERE extra -> 'timer' = $1;"
         await self.bot.pool.execute(query, timer.id)
+        # Timeout timers don't store their guild
+        guild_id = timer.extra.get('guild_id') if timer.extra else None
+        self.bot.api.invalidate(f"/guilds/{guild_id}" if guild_id else "/guilds")
 
     async def detailed_moderator_stats(self, ctx: GuildContext, moderator: discord.Member):
         embed = discord.Embed(title="Detailed Infraction Stats")
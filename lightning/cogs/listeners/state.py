@@ -69,6 +69,7 @@ class State(LightningCog):
                        SET name = EXCLUDED.name, owner_id = EXCLUDED.owner_id, left_at = NULL;
                     """
             await con.execute(query, guild.id, guild.name, guild.owner_id)
+        self.bot.api.invalidate(f"/guilds/{guild.id}")
 
         if whitelisted is False:
             await guild.leave()
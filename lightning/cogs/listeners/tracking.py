@@ -23,9 +23,14 @@ from typing import Tuple
 import discord
 from discord.ext import tasks
 
-from lightning import LightningBot, LightningCog
+from lightning import LightningBot, LightningCog, queries
+from lightning.utils.bulk import BulkWriter
 
-PSQL_LIMIT = 65535
+SPOKE_TRACKING_WRITER = BulkWriter("spoke_tracking", ("user_id", "guild_id", "first_spoke_at", "last_spoke_at"),
+                                   conflict="""ON CONFLICT (user_id, guild_id) DO UPDATE
+                                               SET last_spoke_at = EXCLUDED.last_spoke_at,
+                                                   first_spoke_at = LEAST(spoke_tracking.first_spoke_at,
+                                                                          EXCLUDED.first_spoke_at)""")
 
 
 class Tracking(LightningCog):
@@ -42,8 +47,7 @@ class Tracking(LightningCog):
         """Gets the first spoke timestamp for a user in a guild."""
         res = await self.bot.redis_pool.get(f"lightning:first_sent:{guild_id}:{user_id}")
         if res is None:
-            query = "SELECT first_spoke_at FROM spoke_tracking WHERE guild_id=$1 AND user_id=$2;"
-            val = await self.bot.pool.fetchval(query, guild_id, user_id)
+            val = await self.bot.pool.fetchval(queries.GET_FIRST_SPOKE, guild_id, user_id)
             dt = val.replace(tzinfo=timezone.utc) if val else None
             if dt:
                 await self.bot.redis_pool.set(f"lightning:first_sent:{guild_id}:{user_id}",
@@ -65,22 +69,9 @@ class Tracking(LightningCog):
             # No data to insert
             return
 
-        query = """INSERT INTO spoke_tracking (user_id, guild_id, last_spoke_at, first_spoke_at)
-                   SELECT data.user_id, data.guild_id, data.last_timestamp, data.first_timestamp
-                   FROM jsonb_to_recordset($1::jsonb) AS
-                    data(user_id BIGINT, guild_id BIGINT, first_timestamp TIMESTAMP, last_timestamp TIMESTAMP)
-                   ON CONFLICT (user_id, guild_id) DO UPDATE
-                   SET last_spoke_at = EXCLUDED.last_spoke_at,
-                       first_spoke_at = LEAST(spoke_tracking.first_spoke_at, EXCLUDED.first_spoke_at);
-                """
-        async with self.bot.pool.acquire() as connection:
-            async with connection.transaction():
-                for chunk in discord.utils.as_chunks(data.items(), PSQL_LIMIT // 3):
-                    records = [{"user_id": user_id, "guild_id": guild_id,
-                                "first_timestamp": timestamps['first'].isoformat(),
-                                "last_timestamp": timestamps['last'].isoformat()}
-                               for (guild_id, user_id), timestamps in chunk]
-                    await connection.execute(query, records)
+        records = [(user_id, guild_id, timestamps['first'], timestamps['last'])
+                   for (guild_id, user_id), timestamps in data.items()]
+        await SPOKE_TRACKING_WRITER.write(self.bot.pool, records)
 
     @tasks.loop(seconds=5.0)
     async def do_bulk_insert_loop(self):
@@ -29,7 +29,7 @@ from unidecode import unidecode
 
 from lightning import (CommandLevel, GuildContext, LightningBot, LightningCog,
                        LightningContext, cache, command, converters, group,
-                       hybrid_command)
+                       hybrid_command, queries)
 from lightning.cogs.mod.converters import BannedMember
 from lightning.cogs.mod.flags import BanFlags, DefaultModFlags, PurgeFlags
 from lightning.constants import COMMON_HOIST_CHARACTERS
@@ -84,8 +84,7 @@ class Mod(LightningCog, name="Moderation", required=["Configuration"]):
 
     @cache.cached('mod_config', cache.Strategy.lru)
     async def get_mod_config(self, guild_id: int) -> Optional[GuildModConfig]:
-        query = "SELECT * FROM guild_mod_config WHERE guild_id=$1;"
-        record = await self.bot.pool.fetchrow(query, guild_id)
+        record = await self.bot.pool.fetchrow(queries.GET_GUILD_MOD_CONFIG, guild_id)
         return GuildModConfig(record, self.bot) if record else None
 
     async def cog_check(self, ctx: LightningContext) -> bool:
@@ -131,6 +130,7 @@ class Mod(LightningCog, name="Moderation", required=["Configuration"]):
 
         event = InfractionEvent(action, member=target, guild=guild, moderator=moderator, reason=reason, **kwargs)
         await event.action.add_infraction(connection)
+        self.bot.api.invalidate(f"/guilds/{guild.id}")
 
         if not isinstance(action, ActionType):
             action = ActionType[str(action)]
@@ -272,8 +272,8 @@ class Mod(LightningCog, name="Moderation", required=["Configuration"]):
         await ctx.defer()
 
         emoji = "\N{OPEN MAILBOX WITH LOWERED FLAG}"
-        query = "SELECT COUNT(*) FROM infractions WHERE user_id=$1 AND guild_id=$2 AND action=$3;"
-        warns = await self.bot.pool.fetchval(query, target.id, ctx.guild.id, ActionType.WARN.value) or 0
+        warns = await self.bot.pool.fetchval(queries.GET_WARN_COUNT, target.id, ctx.guild.id,
+                                             ActionType.WARN.value) or 0
 
         if self.can_dm_notify(ctx, flags) and isinstance(target, discord.Member):
             footer = ctx.config.footer_message if ctx.config else ""
@@ -473,7 +473,9 @@ class Mod(LightningCog, name="Moderation", required=["Configuration"]):
                    SET active=false
                    WHERE guild_id=$1 AND id=$2;
                 """
-        return await connection.execute(query, guild_id, val)
+        status = await connection.execute(query, guild_id, val)
+        self.bot.api.invalidate(f"/guilds/{guild_id}")
+        return status
 
     @hybrid_command(level=CommandLevel.Mod)
     @app_commands.describe(target="The member to unmute")
@@ -929,8 +931,7 @@ class Mod(LightningCog, name="Moderation", required=["Configuration"]):
     # Role state listeners
     @LightningCog.listener('on_member_join')
     async def reapply_role_state_on_join(self, member: discord.Member):
-        query = "SELECT punishment_roles FROM roles WHERE guild_id=$1 AND user_id=$2;"
-        record = await self.bot.pool.fetchval(query, member.guild.id, member.id)
+        record = await self.bot.pool.fetchval(queries.GET_PUNISHMENT_ROLES, member.guild.id, member.id)
         if not record:
             return
 
@@ -16,24 +16,30 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Dict, List, Optional, Union
+import logging
+import time
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Optional, Sequence,
+                    Tuple, Union)
 
 import discord
 from discord import app_commands
 from discord.ext import commands
+from redis.exceptions import RedisError
 
 from lightning import (CommandLevel, GuildContext, LightningBot, LightningCog,
                        LightningContext, LoggingType, hybrid_group)
 from lightning.cache import Strategy, cached
 from lightning.cogs.modlog import ui
+from lightning.cogs.modlog.stream import ModLogStream
 from lightning.cogs.modlog.utils import (generate_message_embed,
                                          human_friendly_log_names)
 from lightning.constants import LIGHTNING_COLOR
 from lightning.events import LightningAutoModInfractionEvent
-from lightning.models import LoggingConfig, PartialGuild
+from lightning.models import Action, LoggingConfig, PartialGuild
 from lightning.utils import modlogformats
 from lightning.utils.checks import hybrid_guild_permissions, is_server_manager
-from lightning.utils.emitters import TextChannelEmitter
+from lightning.utils.emitters import (EmitterScheduler, TextChannelEmitter,
+                                       WebhookChannelEmitter)
 from lightning.utils.time import ShortTime
 
 if TYPE_CHECKING:
@@ -41,21 +47,36 @@ if TYPE_CHECKING:
                                   InfractionDeleteEvent, InfractionEvent,
                                   InfractionUpdateEvent,
                                   MemberRolesUpdateEvent, MemberUpdateEvent)
+    from lightning.models import LogConfig
+
+log = logging.getLogger(__name__)
+
+MINIMAL_FORMATS = ("minimal with timestamp", "minimal without timestamp")
 
 
 class ModLog(LightningCog):
     """Commands to manage the server's modlog(s)"""
     def __init__(self, bot: LightningBot):
         super().__init__(bot)
-        self._emitters: Dict[int, TextChannelEmitter] = {}
-        self.shushed: List[int] = []  # shushed channels
+        # Emitters are keyed by channel ID
+        self.emitters = EmitterScheduler()
+        self.emitters.start()
+        # channel ID -> when the shush ends, in time.monotonic() seconds
+        self.shushed: Dict[int, float] = {}
+
+        self.stream: Optional[ModLogStream] = None
+        if bot.config.bot.durable_modlog:
+            self.stream = ModLogStream(bot, self.resolve_emitter)
+            self.stream.start()
 
     # TODO: Log changes to infractions
     # I suppose I could use temp ids for a cache like thing?
 
     def cog_unload(self):
-        for emitter in self._emitters.values():
-            emitter.close()
+        if self.stream:
+            self.stream.close()
+
+        self.emitters.close()
 
     @hybrid_group(level=CommandLevel.Admin, fallback="setup")
     @app_commands.guild_only()
@@ -111,41 +132,111 @@ class ModLog(LightningCog):
         records = await self.bot.pool.fetch("SELECT * FROM logging WHERE guild_id=$1;", guild_id)
         return LoggingConfig(records) if records else None
 
-    async def get_records(self, guild: Union[discord.Guild, int], feature: int):
-        """Async iterator that gets logging records for a guild
-
-        Yields an emitter and the record"""
-        if not hasattr(guild, "id"):  # This should be an int
-            guild = self.bot.get_guild(guild)  # type: ignore
-            if not guild:
-                return
-
-        record = await self.get_logging_record(guild.id)
+    async def get_records(self, guild: Union[discord.Guild, int],
+                          feature: LoggingType) -> Sequence[Tuple[TextChannelEmitter, LogConfig]]:
+        """Gets the emitters and logging records of a guild's channels that log a feature"""
+        guild_id = guild if isinstance(guild, int) else guild.id
+        record = await self.get_logging_record(guild_id)
         if not record:
-            return
+            return ()
 
         records = record.get_channels_with_feature(feature)
         if not records:
-            return
+            return ()
 
-        for channel_id, rec in records:
+        if isinstance(guild, int):
+            guild = self.bot.get_guild(guild)  # type: ignore
+            if not guild:
+                return ()
 
-            if channel_id in self.shushed:
-                continue
+        now = time.monotonic()
+        emitters = []
+        for channel_id, rec in records:
+            shushed_until = self.shushed.get(channel_id)
+            if shushed_until is not None:
+                if shushed_until > now:
+                    continue
+                del self.shushed[channel_id]
 
             channel = guild.get_channel(channel_id)
             if not channel:
                 continue
 
-            emitter = self._emitters.get(channel_id, None)
-            if emitter is None:
-                emitter = TextChannelEmitter(channel)  # At some point, we'll also do EmbedsEmitter
-                self._emitters[channel_id] = emitter
+            emitters.append((self._get_emitter(channel, rec), rec))
+
+        return emitters
+
+    def _get_emitter(self, channel: discord.TextChannel, rec: LogConfig) -> TextChannelEmitter:
+        emitter = self.emitters.get(channel.id)
+        if emitter is not None and getattr(emitter, "webhook_url", None) == rec['webhook_url']:
+            return emitter  # type: ignore
+
+        # Either the channel had no emitter yet or its webhook was set up or removed since the emitter was made
+        if rec['webhook_url']:
+            emitter = WebhookChannelEmitter(channel, rec['webhook_url'], session=self.bot.aiosession)
+        else:
+            emitter = TextChannelEmitter(channel)
+        return self.emitters.add(channel.id, emitter)  # type: ignore
+
+    async def resolve_emitter(self, guild_id: int, channel_id: int) -> Optional[TextChannelEmitter]:
+        """Gets the emitter of a channel, if it still logs anything"""
+        record = await self.get_logging_record(guild_id)
+        rec = record.logging.get(channel_id) if record else None
+        if not rec:
+            return None
+
+        guild = self.bot.get_guild(guild_id)
+        channel = guild.get_channel(channel_id) if guild else None
+        if not channel:
+            return None
 
-            if not emitter.running():
-                emitter.start()
+        return self._get_emitter(channel, rec)
 
-            yield emitter, rec
+    async def emit(self, guild: Union[discord.Guild, int], feature: LoggingType,
+                   render: Callable[[str], Optional[Dict[str, Any]]]) -> None:
+        """Sends an event to every channel that logs it.
+
+        The event is rendered at most once per log format, no matter how many channels use that format.
+
+        Parameters
+        ----------
+        guild : Union[discord.Guild, int]
+            The guild the event happened in
+        feature : LoggingType
+            The type of event
+        render : Callable[[str], Optional[Dict[str, Any]]]
+            Builds the message for a log format, as keyword arguments for the emitter. It can return None to skip
+            channels using that format.
+        """
+        records = await self.get_records(guild, feature)
+        if not records:
+            return
+
+        rendered: Dict[str, Optional[Dict[str, Any]]] = {}
+        for emitter, record in records:
+            fmt = record['format']
+            try:
+                message = rendered[fmt]
+            except KeyError:
+                message = rendered[fmt] = render(fmt)
+
+            if message is None:
+                continue
+
+            if self.stream is not None:
+                try:
+                    await self.stream.add(emitter.channel.guild.id, emitter.channel.id, message)
+                    continue
+                except TypeError:
+                    pass
+                except RedisError as e:
+                    log.warning("Failed to add a modlog entry to its stream, it will not survive a restart",
+                                exc_info=e)
+
+            if emitter.closed and not emitter.gone:
+                # Reaped or replaced while rendering or storing earlier entries
+                emitter = self._get_emitter(emitter.channel, record)
+            await emitter.put(**message)
 
     # Bot events
     @LightningCog.listener()
@@ -153,37 +244,36 @@ class ModLog(LightningCog):
         if ctx.guild is None:
             return
 
-        async for emitter, record in self.get_records(ctx.guild, LoggingType.COMMAND_RAN):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = False if record['format'] == "minimal without timestamp" else True
-                fmt = modlogformats.MinimalisticFormat.command_ran(ctx, with_timestamp=arg)
-                await emitter.send(fmt)
-            elif record['format'] == "emoji":
-                fmt = modlogformats.EmojiFormat.command_ran(ctx)
-                await emitter.send(fmt, allowed_mentions=discord.AllowedMentions(users=[ctx.author]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.command_ran(ctx)
-                await emitter.send(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.command_ran(
+                    ctx, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.command_ran(ctx),
+                        'allowed_mentions': discord.AllowedMentions(users=[ctx.author])}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.command_ran(ctx)}
+
+        await self.emit(ctx.guild, LoggingType.COMMAND_RAN, render)
+
+    def _render_action(self, action: Action, fmt: str, *,
+                       message_embed: Optional[discord.Embed] = None) -> Optional[Dict[str, Any]]:
+        extra = {'embed': message_embed} if message_embed else {}
+        if fmt in MINIMAL_FORMATS:
+            text = modlogformats.MinimalisticFormat.from_action(action)
+            return {'content': text.format_message(with_timestamp=fmt == "minimal with timestamp"), **extra}
+        elif fmt == "emoji":
+            text = modlogformats.EmojiFormat.from_action(action)
+            return {'content': text.format_message(),
+                    'allowed_mentions': discord.AllowedMentions(users=[action.target, action.moderator]), **extra}
+        elif fmt == "embed":
+            embed = modlogformats.EmbedFormat.from_action(action).format_message()
+            return {'embeds': [embed, message_embed]} if message_embed else {'embed': embed}
 
     async def handle_automod_events(self, event_name: str, event: LightningAutoModInfractionEvent):
         msg_embed = generate_message_embed(event.message)
-
-        async for emitter, record in self.get_records(event.guild, LoggingType(event_name)):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                fmt = modlogformats.MinimalisticFormat.from_action(event.action)
-                arg = False if record['format'] == "minimal without timestamp" else True
-                msg = fmt.format_message(with_timestamp=arg)
-                await emitter.send(msg, embed=msg_embed)
-            elif record['format'] == "emoji":
-                fmt = modlogformats.EmojiFormat.from_action(event.action)
-                msg = fmt.format_message()
-                await emitter.send(msg, embed=msg_embed,
-                                   allowed_mentions=discord.AllowedMentions(users=[event.action.target,
-                                                                                   event.action.moderator]))
-            elif record['format'] == "embed":
-                fmt = modlogformats.EmbedFormat.from_action(event.action)
-                embed = fmt.format_message()
-                await emitter.send(embeds=[embed, msg_embed])
+        await self.emit(event.guild, LoggingType(event_name),
+                        lambda fmt: self._render_action(event.action, fmt, message_embed=msg_embed))
 
     # Moderation
     @LightningCog.listener('on_lightning_member_warn')
@@ -196,6 +286,7 @@ class ModLog(LightningCog):
     async def on_lightning_member_action(self, event: Union[AuditLogModAction, InfractionEvent]):
         if not event.action.is_logged():
             await event.action.add_infraction(self.bot.pool)
+            self.bot.api.invalidate(f"/guilds/{event.action.guild_id}")
 
         event_name = f"MEMBER_{event.action.event}" if not hasattr(event, "event_name") else f"MEMBER_{str(event)}"
 
@@ -203,56 +294,39 @@ class ModLog(LightningCog):
             await self.handle_automod_events(event_name, event)
             return
 
-        async for emitter, record in self.get_records(event.guild, LoggingType(event_name)):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                fmt = modlogformats.MinimalisticFormat.from_action(event.action)
-                arg = False if record['format'] == "minimal without timestamp" else True
-                msg = fmt.format_message(with_timestamp=arg)
-                await emitter.send(msg)
-            elif record['format'] == "emoji":
-                fmt = modlogformats.EmojiFormat.from_action(event.action)
-                msg = fmt.format_message()
-                await emitter.send(msg,
-                                   allowed_mentions=discord.AllowedMentions(users=[event.action.target,
-                                                                                   event.action.moderator]))
-            elif record['format'] == "embed":
-                fmt = modlogformats.EmbedFormat.from_action(event.action)
-                embed = fmt.format_message()
-                await emitter.send(embed=embed)
+        await self.emit(event.guild, LoggingType(event_name), lambda fmt: self._render_action(event.action, fmt))
 
     @LightningCog.listener()
     async def on_lightning_timed_moderation_action_done(self, action, guild_id, user, moderator, timer):
-        async for emitter, record in self.get_records(guild_id, LoggingType(f"MEMBER_{action.upper()}")):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = False if record['format'] == "minimal without timestamp" else True
-                message = modlogformats.MinimalisticFormat.timed_action_expired(action.lower(), user, moderator,
-                                                                                timer.created_at, timer.expiry,
-                                                                                with_timestamp=arg)
-                await emitter.send(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.timed_action_expired(action.lower(), user, moderator,
-                                                                         timer.created_at)
-                await emitter.send(message, allowed_mentions=discord.AllowedMentions(users=[user, moderator]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.timed_action_expired(action.lower(), moderator, user,
-                                                                       timer.created_at)
-                await emitter.send(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.timed_action_expired(
+                    action.lower(), user, moderator, timer.created_at, timer.expiry,
+                    with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.timed_action_expired(action.lower(), user, moderator,
+                                                                                  timer.created_at),
+                        'allowed_mentions': discord.AllowedMentions(users=[user, moderator])}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.timed_action_expired(action.lower(), moderator, user,
+                                                                                timer.created_at)}
+
+        await self.emit(guild_id, LoggingType(f"MEMBER_{action.upper()}"), render)
 
     # Member events
     async def _log_member_join_leave(self, member, event):
         await self.bot.wait_until_ready()
 
-        guild = member.guild
-        async for emitter, record in self.get_records(guild, event):
-            if record['format'] == "minimal with timestamp":
-                message = modlogformats.MinimalisticFormat.join_leave(str(event), member)
-                await emitter.put(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.join_leave(str(event), member)
-                await emitter.put(message, allowed_mentions=discord.AllowedMentions(users=[member]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.join_leave(str(event), member)
-                await emitter.put(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt == "minimal with timestamp":
+                return {'content': modlogformats.MinimalisticFormat.join_leave(str(event), member)}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.join_leave(str(event), member),
+                        'allowed_mentions': discord.AllowedMentions(users=[member])}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.join_leave(str(event), member)}
+
+        await self.emit(member.guild, event, render)
 
     @LightningCog.listener()
     async def on_member_join(self, member):
@@ -264,31 +338,29 @@ class ModLog(LightningCog):
 
     @LightningCog.listener()
     async def on_lightning_member_passed_screening(self, member):
-        async for emitter, record in self.get_records(member.guild, LoggingType.MEMBER_SCREENING_COMPLETE):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = False if record['format'] == "minimal without timestamp" else True
-                message = modlogformats.MinimalisticFormat.completed_screening(member, with_timestamp=arg)
-                await emitter.put(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.completed_screening(member)
-                await emitter.put(message, allowed_mentions=discord.AllowedMentions(users=[member]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.completed_screening(member)
-                await emitter.put(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.completed_screening(
+                    member, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.completed_screening(member),
+                        'allowed_mentions': discord.AllowedMentions(users=[member])}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.completed_screening(member)}
+
+        await self.emit(member.guild, LoggingType.MEMBER_SCREENING_COMPLETE, render)
 
     async def _log_role_changes(self, ltype: LoggingType, event: MemberRolesUpdateEvent) -> None:
-        async for emitter, record in self.get_records(event.guild.id, ltype):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = False if record['format'] == "minimal without timestamp" else True
-                message = modlogformats.MinimalisticFormat.role_change(event,
-                                                                       with_timestamp=arg)
-                await emitter.send(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.role_change(event)
-                await emitter.put(message)
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.role_change(event)
-                await emitter.put(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.role_change(
+                    event, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.role_change(event)}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.role_change(event)}
+
+        await self.emit(event.guild.id, ltype, render)
 
     @LightningCog.listener()
     async def on_lightning_member_role_change(self, event: MemberRolesUpdateEvent):
@@ -300,82 +372,78 @@ class ModLog(LightningCog):
 
     @LightningCog.listener()
     async def on_lightning_member_nick_change(self, event: MemberUpdateEvent):
-        guild = event.guild
-        async for emitter, record in self.get_records(guild, LoggingType.MEMBER_NICK_CHANGE):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = False if record['format'] == "minimal without timestamp" else True
-                message = modlogformats.MinimalisticFormat.nick_change(event.after, event.before.nick, event.after.nick,
-                                                                       event.moderator, with_timestamp=arg)
-                await emitter.put(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.nick_change(event.after, event.before.nick, event.after.nick,
-                                                                event.moderator)
-                await emitter.put(message, allowed_mentions=discord.AllowedMentions(users=[event.after]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.nick_change(event.after, event.before.nick, event.after.nick,
-                                                              event.moderator)
-                await emitter.put(embed=embed)
+        before, after = event.before.nick, event.after.nick
+
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.nick_change(
+                    event.after, before, after, event.moderator, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.nick_change(event.after, before, after, event.moderator),
+                        'allowed_mentions': discord.AllowedMentions(users=[event.after])}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.nick_change(event.after, before, after, event.moderator)}
+
+        await self.emit(event.guild, LoggingType.MEMBER_NICK_CHANGE, render)
 
     @LightningCog.listener()
     async def on_lightning_infraction_update(self, event: InfractionUpdateEvent):
-        async for emitter, record in self.get_records(event.after.guild, LoggingType.INFRACTION_UPDATE):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = record['format'] != "minimal without timestamp"
-                message = modlogformats.MinimalisticFormat.infraction_update(event, with_timestamp=arg)
-                await emitter.put(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.infraction_update(event)
-                await emitter.put(message)
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.infraction_update(event)
-                await emitter.put(embed=embed)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.infraction_update(
+                    event, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.infraction_update(event)}
+            elif fmt == "embed":
+                return {'embed': modlogformats.EmbedFormat.infraction_update(event)}
+
+        await self.emit(event.after.guild, LoggingType.INFRACTION_UPDATE, render)
 
     @LightningCog.listener()
     async def on_lightning_infraction_delete(self, event: InfractionDeleteEvent):
         details = event.format_infraction()
-        async for emitter, record in self.get_records(event.moderator.guild, LoggingType.INFRACTION_DELETE):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = record['format'] != "minimal without timestamp"
-                message = modlogformats.MinimalisticFormat.infraction_delete(event, with_timestamp=arg)
-                await emitter.put(message, embed=details)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.infraction_delete(event)
-                await emitter.put(message, embed=details,
-                                  allowed_mentions=discord.AllowedMentions(users=[event.moderator]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.infraction_delete(event)
-                await emitter.put(embeds=[embed, details])
+
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.infraction_delete(
+                    event, with_timestamp=fmt == "minimal with timestamp"), 'embed': details}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.infraction_delete(event), 'embed': details,
+                        'allowed_mentions': discord.AllowedMentions(users=[event.moderator])}
+            elif fmt == "embed":
+                return {'embeds': [modlogformats.EmbedFormat.infraction_delete(event), details]}
+
+        await self.emit(event.moderator.guild, LoggingType.INFRACTION_DELETE, render)
 
     @LightningCog.listener()
     async def on_lightning_member_timeout_remove(self, event: AuditLogTimeoutEvent | MemberUpdateEvent):
         query = "UPDATE infractions SET active='f' WHERE action='10' AND guild_id=$1 AND user_id=$2;"
         await self.bot.pool.execute(query, event.guild.id, event.member.id)
+        self.bot.api.invalidate(f"/guilds/{event.guild.id}")
 
-        async for emitter, record in self.get_records(event.guild, LoggingType.MEMBER_TIMEOUT_REMOVE):
-            if record['format'] in ("minimal with timestamp", "minimal without timestamp"):
-                arg = record['format'] != "minimal without timestamp"
-                message = modlogformats.MinimalisticFormat.timeout_expired(event,
-                                                                           with_timestamp=arg)
-                await emitter.put(message)
-            elif record['format'] == "emoji":
-                message = modlogformats.EmojiFormat.timeout_expired(event)
-                await emitter.put(message,
-                                  allowed_mentions=discord.AllowedMentions(users=[event.member]))
-            elif record['format'] == "embed":
-                embed = modlogformats.EmbedFormat.timeout_expired(event)
-                await emitter.put(embeds=[embed])
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt in MINIMAL_FORMATS:
+                return {'content': modlogformats.MinimalisticFormat.timeout_expired(
+                    event, with_timestamp=fmt == "minimal with timestamp")}
+            elif fmt == "emoji":
+                return {'content': modlogformats.EmojiFormat.timeout_expired(event),
+                        'allowed_mentions': discord.AllowedMentions(users=[event.member])}
+            elif fmt == "embed":
+                return {'embeds': [modlogformats.EmbedFormat.timeout_expired(event)]}
+
+        await self.emit(event.guild, LoggingType.MEMBER_TIMEOUT_REMOVE, render)
 
     @LightningCog.listener()
     async def on_lightning_guild_alert(self, guild_id: int, message: str):
-        async for emitter, record in self.get_records(guild_id, LoggingType.BOT_INFO):
-            if record['format'] == "embed":
-                embed = discord.Embed(color=discord.Color.yellow(), description=message)
-                await emitter.put(embeds=[embed])
-            else:
-                await emitter.put(message)
+        def render(fmt: str) -> Optional[Dict[str, Any]]:
+            if fmt == "embed":
+                return {'embeds': [discord.Embed(color=discord.Color.yellow(), description=message)]}
+            return {'content': message}
+
+        await self.emit(guild_id, LoggingType.BOT_INFO, render)
 
     def _close_emitter(self, channel_id: int) -> None:
-        emitter = self._emitters.pop(channel_id, None)
+        emitter = self.emitters.get(channel_id)
         if emitter:
             emitter.close()
 
@@ -0,0 +1,320 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-present LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import (TYPE_CHECKING, Any, Awaitable, Callable, Dict, List,
+                    Optional, Tuple)
+
+import discord
+import orjson
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from lightning.utils.emitters import BatchingEmitter
+
+if TYPE_CHECKING:
+    from lightning import LightningBot
+
+__all__ = ("ModLogStream", "dump_entry", "load_entry")
+log = logging.getLogger(__name__)
+
+MODLOG_STREAM_COUNTER = Counter("lightning_modlog_stream_entries", "Modlog entries handled through Redis Streams",
+                                ['result'])
+
+# Guild IDs whose streams have entries that weren't delivered yet
+ACTIVE_KEY = "lightning:modlog:active"
+STREAM_KEY = "lightning:modlog:stream:{}"
+
+# KEYS: stream, active set. ARGV: group, max length, channel ID, entry, guild ID
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('XGROUP', 'CREATE', KEYS[1], ARGV[1], '0', 'MKSTREAM')
+end
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'channel', ARGV[3], 'entry', ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[5])
+return id
+"""
+# Entries are deleted once they're acknowledged, so an empty stream has nothing left to deliver.
+# KEYS: stream, active set. ARGV: guild ID
+REAP_SCRIPT = """
+if redis.call('XLEN', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def _dump_mentions(mentions: discord.AllowedMentions) -> Dict[str, Any]:
+    # Attributes left at their default are stored as None, so they still defer to the bot's allowed mentions
+    def dump(value):
+        if type(value) is bool:
+            return value
+        if isinstance(value, (list, tuple)):
+            return [obj.id for obj in value]
+        return None
+
+    return {"everyone": dump(mentions.everyone), "users": dump(mentions.users), "roles": dump(mentions.roles),
+            "replied_user": dump(mentions.replied_user)}
+
+
+def _load_mentions(data: Dict[str, Any]) -> discord.AllowedMentions:
+    kwargs = {}
+    for key, value in data.items():
+        if value is not None:
+            kwargs[key] = value if isinstance(value, bool) else [discord.Object(snowflake) for snowflake in value]
+
+    return discord.AllowedMentions(**kwargs)
+
+
+def dump_entry(entry: Dict[str, Any]) -> str:
+    """Serializes a log entry so it can be stored in a stream.
+
+    Raises
+    ------
+    TypeError
+        The entry has something other than content, embeds and allowed mentions.
+    """
+    data: Dict[str, Any] = {}
+    for key, value in entry.items():
+        if key == "content":
+            data[key] = value
+        elif key == "embed":
+            data[key] = value.to_dict() if value is not None else None
+        elif key == "embeds":
+            data[key] = [embed.to_dict() for embed in value]
+        elif key == "allowed_mentions":
+            data[key] = _dump_mentions(value) if value is not None else None
+        else:
+            raise TypeError(f"Log entries with {key!r} can't be stored in a stream")
+
+    return orjson.dumps(data).decode()
+
+
+def load_entry(data: str) -> Dict[str, Any]:
+    """Deserializes a log entry made with :func:`dump_entry`"""
+    entry: Dict[str, Any] = orjson.loads(data)
+    if entry.get('embed'):
+        entry['embed'] = discord.Embed.from_dict(entry['embed'])
+    if 'embeds' in entry:
+        entry['embeds'] = [discord.Embed.from_dict(embed) for embed in entry['embeds']]
+    if entry.get('allowed_mentions'):
+        entry['allowed_mentions'] = _load_mentions(entry['allowed_mentions'])
+    return entry
+
+
+class ModLogStream:
+    """A durable queue for modlog entries, kept in a Redis Stream per guild.
+
+    Entries are appended with :meth:`add` and delivered by a worker task through the emitter of the channel they're
+    for. Entries are only acknowledged and deleted after they're delivered, so entries that are pending when the bot
+    stops are delivered after it starts again. Entries that failed to deliver because of a timeout, a connection
+    error or a server error are left pending and retried once they're claimed again. Entries for channels that are
+    gone, or that Discord refused, are acknowledged.
+
+    Every process reads through the same consumer group, so processes share the guilds they run. Entries that a
+    consumer read but never acknowledged, like ones from a process that died, are claimed by another process once
+    they've been idle for ``claim_idle`` seconds.
+
+    Parameters
+    ----------
+    bot : LightningBot
+        The bot to deliver entries with.
+    resolve : Callable[[int, int], Awaitable[Optional[BatchingEmitter]]]
+        Gets the emitter for a guild ID and channel ID, or None if the channel no longer logs.
+    group : str
+        The name of the consumer group.
+    batch_size : int
+        The most entries to read from a stream at once.
+    poll_interval : float
+        How often, in seconds, to check for entries added by other processes.
+    claim_idle : float
+        How long, in seconds, an entry can be pending before another consumer claims it.
+    max_length : int
+        Roughly how many entries a guild's stream can hold. The oldest entries are trimmed past this.
+    """
+    def __init__(self, bot: LightningBot, resolve: Callable[[int, int], Awaitable[Optional[BatchingEmitter]]], *,
+                 group: str = "modlog", batch_size: int = 100, poll_interval: float = 1.0, claim_idle: float = 30.0,
+                 max_length: int = 10_000) -> None:
+        self.bot = bot
+        self.resolve = resolve
+        self.group = group
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.claim_idle = claim_idle
+        self.max_length = max_length
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._add = bot.redis_pool.register_script(ADD_SCRIPT)
+        self._reap = bot.redis_pool.register_script(REAP_SCRIPT)
+        self._wakeup = asyncio.Event()
+        self._next_claim = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run(), name="lightning-modlog-stream")
+
+    def close(self) -> None:
+        """Stops delivering entries. Entries that weren't acknowledged yet are claimed again later."""
+        if self._task:
+            self._task.cancel()
+
+    async def add(self, guild_id: int, channel_id: int, entry: Dict[str, Any]) -> None:
+        """Appends a log entry to the guild's stream.
+
+        Raises
+        ------
+        TypeError
+            The entry can't be serialized.
+        RedisError
+            The entry couldn't be stored.
+        """
+        await self._add(keys=[STREAM_KEY.format(guild_id), ACTIVE_KEY],
+                        args=[self.group, self.max_length, channel_id, dump_entry(entry), guild_id])
+        MODLOG_STREAM_COUNTER.labels("added").inc()
+        self._wakeup.set()
+
+    async def active_streams(self) -> List[str]:
+        """Returns the streams with undelivered entries for guilds this process runs"""
+        guild_ids = await self.bot.redis_pool.smembers(ACTIVE_KEY)
+        return [STREAM_KEY.format(guild_id) for guild_id in guild_ids if self.bot.get_guild(int(guild_id))]
+
+    async def read(self, keys: List[str]) -> List[Tuple[str, str, Optional[Dict[str, str]]]]:
+        """Reads new entries from streams"""
+        entries = []
+        for index in range(0, len(keys), 256):
+            streams = {key: ">" for key in keys[index:index + 256]}
+            response = await self.bot.redis_pool.xreadgroup(self.group, self.consumer, streams,
+                                                            count=self.batch_size)
+            for key, messages in response or ():
+                entries.extend((key, message_id, fields) for message_id, fields in messages)
+        return entries
+
+    async def claim(self, keys: List[str]) -> List[Tuple[str, str, Optional[Dict[str, str]]]]:
+        """Takes over entries that other consumers read, but never acknowledged"""
+        async with self.bot.redis_pool.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.xautoclaim(key, self.group, self.consumer, int(self.claim_idle * 1000), count=self.batch_size)
+            responses = await pipe.execute(raise_on_error=False)
+
+        entries = []
+        for key, response in zip(keys, responses):
+            if isinstance(response, Exception):
+                # The stream was reaped since it was listed
+                continue
+            entries.extend((key, message_id, fields) for message_id, fields in response[1])
+
+        if entries:
+            MODLOG_STREAM_COUNTER.labels("claimed").inc(len(entries))
+        return entries
+
+    async def _deliver_channel(self, guild_id: int, channel_id: int, entries: List[str]) -> int:
+        emitter = await self.resolve(guild_id, channel_id)
+        if emitter is None:
+            MODLOG_STREAM_COUNTER.labels("discarded").inc(len(entries))
+            return len(entries)
+
+        delay = emitter.ratelimit_delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        # Goes through the emitter's lock, so it never posts in the channel at the same time as the emitter's scheduler
+        return await emitter.deliver_batch([load_entry(entry) for entry in entries])
+
+    async def _deliver_stream(self, key: str, entries: List[Tuple[str, Optional[Dict[str, str]]]]) -> None:
+        guild_id = int(key.rsplit(":", 1)[1])
+        ids = []
+        channels: Dict[int, List[Tuple[str, str]]] = {}
+        for message_id, fields in entries:
+            # Entries that were trimmed while pending have no fields
+            if fields:
+                channels.setdefault(int(fields['channel']), []).append((message_id, fields['entry']))
+            else:
+                ids.append(message_id)
+
+        results = await asyncio.gather(*(self._deliver_channel(guild_id, channel_id, [e for _, e in channel_entries])
+                                         for channel_id, channel_entries in channels.items()), return_exceptions=True)
+        for channel_entries, result in zip(channels.values(), results):
+            # Entries that raised are acknowledged anyway, so a broken entry isn't retried forever
+            if isinstance(result, Exception):
+                log.exception(f"Failed to deliver modlog entries for guild {guild_id}", exc_info=result)
+                result = len(channel_entries)
+
+            # Entries that weren't delivered are left pending, so they're retried once they're claimed again
+            if failed := len(channel_entries) - result:
+                MODLOG_STREAM_COUNTER.labels("failed").inc(failed)
+            ids.extend(message_id for message_id, _ in channel_entries[:result])
+
+        if not ids:
+            return
+
+        async with self.bot.redis_pool.pipeline(transaction=False) as pipe:
+            pipe.xack(key, self.group, *ids)
+            pipe.xdel(key, *ids)
+            await pipe.execute()
+        await self._reap(keys=[key, ACTIVE_KEY], args=[guild_id])
+        MODLOG_STREAM_COUNTER.labels("delivered").inc(len(ids))
+
+    async def deliver(self, entries: List[Tuple[str, str, Optional[Dict[str, str]]]]) -> None:
+        """Delivers entries read from streams and acknowledges them"""
+        streams: Dict[str, List[Tuple[str, Optional[Dict[str, str]]]]] = {}
+        for key, message_id, fields in entries:
+            streams.setdefault(key, []).append((message_id, fields))
+
+        await asyncio.gather(*(self._deliver_stream(key, stream_entries) for key, stream_entries in streams.items()))
+
+    async def _run_once(self) -> None:
+        # Cleared before reading so an entry added from here on wakes us up
+        self._wakeup.clear()
+        keys = await self.active_streams()
+
+        entries = []
+        if keys:
+            if time.monotonic() >= self._next_claim:
+                entries.extend(await self.claim(keys))
+                self._next_claim = time.monotonic() + self.claim_idle / 2
+            entries.extend(await self.read(keys))
+
+        if entries:
+            await self.deliver(entries)
+            return
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            try:
+                await self._run_once()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, RedisError) as e:
+                log.warning("Failed to read modlog streams, retrying in 5 seconds", exc_info=e)
+                await asyncio.sleep(5)
+            except Exception as e:
+                log.exception("An exception occurred while delivering modlog entries", exc_info=e)
+                await asyncio.sleep(5)
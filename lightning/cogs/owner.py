@@ -16,9 +16,10 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
+import io
 import time
 import traceback
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict
 
 import asyncpg
 import discord
@@ -30,7 +31,9 @@ from jishaku.cog import OPTIONAL_FEATURES, STANDARD_FEATURES
 from jishaku.features.baseclass import Feature
 
 from lightning import LightningBot, formatters
+from lightning.metrics import TimingStat
 from lightning.utils import time as ltime
+from lightning.utils.database import query_stats, statements
 
 if TYPE_CHECKING:
     from lightning import LightningContext
@@ -106,6 +109,7 @@ class Owner(*OPTIONAL_FEATURES, *STANDARD_FEATURES):
         Server must have already existed in the database before."""
         query = "UPDATE guilds SET whitelisted='t' WHERE id=$1;"
         await self.bot.pool.execute(query, guild_id)
+        self.bot.api.invalidate(f"/guilds/{guild_id}")
         await ctx.tick(True)
 
     @Feature.Command()
@@ -113,6 +117,7 @@ class Owner(*OPTIONAL_FEATURES, *STANDARD_FEATURES):
         """Unapproves a server"""
         query = "UPDATE guilds SET whitelisted='f' WHERE id=$1"
         await self.bot.pool.execute(query, guild_id)
+        self.bot.api.invalidate(f"/guilds/{guild_id}")
 
         if guild := self.bot.get_guild(guild_id):
             await guild.leave()
@@ -210,6 +215,171 @@ class Owner(*OPTIONAL_FEATURES, *STANDARD_FEATURES):
         embed.set_footer(text=f"{total} bugs")
         await ctx.send(embed=embed)
 
+    @Feature.Command(invoke_without_command=True)
+    async def perf(self, ctx: LightningContext) -> None:
+        """Shows where the bot is spending its time"""
+        await ctx.send_help("perf")
+
+    @Feature.Command(parent="perf", name="listeners")
+    async def perf_listeners(self, ctx: LightningContext, minutes: int = 10, limit: int = 10) -> None:
+        """Shows the event listeners that took the most time in the last few minutes"""
+        minutes = max(1, min(minutes, self.bot.listener_timings.minutes))
+        stats = self.bot.listener_timings.slowest(minutes, limit=max(1, min(limit, 20)))
+        if not stats:
+            await ctx.send(f"No listeners have ran in the last {formatters.plural(minutes):minute}.")
+            return
+
+        rows = [(f"{cog}.{listener}", event, stat.count, f"{stat.total:.2f}", f"{stat.mean * 1000:.1f}",
+                 f"{stat.max * 1000:.1f}", stat.failures) for (cog, listener, event), stat in stats]
+        table = tabulate.tabulate(rows, headers=("Listener", "Event", "Calls", "Total (s)", "Mean (ms)", "Max (ms)",
+                                                 "Errors"), tablefmt="psql")
+        await ctx.send(f"Slowest listeners in the last {formatters.plural(minutes):minute}\n"
+                       f"{formatters.codeblock(table, language='')}")
+
+    @Feature.Command(parent="perf", name="stages")
+    async def perf_stages(self, ctx: LightningContext, command: str = None, minutes: int = 10) -> None:
+        """Shows where commands spent their time in the last few minutes, stage by stage"""
+        window = self.bot.tracer.stage_timings
+        minutes = max(1, min(minutes, window.minutes))
+
+        stats: Dict[str, TimingStat] = {}
+        for (name, stage), stat in window.summary(minutes).items():
+            if command is None or name == command:
+                stats.setdefault(stage, TimingStat()).merge(stat)
+
+        if not stats:
+            await ctx.send(f"No commands were traced in the last {formatters.plural(minutes):minute}.")
+            return
+
+        rows = [(stage, stat.count, f"{stat.total:.2f}", f"{stat.mean * 1000:.1f}",
+                 f"{stat.max * 1000:.1f}", stat.failures)
+                for stage, stat in sorted(stats.items(), key=lambda item: item[1].total, reverse=True)]
+        table = tabulate.tabulate(rows, headers=("Stage", "Count", "Total (s)", "Mean (ms)", "Max (ms)", "Errors"),
+                                  tablefmt="psql")
+        await ctx.send(f"Command stages for {command or 'all commands'} in the last "
+                       f"{formatters.plural(minutes):minute}\n{formatters.codeblock(table, language='')}")
+
+    @Feature.Command(parent="perf", name="traces")
+    async def perf_traces(self, ctx: LightningContext, command: str = None, limit: int = 5) -> None:
+        """Dumps the most recent sampled or slow command traces"""
+        traces = self.bot.tracer.find(command, limit=max(1, min(limit, 20)))
+        if not traces:
+            await ctx.send("No traces have been kept yet.")
+            return
+
+        dump = "\n\n".join(trace.render() for trace in traces)
+        await ctx.send(f"{formatters.plural(len(traces)):trace}",
+                       file=discord.File(io.BytesIO(dump.encode()), filename="traces.txt"))
+
+    @Feature.Command(parent="perf", name="queries")
+    async def perf_queries(self, ctx: LightningContext, limit: int = 10, by: str = "total") -> None:
+        """Shows the queries that took the most time since startup.
+
+        Queries can be sorted by total, mean, max, count, rows or failures."""
+        if by not in ("total", "mean", "max", "count", "rows", "failures"):
+            await ctx.send("Queries can only be sorted by total, mean, max, count, rows or failures.")
+            return
+
+        pool = self.bot.pool
+        content = f"Pool: {pool.get_size()} connections, {pool.get_size() - pool.get_idle_size()} in use"
+
+        stats = query_stats.slowest(limit=max(1, min(limit, 20)), by=by)
+        if not stats:
+            await ctx.send(f"{content}\nNo queries have been recorded yet.")
+            return
+
+        rows = [(query_id, stat.count, f"{stat.total:.2f}", f"{stat.mean * 1000:.1f}", f"{stat.max * 1000:.1f}",
+                 f"{stat.rows_per_call:.1f}", stat.failures) for query_id, stat in stats]
+        table = tabulate.tabulate(rows, headers=("Query", "Calls", "Total (s)", "Mean (ms)", "Max (ms)", "Rows/call",
+                                                 "Errors"), tablefmt="psql")
+        queries = "\n\n".join(f"{query_id}: {query_stats.texts[query_id]}" for query_id, _ in stats)
+        await ctx.send(f"{content}\n{formatters.codeblock(table, language='')}",
+                       file=discord.File(io.BytesIO(queries.encode()), filename="queries.sql"))
+
+    @Feature.Command(parent="perf", name="statements")
+    async def perf_statements(self, ctx: LightningContext) -> None:
+        """Shows statement cache statistics for the registered statements"""
+        rows = []
+        for statement in statements:
+            stat = statements.stats[statement.name]
+            rows.append((statement.name, stat.hits, stat.count, stat.reprepares, f"{stat.hit_rate * 100:.1f}%",
+                         f"{stat.mean * 1000:.2f}", f"{stat.max * 1000:.2f}"))
+
+        table = tabulate.tabulate(rows, headers=("Statement", "Hits", "Prepares", "Re-prepares", "Hit rate",
+                                                 "Prepare (ms)", "Max (ms)"), tablefmt="psql")
+        await ctx.send(formatters.codeblock(table, language=''))
+
+    @Feature.Command(parent="perf", name="plan")
+    async def perf_plan(self, ctx: LightningContext, name: str) -> None:
+        """Shows the generic plan and planning time of a registered statement"""
+        statement = statements.get(name)
+        if statement is None:
+            await ctx.send(f"No statement is registered as {name!r}. Registered statements: "
+                           f"{', '.join(s.name for s in statements)}")
+            return
+
+        # Explaining a prepared statement with a forced generic plan shows the plan the statement cache reuses
+        try:
+            async with self.bot.pool.acquire() as connection, connection.transaction():
+                # Prepared as plain text, so this isn't counted in the statement cache stats it's used to diagnose
+                parameters = (await connection.prepare(str(statement))).get_parameters()
+                await connection.execute("SET LOCAL plan_cache_mode = force_generic_plan;")
+                await connection.execute(f"PREPARE lightning_plan AS {statement.rstrip(';')};")
+                try:
+                    arguments = f"({', '.join(['NULL'] * len(parameters))})" if parameters else ""
+                    records = await connection.fetch(f"EXPLAIN (SUMMARY) EXECUTE lightning_plan{arguments};")
+                finally:
+                    await connection.execute("DEALLOCATE lightning_plan;")
+        except asyncpg.PostgresError as e:
+            await ctx.send(f"Unable to explain {name}: {e}")
+            return
+
+        plan = "\n".join(record[0] for record in records)
+        await ctx.send(f"{formatters.codeblock(statement.normalized, language='sql')}\n"
+                       f"{formatters.codeblock(plan, language='')}")
+
+    @Feature.Command(parent="perf", name="api")
+    async def perf_api(self, ctx: LightningContext, limit: int = 10) -> None:
+        """Shows Sanctum API request timings and cache statistics by endpoint"""
+        api = self.bot.api
+        content = f"Circuit breaker: {api.breaker.state} ({api.breaker.failures} consecutive failures)"
+
+        stats = sorted(api.stats.items(), key=lambda item: item[1].total, reverse=True)[:max(1, min(limit, 15))]
+        if not stats:
+            await ctx.send(f"{content}\nNo requests have been made yet.")
+            return
+
+        rows = [(endpoint, stat.count, f"{stat.mean * 1000:.1f}", f"{stat.max * 1000:.1f}", stat.failures, stat.hits,
+                 stat.coalesced, stat.stale) for endpoint, stat in stats]
+        table = tabulate.tabulate(rows, headers=("Endpoint", "Requests", "Mean (ms)", "Max (ms)", "Errors", "Hits",
+                                                 "Coalesced", "Stale"), tablefmt="psql")
+        await ctx.send(f"{content}\n{formatters.codeblock(table, language='')}")
+
+    @Feature.Command(parent="perf", name="lag")
+    async def perf_lag(self, ctx: LightningContext, limit: int = 10) -> None:
+        """Shows event loop lag and the most recent times the loop was blocked"""
+        monitor = self.bot.loop_monitor
+        p50, p99, worst = monitor.percentiles(50, 99, 100)
+        content = f"Loop lag (last {len(monitor.lags)} ticks): p50 {p50 * 1000:.1f}ms, p99 {p99 * 1000:.1f}ms, "\
+                  f"max {worst * 1000:.1f}ms"
+
+        slow = list(monitor.slow_callbacks)[-max(1, min(limit, 20)):]
+        if not slow:
+            await ctx.send(f"{content}\nThe event loop hasn't been blocked recently.")
+            return
+
+        rows = [(s.started_at.strftime("%H:%M:%S"), s.name, f"{s.duration * 1000:.0f}", "yes" if s.stack else "no")
+                for s in reversed(slow)]
+        table = tabulate.tabulate(rows, headers=("Time (UTC)", "Task", "Blocked (ms)", "Stack"), tablefmt="psql")
+        content = f"{content}\n{formatters.codeblock(table, language='')}"
+
+        stacks = "\n\n".join(f"{s.started_at.isoformat()} {s.name} ({s.duration:.3f}s)\n{s.stack}"
+                             for s in reversed(slow) if s.stack)
+        if stacks:
+            await ctx.send(content, file=discord.File(io.BytesIO(stacks.encode()), filename="stacks.txt"))
+        else:
+            await ctx.send(content)
+
     @Feature.Command(parent="jsk", name="objgraph")
     async def jsk_objgraph(self, ctx: LightningContext) -> None:
         """Tells you what objects are currently in memory"""
@@ -17,7 +17,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 from __future__ import annotations
 
 import time
-from typing import Dict
+import weakref
 
 from discord.ext import tasks
 from prometheus_async import aio
@@ -103,7 +103,8 @@ COMMAND_TIMING_HIST = Histogram("lightning_command_timing", "Time it takes to co
 class Prometheus(LightningCog):
     def __init__(self, bot: LightningBot):
         super().__init__(bot)
-        self._current_contexts: Dict[LightningContext, float] = {}
+        # Invocations that neither complete nor error (e.g. a cancelled invoke) are dropped with their context
+        self._current_contexts: weakref.WeakKeyDictionary[LightningContext, float] = weakref.WeakKeyDictionary()
 
     async def cog_load(self):
         for label in EVENT_LABELS:
@@ -146,7 +147,7 @@ class Prometheus(LightningCog):
 
     @LightningCog.listener()
     async def on_command(self, ctx: LightningContext):
-        self._current_contexts[ctx] = time.time()
+        self._current_contexts[ctx] = time.perf_counter()
 
     @LightningCog.listener()
     async def on_command_completion(self, ctx: LightningContext):
@@ -156,7 +157,7 @@ class Prometheus(LightningCog):
             # Somehow doesn't exist
             return
 
-        COMMAND_TIMING_HIST.labels(command=ctx.command).observe(time.time() - cur)
+        COMMAND_TIMING_HIST.labels(command=ctx.command.qualified_name).observe(time.perf_counter() - cur)
 
     @LightningCog.listener()
     async def on_command_error(self, ctx: LightningContext, error):
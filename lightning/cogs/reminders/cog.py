@@ -16,17 +16,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
-import asyncio
 import logging
-import traceback
 from datetime import datetime, timedelta
-from typing import (TYPE_CHECKING, Annotated, Any, Dict, Literal, Optional,
-                    Union, overload)
+from typing import (TYPE_CHECKING, Annotated, Any, Dict, Literal, Union,
+                    overload)
 from zoneinfo import ZoneInfo, available_timezones
 
-import asyncpg
 import discord
-import rapidfuzz
 from discord import app_commands
 from discord.ext.commands import clean_content, parameter
 from sanctum.exceptions import NotFound
@@ -34,11 +30,13 @@ from sanctum.exceptions import NotFound
 from lightning import LightningCog, LightningContext, hybrid_group
 from lightning.cogs.reminders.converters import (TimeParseTransformer,
                                                  TimeZoneConverter)
+from lightning.cogs.reminders.scheduler import TimerScheduler
 from lightning.cogs.reminders.ui import ReminderEdit, ReminderPaginator
 from lightning.formatters import plural
 from lightning.models import Timer
 from lightning.utils import time as ltime
 from lightning.utils.helpers import UserObject, dm_user
+from lightning.utils.timezones import TimezoneIndex
 
 if TYPE_CHECKING:
     from lightning import LightningBot
@@ -52,48 +50,14 @@ class Reminders(LightningCog):
     def __init__(self, bot: LightningBot) -> None:
         super().__init__(bot)
 
-        self.task_available = asyncio.Event()
-        self._current_task: Optional[Timer] = None
-        self._task = self.bot.loop.create_task(self.handle_timers())
+        self.scheduler = TimerScheduler(bot)
+        self.scheduler.start()
 
         # Timezones
-        self.available_timezones = available_timezones()
+        self.timezone_index = TimezoneIndex(available_timezones())
 
-    def cog_unload(self) -> None:
-        self._task.cancel()
-
-    async def get_next_timer(self) -> Optional[Timer]:
-        query = """SELECT * FROM timers
-                   WHERE (expiry AT TIME ZONE 'UTC' AT TIME ZONE timezone) < (NOW() + $1::interval)
-                   ORDER BY "expiry" LIMIT 1;"""
-        record = await self.bot.pool.fetchrow(query, timedelta(days=24))
-        return Timer.from_record(record) if record else None
-
-    async def short_timers(self, seconds: float, record: Timer) -> None:
-        """A short loop for the bot to process small timers."""
-        await asyncio.sleep(seconds)
-        self.bot.dispatch(f'lightning_{record.event}_complete', record)
-
-    async def execute_timer(self, record: Timer) -> None:
-        self.bot.dispatch(f'lightning_{record.event}_complete', record)
-        await self.bot.api.delete_timer(record.id)
-
-    async def wait_for_timers(self) -> Timer:
-        record = await self.get_next_timer()
-
-        if not record:
-            self.task_available.clear()
-            self._current_task = None
-            await self.task_available.wait()
-            return await self.get_next_timer()
-
-        self.task_available.set()
-        return record
-
-    def restart_timer_task(self):
-        """Cancels the timer task and recreates the task again"""
-        self._task.cancel()
-        self._task = self.bot.loop.create_task(self.handle_timers())
+    async def cog_unload(self) -> None:
+        await self.scheduler.close()
 
     @overload
     async def add_timer(self, event: str, created: datetime, expiry: datetime, *, force_insert: Literal[True],
@@ -102,11 +66,11 @@ class Reminders(LightningCog):
 
     @overload
     async def add_timer(self, event: str, created: datetime, expiry: datetime, *, force_insert: Literal[False] = False,
-                        timezone: ZoneInfo, **kwarg: Any) -> Union[dict[str, Any], asyncio.Task]:
+                        timezone: ZoneInfo, **kwarg: Any) -> Union[dict[str, Any], Timer]:
         ...
 
     async def add_timer(self, event: str, created: datetime, expiry: datetime, *, force_insert: bool = False,
-                        timezone: ZoneInfo, **kwargs) -> Union[dict[str, Any], asyncio.Task]:
+                        timezone: ZoneInfo, **kwargs) -> Union[dict[str, Any], Timer]:
         """Adds a pending timer to the timer system
 
         Parameters
@@ -118,7 +82,8 @@ class Reminders(LightningCog):
         expiry : datetime.datetime
             When the job should be done.
         force_insert : bool, optional
-            Whether to insert into the database regardless of how long the expiry is. Defaults to False
+            Whether to insert into the database regardless of how long the expiry is. Timers of 60 seconds or less
+            are otherwise stored in Redis and don't get an ID. Defaults to False
         **kwargs
             Keyword arguments about the event that are passed to the database
         """
@@ -127,52 +92,25 @@ class Reminders(LightningCog):
 
         delta = (expiry - created).total_seconds()
         if delta <= 60 and not force_insert:
-            return self.bot.loop.create_task(self.short_timers(delta, Timer(None, event, created, expiry, timezone.key,
-                                                                            kwargs)),
-                                             name=f"lightning-{event}-timer")
+            # Short timers don't get an ID, so they're kept out of the database
+            timer = Timer(None, event, created, expiry, timezone.key, kwargs)
+            await self.scheduler.add_short_timer(timer)
+            return timer
 
         payload = {"event": event, "created": created.isoformat(), "expiry": expiry.isoformat(),
                    "timezone": timezone.key, "extra": dict(kwargs)}
         record = await self.bot.api.create_timer(payload)
-
-        if delta <= (86400 * 24):  # 24 days
-            self.task_available.set()
-
-        if self._current_task and expiry < self._current_task.expiry:
-            # Cancel the task and re-run it
-            self.restart_timer_task()
+        await self.scheduler.schedule(Timer(record['id'], event, created, expiry, timezone.key, record['extra']))
 
         return record
 
-    async def handle_timers(self) -> None:
-        await self.bot.wait_until_ready()
-        try:
-            while not self.bot.is_closed():
-                timer = self._current_task = await self.wait_for_timers()
-                current_time = datetime.utcnow()
-                if timer.expiry >= current_time:
-                    tmp = (timer.expiry - current_time).total_seconds()
-                    await asyncio.sleep(tmp)
-                # Dispatch the job and delete it.
-                await self.execute_timer(timer)
-        except asyncio.CancelledError:
-            raise
-        except (discord.ConnectionClosed, asyncpg.PostgresConnectionError):
-            self.restart_timer_task()
-        except Exception as e:
-            exc = "".join(traceback.format_exception(type(e), e, e.__traceback__, chain=False))
-            log.error(exc)
-            embed = discord.Embed(title="Timer Error", description=f"```{exc}```")
-            await self.bot._error_logger.put(embed)
-
     async def get_user_tzinfo(self, user_id: int) -> ZoneInfo:
         """
         Gets a user's timezone.
 
         If one is not found, defaults to UTC
         """
-        timezone = await self.bot.get_user_timezone(user_id)
-        return ZoneInfo(timezone) if timezone else ZoneInfo("UTC")
+        return await self.bot.get_user_timezone(user_id) or ZoneInfo("UTC")
 
     @hybrid_group(usage="<when>", aliases=["reminder"], invoke_without_command=True)
     @app_commands.allowed_installs(guilds=True, users=True)
@@ -202,12 +140,15 @@ class Reminders(LightningCog):
             await ctx.send("You cannot set a timer for longer than 10 years!", ephemeral=True)
             return
 
+        # Reminders sent to a channel are fired by the process that runs the channel's guild
+        extra = {"guild_id": ctx.guild.id} if channel and ctx.guild else {}
         _id = await self.add_timer("reminder", ctx.message.created_at, when.dt,
                                    timezone=timezone,
                                    reminder_text=when.arg,
                                    author=ctx.author.id,
                                    channel=channel,
-                                   message_id=ctx.message.id)
+                                   message_id=ctx.message.id,
+                                   **extra)
 
         if type(_id) is dict:
             content = f"Ok {ctx.author.mention}, I'll remind you{' in your DMs ' if not channel else ''} at"\
@@ -259,12 +200,8 @@ class Reminders(LightningCog):
     async def edit_reminder(self, ctx: LightningContext, reminder_id: int) -> None:
         """Edits a reminder you own"""
         try:
-            record = await self.bot.api.get_timer(reminder_id)
+            await self.bot.api.get_user_reminder(ctx.author.id, reminder_id)
         except NotFound:
-            await ctx.send("Could not find a reminder with that ID!", ephemeral=True)
-            return
-
-        if record['extra']['author'] != ctx.author.id:
             await ctx.send("Could not find a reminder with ID belonging to you!", ephemeral=True)
             return
 
@@ -297,10 +234,7 @@ class Reminders(LightningCog):
             await ctx.send("I couldn't find a reminder with that ID!")
             return
 
-        if self._current_task and self._current_task.id == reminder_id:
-            # Matches current timer, re-run loop as it's gone
-            self.restart_timer_task()
-
+        self.scheduler.discard(reminder_id)
         await ctx.send(f"Successfully deleted reminder (ID: {reminder_id})", ephemeral=True)
 
     @remind.command(name='clear')
@@ -308,10 +242,9 @@ class Reminders(LightningCog):
         """Clears all of your reminders"""
         queryc = """SELECT COUNT(*)
                     FROM timers
-                    WHERE event = 'reminder'
-                    AND extra ->> 'author' = $1
+                    WHERE author_id = $1
                 """
-        count = await self.bot.pool.fetchval(queryc, str(ctx.author.id))
+        count = await self.bot.pool.fetchval(queryc, ctx.author.id)
 
         if count == 0:
             await ctx.send("You don't have any reminders that I can delete")
@@ -323,16 +256,13 @@ class Reminders(LightningCog):
             return
 
         query = """DELETE FROM timers
-                   WHERE event = 'reminder'
-                   AND extra ->> 'author' = $1
+                   WHERE author_id = $1
                    RETURNING id;
                 """
-        records = await self.bot.pool.fetch(query, str(ctx.author.id))
-        ids = [r['id'] for r in records]
-
-        if self._current_task.event == 'reminder' and self._current_task.id in ids:
-            # cancel task
-            self.restart_timer_task()
+        records = await self.bot.pool.fetch(query, ctx.author.id)
+        self.bot.api.invalidate("/timers")
+        self.bot.api.invalidate(f"/users/{ctx.author.id}")
+        self.scheduler.discard(*[r['id'] for r in records])
 
         await ctx.send("Cleared all of your reminders.", ephemeral=True)
 
@@ -354,19 +284,12 @@ class Reminders(LightningCog):
                    DO UPDATE SET timezone=EXCLUDED.timezone;"""
         await self.bot.pool.execute(query, ctx.author.id, timezone.key)
 
-        await self.bot.redis_pool.set(f"lightning:user_settings:{ctx.author.id}:timezone", timezone.key)
+        await self.bot.timezones.set(ctx.author.id, timezone.key)
         await ctx.send(f"I set your timezone! IANA key: {timezone.key}", ephemeral=True)
 
     @set_reminder_timezone.autocomplete('timezone')
     async def set_timezone_autocomplete(self, itx: discord.Interaction, string: str):
-        if len(string) == 0:
-            # This really doesn't do much...
-            string = itx.locale.name
-
-        return [app_commands.Choice(name=x, value=x) for x, y, z in rapidfuzz.process.extract(string,
-                                                                                              self.available_timezones,
-                                                                                              limit=25,
-                                                                                              score_cutoff=60)]
+        return [app_commands.Choice(name=x, value=x) for x in self.timezone_index.search(string)]
 
     @reminder_timezone.command(name='get')
     async def get_reminder_timezone(self, ctx: LightningContext):
@@ -396,7 +319,7 @@ class Reminders(LightningCog):
             await ctx.send("You never had a timezone set!", ephemeral=True)
             return
 
-        await self.bot.redis_pool.delete(f"lightning:user_settings:{ctx.author.id}:timezone")
+        await self.bot.timezones.set(ctx.author.id, None)
         await ctx.send("I removed your timezone", ephemeral=True)
 
     @LightningCog.listener()
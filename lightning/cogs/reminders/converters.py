@@ -34,8 +34,12 @@ if TYPE_CHECKING:
 
 class TimeZoneConverter(commands.Converter):
     async def convert(self, ctx: LightningContext, argument: str):
+        cog: Optional[Reminders] = ctx.bot.get_cog("Reminders")  # type: ignore
+        # Also accepts city names, unambiguous abbreviations and keys in any case
+        key = cog.timezone_index.resolve(argument) if cog else argument
+
         try:
-            return ZoneInfo(argument)
+            return ZoneInfo(key or argument)
         except Exception:
             raise commands.UserInputError("I couldn't find that timezone!")
 
@@ -0,0 +1,412 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-present LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import (TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple,
+                    Union)
+
+import asyncpg
+import discord
+import orjson
+from prometheus_client import Counter, Gauge, Histogram
+from redis.exceptions import RedisError
+
+from lightning.models import Timer
+
+if TYPE_CHECKING:
+    from lightning import LightningBot
+
+__all__ = ("TimerScheduler", )
+log = logging.getLogger(__name__)
+
+TIMERS_FIRED_COUNTER = Counter("lightning_timers_fired", "Timers dispatched by the scheduler", ['event'])
+TIMER_LATENESS_HIST = Histogram("lightning_timer_lateness", "Seconds between a timer's expiry and when it fired",
+                                buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300))
+TIMERS_PENDING_GAUGE = Gauge("lightning_timers_pending", "Timers prefetched by the scheduler")
+TIMER_ACKS_COUNTER = Counter("lightning_timer_acks", "Fired timers deleted from the database")
+
+SHORT_TIMERS_KEY = "lightning:timers:short"
+
+
+def _score(expiry: datetime) -> float:
+    return expiry.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TimerScheduler:
+    """Fires timers stored in the database when they expire.
+
+    Every timer that expires within ``window`` is prefetched into a heap. Timers created while the scheduler is
+    running are pushed into the heap directly with :meth:`schedule`. Due timers are dispatched all at once instead of
+    one at a time, and are deleted from the database in batches afterwards.
+
+    Short timers are kept in a Redis sorted set instead of the database (see :meth:`add_short_timer`), so they
+    survive restarts without a round trip to the API.
+
+    Several processes can run a scheduler at once. Timers are leased to the process that fetched or created them until
+    shortly after they expire, and each process only fetches timers for guilds on its own shards. If a process dies,
+    its timers are picked up by the others once their leases run out. Short timers have no lease, so other processes
+    only recover them once they're ``short_timer_grace`` overdue.
+
+    Parameters
+    ----------
+    bot : LightningBot
+        The bot to dispatch ``lightning_<event>_complete`` events on.
+    window : datetime.timedelta
+        How far ahead to prefetch timers. The database is polled every half of this.
+    batch_size : int
+        The most timers to fetch in a single query.
+    ack_interval : float
+        How often, in seconds, fired timers are deleted from the database.
+    ack_batch_size : int
+        How many fired timers to wait for before deleting them early.
+    lease : datetime.timedelta
+        How long after a timer's expiry its lease runs out. The database is polled at least this often.
+    short_timer_grace : datetime.timedelta
+        How overdue a short timer has to be before a process that didn't create it fires it.
+    """
+    def __init__(self, bot: LightningBot, *, window: timedelta = timedelta(minutes=10), batch_size: int = 500,
+                 ack_interval: float = 1.0, ack_batch_size: int = 100, lease: timedelta = timedelta(seconds=60),
+                 short_timer_grace: timedelta = timedelta(seconds=15)) -> None:
+        self.bot = bot
+        self.window = window
+        self.batch_size = batch_size
+        self.ack_interval = ack_interval
+        self.ack_batch_size = ack_batch_size
+        self.lease = lease
+        self.short_timer_grace = short_timer_grace
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # Timers are keyed by their ID, or by their member in the sorted set if they're short timers
+        self._heap: List[Tuple[datetime, int, Union[int, str]]] = []
+        self._counter = itertools.count()
+        self._pending: Dict[Union[int, str], Timer] = {}
+        # Timers that fired, but haven't been deleted yet
+        self._unacknowledged: Set[int] = set()
+        self._unacknowledged_short: Set[str] = set()
+        # Every timer that expires before this is known to the scheduler
+        self._horizon: datetime = datetime.min
+        self._next_refill: datetime = datetime.min
+
+        self._wakeup = asyncio.Event()
+        self._acks_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._ack_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, timer_id: int) -> bool:
+        return timer_id in self._pending
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run(), name="lightning-timer-scheduler")
+        self._ack_task = asyncio.create_task(self.acknowledge_loop(), name="lightning-timer-acks")
+
+    async def close(self) -> None:
+        """Stops the scheduler, deletes any timers that already fired and releases the leases of the rest."""
+        tasks = [task for task in (self._task, self._ack_task) if task]
+        for task in tasks:
+            task.cancel()
+        # Let a poll or acknowledgement that's in progress unwind before the leases are released under it
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        await self.flush()
+        try:
+            query = "UPDATE timers SET lease_owner=NULL, lease_expires_at=NULL WHERE lease_owner=$1;"
+            await self.bot.pool.execute(query, self.worker_id)
+        except (OSError, asyncpg.PostgresError) as e:
+            log.warning("Failed to release timer leases", exc_info=e)
+
+    def _push(self, key: Union[int, str], timer: Timer) -> None:
+        self._pending[key] = timer
+        heapq.heappush(self._heap, (timer.expiry, next(self._counter), key))
+        TIMERS_PENDING_GAUGE.set(len(self._pending))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+
+    async def schedule(self, timer: Timer) -> bool:
+        """Leases and adds a newly created timer without waiting for the next poll.
+
+        Returns whether the timer was added. Timers past the prefetch window are left for a later poll.
+        """
+        if timer.id in self._pending or timer.id in self._unacknowledged:
+            return True
+
+        if timer.expiry >= self._horizon:
+            return False
+
+        query = """UPDATE timers SET lease_owner=$2, lease_expires_at=GREATEST(expiry, NOW() AT TIME ZONE 'UTC') + $3
+                   WHERE id=$1 AND (lease_expires_at IS NULL OR lease_expires_at < (NOW() AT TIME ZONE 'UTC'))
+                   RETURNING id;"""
+        if not await self.bot.pool.fetchval(query, timer.id, self.worker_id, self.lease):
+            # Another process got to it first
+            return False
+
+        self._push(timer.id, timer)
+        return True
+
+    async def add_short_timer(self, timer: Timer) -> None:
+        """Stores a timer that doesn't need an ID in Redis and schedules it.
+
+        If Redis is unavailable, the timer is only kept in memory.
+        """
+        member = orjson.dumps({"key": uuid.uuid4().hex, "event": timer.event, "created": timer.created_at,
+                               "expiry": timer.expiry, "timezone": timer.timezone, "extra": timer.extra}).decode()
+        try:
+            await self.bot.redis_pool.zadd(SHORT_TIMERS_KEY, {member: _score(timer.expiry)})
+        except RedisError as e:
+            log.warning(f"Failed to store a short {timer.event} timer, it will not survive a restart", exc_info=e)
+        self._push(member, timer)
+
+    def discard(self, *timer_ids: int) -> None:
+        """Stops timers prefetched by this process from firing. This does not delete them from the database.
+
+        Timers deleted from the database don't fire on other processes either, see :meth:`fire_due`.
+        """
+        for timer_id in timer_ids:
+            # Heap entries without a pending timer are skipped once they're popped
+            self._pending.pop(timer_id, None)
+        TIMERS_PENDING_GAUGE.set(len(self._pending))
+
+    def _owns(self, extra: Optional[Dict[str, Any]]) -> bool:
+        """Whether a timer's guild is on one of this process's shards. Timers without a guild belong to all of them."""
+        guild_id = (extra or {}).get('guild_id')
+        if guild_id is None or self.bot.shard_ids is None:
+            return True
+        return (int(guild_id) >> 22) % (self.bot.shard_count or 1) in self.bot.shard_ids
+
+    def update(self, timer_id: int, extra: Dict[str, Any]) -> None:
+        """Updates the extra data of a prefetched timer after it was edited."""
+        if timer := self._pending.get(timer_id):
+            timer.extra = extra
+
+    async def fetch_due(self, horizon: datetime) -> List[Timer]:
+        """Leases and returns unleased timers that expire before ``horizon``.
+
+        Timers for guilds on shards that this process doesn't run are skipped. Timers without a guild can be leased
+        by any process.
+        """
+        query = """WITH due AS (
+                       SELECT id FROM timers
+                       WHERE expiry < $1
+                       AND (lease_expires_at IS NULL OR lease_expires_at < (NOW() AT TIME ZONE 'UTC'))
+                       AND NOT (id = ANY($3::int[]))
+                       AND ($5::int[] IS NULL OR extra ->> 'guild_id' IS NULL
+                            OR ((extra ->> 'guild_id')::bigint >> 22) % $6 = ANY($5::int[]))
+                       ORDER BY expiry, id
+                       LIMIT $4
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   UPDATE timers
+                   SET lease_owner=$2, lease_expires_at=GREATEST(timers.expiry, NOW() AT TIME ZONE 'UTC') + $7
+                   FROM due WHERE timers.id = due.id
+                   RETURNING timers.*;"""
+        exclude = [key for key in self._pending if isinstance(key, int)] + list(self._unacknowledged)
+        shard_ids = self.bot.shard_ids
+        records = await self.bot.pool.fetch(query, horizon, self.worker_id, exclude, self.batch_size, shard_ids,
+                                            self.bot.shard_count or 1, self.lease)
+        return sorted((Timer.from_record(record) for record in records), key=lambda t: (t.expiry, t.id))
+
+    async def fetch_short_due(self) -> List[Tuple[str, Timer]]:
+        """Claims short timers that no process fired in time, like ones left over from before a restart.
+
+        Like :meth:`fetch_due`, timers for guilds on shards that this process doesn't run are left to other processes.
+        """
+        cutoff = datetime.utcnow() - self.short_timer_grace
+        members = await self.bot.redis_pool.zrange(SHORT_TIMERS_KEY, "-inf", _score(cutoff), byscore=True,
+                                                   offset=0, num=self.batch_size)
+        timers = {}
+        for member in members:
+            if member in self._pending or member in self._unacknowledged_short:
+                continue
+            data = orjson.loads(member)
+            timer = Timer(None, data['event'], datetime.fromisoformat(data['created']),
+                          datetime.fromisoformat(data['expiry']), data['timezone'], data['extra'])
+            if self._owns(timer.extra):
+                timers[member] = timer
+
+        if not timers:
+            return []
+
+        # Whichever process removes a member first gets to fire it
+        async with self.bot.redis_pool.pipeline(transaction=False) as pipe:
+            for member in timers:
+                pipe.zrem(SHORT_TIMERS_KEY, member)
+            claimed = await pipe.execute()
+
+        return [(member, timer) for (member, timer), removed in zip(timers.items(), claimed) if removed]
+
+    async def refill(self) -> None:
+        now = datetime.utcnow()
+        horizon = now + self.window
+        timers = await self.fetch_due(horizon)
+        for timer in timers:
+            self._push(timer.id, timer)
+
+        for member, timer in await self.fetch_short_due():
+            self._push(member, timer)
+
+        # A full batch means there can be more timers after the last one
+        self._horizon = timers[-1].expiry if len(timers) == self.batch_size else horizon
+        # Polling at least once per lease lets us pick up timers from processes that died
+        self._next_refill = min(self._horizon - self.window / 2, now + self.lease)
+
+        # Wake up once the next short timer that isn't ours can be recovered too
+        upcoming = await self.bot.redis_pool.zrange(SHORT_TIMERS_KEY, f"({_score(now - self.short_timer_grace)}",
+                                                    "+inf", byscore=True, offset=0, num=self.batch_size,
+                                                    withscores=True)
+        for member, score in upcoming:
+            if member in self._pending or member in self._unacknowledged_short:
+                continue
+            if self._owns(orjson.loads(member)['extra']):
+                expiry = datetime.fromtimestamp(score, timezone.utc).replace(tzinfo=None)
+                self._next_refill = min(self._next_refill, expiry + self.short_timer_grace)
+                break
+
+    async def fire_due(self, now: datetime) -> int:
+        """Dispatches every timer that expired by ``now``.
+
+        Timers from the database are looked up again first, since another process could have deleted or edited them
+        after they were prefetched here.
+        """
+        due: List[Tuple[Union[int, str], Timer]] = []
+        while self._heap and self._heap[0][0] <= now:
+            expiry, _, key = heapq.heappop(self._heap)
+            timer = self._pending.pop(key, None)
+            if timer is not None and timer.expiry == expiry:
+                due.append((key, timer))
+
+        ids = [key for key, _ in due if isinstance(key, int)]
+        current: Dict[int, Any] = {}
+        if ids:
+            try:
+                records = await self.bot.pool.fetch("SELECT id, extra FROM timers WHERE id = ANY($1::int[]);", ids)
+            except BaseException:
+                for key, timer in due:
+                    self._push(key, timer)
+                raise
+            current = {record['id']: record['extra'] for record in records}
+
+        fired = 0
+        for key, timer in due:
+            if isinstance(key, str):
+                self._unacknowledged_short.add(key)
+            elif key in current:
+                timer.extra = current[key]
+                self._unacknowledged.add(key)
+            else:
+                continue
+
+            self.bot.dispatch(f'lightning_{timer.event}_complete', timer)
+            TIMERS_FIRED_COUNTER.labels(timer.event).inc()
+            TIMER_LATENESS_HIST.observe((now - timer.expiry).total_seconds())
+            fired += 1
+
+        if due:
+            TIMERS_PENDING_GAUGE.set(len(self._pending))
+        if len(self._unacknowledged) + len(self._unacknowledged_short) >= self.ack_batch_size:
+            self._acks_ready.set()
+        return fired
+
+    async def _run_once(self) -> None:
+        if datetime.utcnow() >= self._next_refill:
+            await self.refill()
+
+        await self.fire_due(datetime.utcnow())
+
+        # Cleared before computing the deadline so a timer scheduled from here on wakes us up
+        self._wakeup.clear()
+        deadline = min(self._heap[0][0], self._next_refill) if self._heap else self._next_refill
+        timeout = (deadline - datetime.utcnow()).total_seconds()
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> None:
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            try:
+                await self._run_once()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, discord.ConnectionClosed, asyncpg.PostgresConnectionError, RedisError) as e:
+                log.warning("Failed to poll for timers, retrying in 5 seconds", exc_info=e)
+                await asyncio.sleep(5)
+            except Exception as e:
+                exc = "".join(traceback.format_exception(type(e), e, e.__traceback__, chain=False))
+                log.error(exc)
+                embed = discord.Embed(title="Timer Error", description=f"```{exc}```")
+                await self.bot._error_logger.put(embed)
+                await asyncio.sleep(5)
+
+    async def flush(self) -> int:
+        """Deletes timers that fired from the database and Redis.
+
+        The database and Redis are acknowledged separately, so one being unavailable doesn't hold back the other.
+        Timers that failed to be deleted are kept for the next flush.
+
+        Returns
+        -------
+        int
+            How many timers were deleted.
+        """
+        total = 0
+        if self._unacknowledged:
+            ids = list(self._unacknowledged)
+            try:
+                await self.bot.pool.execute("DELETE FROM timers WHERE id = ANY($1::int[]);", ids)
+            except (OSError, asyncpg.PostgresError) as e:
+                log.warning(f"Failed to acknowledge {len(ids)} fired timers", exc_info=e)
+            else:
+                self._unacknowledged.difference_update(ids)
+                self.bot.api.invalidate("/timers")
+                self.bot.api.invalidate("/users")
+                total += len(ids)
+
+        if self._unacknowledged_short:
+            members = list(self._unacknowledged_short)
+            try:
+                await self.bot.redis_pool.zrem(SHORT_TIMERS_KEY, *members)
+            except RedisError as e:
+                log.warning(f"Failed to acknowledge {len(members)} fired short timers", exc_info=e)
+            else:
+                self._unacknowledged_short.difference_update(members)
+                total += len(members)
+
+        TIMER_ACKS_COUNTER.inc(total)
+        return total
+
+    async def acknowledge_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._acks_ready.wait(), self.ack_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._acks_ready.clear()
+            await self.flush()
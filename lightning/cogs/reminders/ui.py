@@ -35,8 +35,11 @@ class ReminderEditTextModal(discord.ui.Modal):
     text = discord.ui.TextInput(label="Text", style=discord.TextStyle.long)
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
-        await self.view.ctx.bot.api.request("PATCH", f"/users/{interaction.user.id}/reminders/{self.view.timer_id}",
-                                            data={"reminder_text": self.text.value})
+        bot = self.view.ctx.bot
+        record = await bot.api.request("PATCH", f"/users/{interaction.user.id}/reminders/{self.view.timer_id}",
+                                       data={"reminder_text": self.text.value})
+        if cog := bot.get_cog("Reminders"):
+            cog.scheduler.update(self.view.timer_id, record['extra'])
         await interaction.response.send_message("Edited the reminder's text!", ephemeral=True)
 
 
@@ -46,7 +49,7 @@ class ReminderEdit(ExitableMenu):
         self.timer_id = timer_id
 
     async def format_initial_message(self, ctx):
-        record = await ctx.bot.api.get_timer(self.timer_id)
+        record = await ctx.bot.api.get_user_reminder(ctx.author.id, self.timer_id)
         content = f"**Reminder #{self.timer_id}**:\nExpires: "\
                   f"{discord.utils.format_dt(datetime.fromisoformat(record['expiry']))}\nText: "\
                   f"{record['extra']['reminder_text']}"
@@ -75,7 +78,9 @@ class ReminderEdit(ExitableMenu):
         if prompt is not True:
             return
 
-        await self.ctx.bot.api.delete_timer(self.timer_id)
+        await self.ctx.bot.api.delete_user_reminder(self.ctx.author.id, self.timer_id)
+        if cog := self.ctx.bot.get_cog("Reminders"):
+            cog.scheduler.discard(self.timer_id)
         await interaction.followup.send("Deleted the reminder!")
         self.stop()
 
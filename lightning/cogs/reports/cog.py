@@ -88,6 +88,7 @@ class Reports(LightningCog):
         await self.bot.pool.execute(query, channel.guild.id)
         query = "DELETE FROM message_reports WHERE guild_id=$1;"
         await self.bot.pool.execute(query, channel.guild.id)
+        self.bot.api.invalidate(f"/guilds/{channel.guild.id}")
 
         if c := cache_registry.get("mod_config"):
             await c.invalidate(str(channel.guild.id))
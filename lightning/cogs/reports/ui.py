@@ -18,7 +18,6 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
 from typing import TYPE_CHECKING, Optional
-from zoneinfo import ZoneInfo
 
 import discord
 from sanctum.exceptions import NotFound
@@ -58,11 +57,7 @@ class ActionOptionsModal(discord.ui.Modal, title="Action Options"):
     msg_content: str
 
     async def on_submit(self, interaction: discord.Interaction[LightningBot]) -> None:
-        tzinfo = await interaction.client.get_user_timezone(interaction.user.id)
-        if tzinfo:
-            tzinfo = ZoneInfo(tzinfo)
-        else:
-            tzinfo = timezone.utc
+        tzinfo = await interaction.client.get_user_timezone(interaction.user.id) or timezone.utc
 
         try:
             dt = FutureTime(self.duration.value, tz=tzinfo)
@@ -361,6 +356,7 @@ class ReportConfiguration(UpdateableMenu, ExitableMenu):
             self.remove_report_channel_button.disabled = False
 
     async def invalidate_config(self, guild_id: int):
+        self.ctx.bot.api.invalidate(f"/guilds/{guild_id}")
         if c := cache_registry.get("mod_config"):
             await c.invalidate(str(guild_id))
 
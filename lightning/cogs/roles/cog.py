@@ -182,6 +182,7 @@ class Roles(LightningCog):
                    ARRAY(SELECT DISTINCT * FROM unnest(COALESCE(guild_config.toggleroles, '{}') || $2::bigint[]))
                 """
         await self.bot.pool.execute(query, ctx.guild.id, [role.id])
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
         await ctx.send(f"Added {role.name} as a toggleable role!")
         self.bot.loop.create_task(self.update_togglerole_buttons(ctx.guild))
@@ -203,6 +204,7 @@ class Roles(LightningCog):
         if resp == "UPDATE 0":
             await ctx.send("This server had no toggleable roles")
         else:
+            self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
             await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
             await ctx.send("All toggleable roles have been deleted.")
 
@@ -220,6 +222,7 @@ class Roles(LightningCog):
         """Removes a role from the toggleable role list"""
         role_repr = (role.id if hasattr(role, 'id') else role, role.name if hasattr(role, 'name') else role)
         await self.remove_assignable_role(ctx.guild.id, role_repr[0])
+        self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
         await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
         await ctx.send(f"Successfully removed {role_repr[1]} from the list of toggleable roles")
         self.bot.loop.create_task(self.update_togglerole_buttons(ctx.guild))
@@ -255,6 +258,7 @@ class Roles(LightningCog):
                              WHERE NOT(x = ANY($1::bigint[])))
                        WHERE guild_id=$2;"""
             await self.bot.pool.execute(query, unresolved, ctx.guild.id)
+            self.bot.api.invalidate(f"/guilds/{ctx.guild.id}")
             await self.bot.get_guild_bot_config.invalidate(ctx.guild.id)
 
         await self.start_role_pages(ctx, roles)
@@ -262,6 +266,7 @@ class Roles(LightningCog):
     @LightningCog.listener()
     async def on_lightning_guild_role_delete(self, event: GuildRoleDeleteEvent):
         await self.remove_assignable_role(event.guild_id, event.role.id)
+        self.bot.api.invalidate(f"/guilds/{event.guild_id}")
         await self.bot.get_guild_bot_config.invalidate(event.guild_id)
 
     # Some things to note:
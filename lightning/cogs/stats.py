@@ -34,9 +34,11 @@ from lightning import (CommandLevel, GuildContext, LightningCog,
 from lightning.constants import LIGHTNING_COLOR
 from lightning.converters import InbetweenNumber
 from lightning.models import ActionType
+from lightning.utils.bulk import BulkBuffer, BulkWriter
 from lightning.utils.checks import has_guild_permissions
 from lightning.utils.emitters import WebhookEmbedEmitter
 from lightning.utils.modlogformats import base_user_format
+from lightning.utils.partitions import MonthlyPartitioner
 from lightning.utils.time import natural_timedelta
 
 if TYPE_CHECKING:
@@ -45,6 +47,33 @@ if TYPE_CHECKING:
 
 log: logging.Logger = logging.getLogger(__name__)
 
+COMMAND_STATS_WRITER = BulkWriter("command_stats", ("guild_id", "channel_id", "user_id", "used_at", "command_name",
+                                                     "failure", "application_command"))
+
+# Rollups are updated from every batch the writer merges. {staging} is either the writer's staging table
+# or command_stats itself when backfilling.
+DAILY_ROLLUP_QUERY = """INSERT INTO command_usage_daily (guild_id, user_id, command_name, channel_id, day, uses,
+                                                         first_used_at)
+                        SELECT COALESCE(guild_id, 0), COALESCE(user_id, 0), command_name, COALESCE(channel_id, 0),
+                               used_at::date, COUNT(*), MIN(used_at)
+                        FROM {staging}
+                        WHERE command_name IS NOT NULL AND used_at IS NOT NULL
+                        GROUP BY 1, 2, 3, 4, 5
+                        ON CONFLICT (guild_id, user_id, command_name, channel_id, day) DO UPDATE
+                        SET uses = command_usage_daily.uses + EXCLUDED.uses,
+                            first_used_at = LEAST(command_usage_daily.first_used_at, EXCLUDED.first_used_at);"""
+HOURLY_ROLLUP_QUERY = """INSERT INTO command_usage_hourly (day, hour, command_name, uses)
+                         SELECT used_at::date, EXTRACT(HOUR FROM used_at)::smallint, command_name, COUNT(*)
+                         FROM {staging}
+                         WHERE command_name IS NOT NULL AND used_at IS NOT NULL
+                         GROUP BY 1, 2, 3
+                         ON CONFLICT (day, hour, command_name) DO UPDATE
+                         SET uses = command_usage_hourly.uses + EXCLUDED.uses;"""
+COMMAND_STATS_WRITER.add_merge_statement(DAILY_ROLLUP_QUERY)
+COMMAND_STATS_WRITER.add_merge_statement(HOURLY_ROLLUP_QUERY)
+
+COMMAND_STATS_PARTITIONS = MonthlyPartitioner("command_stats", "used_at")
+
 
 class Stats(LightningCog):
     """Statistics related commands"""
@@ -52,9 +81,10 @@ class Stats(LightningCog):
     def __init__(self, bot: LightningBot):
         self.bot = bot
 
-        self._command_inserts = []
-        self._lock = asyncio.Lock()
+        self._command_inserts = BulkBuffer(COMMAND_STATS_WRITER, name="command_stats",
+                                           spill_path="config/spill/command_stats.jsonl")
         self.bulk_command_insertion.start()
+        self.command_stats_maintenance.start()
 
         self.number_places: Tuple[str, ...] = (
             '\N{FIRST PLACE MEDAL}',
@@ -77,6 +107,7 @@ class Stats(LightningCog):
 
     def cog_unload(self) -> None:
         self.bulk_command_insertion.stop()
+        self.command_stats_maintenance.cancel()
         self.bulk_automod_metrics.stop()
 
         if hasattr(self, 'guild_stats_bulker'):
@@ -88,37 +119,39 @@ class Stats(LightningCog):
         else:
             guild_id = ctx.guild.id
 
-        async with self._lock:
-            self._command_inserts.append({
-                'guild_id': guild_id,
-                'channel_id': ctx.channel.id,
-                'user_id': ctx.author.id,
-                'used_at': ctx.message.created_at.isoformat(),
-                'command_name': ctx.command.qualified_name,
-                'failure': ctx.command_failed,
-                'application_command': True if ctx.interaction else False,
-            })
+        self._command_inserts.append((guild_id, ctx.channel.id, ctx.author.id,
+                                      ctx.message.created_at.replace(tzinfo=None), ctx.command.qualified_name,
+                                      ctx.command_failed, True if ctx.interaction else False))
 
     async def bulk_database_insert(self) -> None:
-        if self._command_inserts:
-            query = """INSERT INTO command_stats (guild_id, channel_id, user_id, used_at, command_name, failure,
-                                                  application_command)
-                       SELECT data.guild_id, data.channel_id, data.user_id, data.used_at, data.command_name,
-                              data.failure, data.application_command
-                       FROM jsonb_to_recordset($1::jsonb) AS
-                       data(guild_id BIGINT, channel_id BIGINT, user_id BIGINT, used_at TIMESTAMP,
-                            command_name TEXT, failure BOOLEAN, application_command BOOLEAN)
-                """
-            await self.bot.pool.execute(query, self._command_inserts)
-            total = len(self._command_inserts)
+        if self._command_inserts or self._command_inserts.has_spilled_rows:
+            total = await self._command_inserts.flush(self.bot.pool)
             if total > 1:
                 log.info(f'{total} commands were added to the database.')
-            self._command_inserts.clear()
 
     @tasks.loop(seconds=15.0)
     async def bulk_command_insertion(self):
-        async with self._lock:
-            await self.bulk_database_insert()
+        await self.bulk_database_insert()
+
+    @bulk_command_insertion.after_loop
+    async def on_bulk_command_insertion_cancel(self):
+        # Last chance to write anything that's still buffered. Whatever can't be written is kept on disk.
+        await self.bulk_database_insert()
+        await self._command_inserts.spill()
+
+    @tasks.loop(hours=6.0)
+    async def command_stats_maintenance(self):
+        try:
+            async with self.bot.pool.acquire() as conn:
+                await COMMAND_STATS_PARTITIONS.create_partitions(conn)
+
+                retention = self.bot.config.bot.command_stats_retention
+                if retention is not None:
+                    await COMMAND_STATS_PARTITIONS.expire_partitions(
+                        conn, retention, drop=self.bot.config.bot.drop_expired_command_stats)
+        except Exception as e:
+            # Partitions are made months ahead, so we can wait for the next run
+            log.exception("Failed to maintain command_stats partitions", exc_info=e)
 
     @LightningCog.listener()
     async def on_command_completion(self, ctx):
@@ -140,16 +173,9 @@ class Stats(LightningCog):
             guild_id = None
         else:
             guild_id = interaction.guild.id
-        async with self._lock:
-            self._command_inserts.append({
-                'guild_id': guild_id,
-                'channel_id': interaction.channel.id,
-                'user_id': interaction.user.id,
-                'used_at': interaction.created_at.isoformat(),
-                'command_name': interaction.command.qualified_name,
-                'failure': interaction.command_failed,
-                'application_command': True
-            })
+        self._command_inserts.append((guild_id, interaction.channel.id, interaction.user.id,
+                                      interaction.created_at.replace(tzinfo=None),
+                                      interaction.command.qualified_name, interaction.command_failed, True))
 
     def format_stat_description(self, records, *, none_msg: str = "Nothing found yet."):
         x = '\n'.join(f'{self.number_places[index]}: {command_name} ({cmd_uses} times)'
@@ -162,16 +188,16 @@ class Stats(LightningCog):
 
     async def commands_stats_guild(self, ctx: GuildContext):
         em = discord.Embed(title="Command Stats", color=0xf74b06)
-        query = """SELECT COUNT(*), MIN(used_at)
-                   FROM command_stats
+        query = """SELECT COALESCE(SUM(uses), 0)::bigint, MIN(first_used_at)
+                   FROM command_usage_daily
                    WHERE guild_id=$1;"""
         res = await self.bot.pool.fetchrow(query, ctx.guild.id)
         em.description = f"{res[0]} commands used so far."
         em.set_footer(text='Tracking command usage since')
         em.timestamp = res[1] or discord.utils.utcnow()
         query = """SELECT command_name,
-                        COUNT(*) as "cmd_uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "cmd_uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
                    GROUP BY command_name
                    ORDER BY "cmd_uses" DESC
@@ -181,8 +207,8 @@ class Stats(LightningCog):
         em.add_field(name="Top Commands", value=self.format_stat_description(records, none_msg="No commands used yet."))
 
         query = """SELECT user_id,
-                        COUNT(*) as "uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
                    GROUP BY user_id
                    ORDER BY "uses" DESC
@@ -195,10 +221,10 @@ class Stats(LightningCog):
             em.add_field(name="Top Command Users", value=usage)
 
         query = """SELECT command_name,
-                        COUNT(*) as "cmd_uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "cmd_uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
-                   AND used_at > (timezone('UTC', now()) - INTERVAL '1 day')
+                   AND day = timezone('UTC', now())::date
                    GROUP BY command_name
                    ORDER BY "cmd_uses" DESC
                    LIMIT 5;
@@ -208,10 +234,10 @@ class Stats(LightningCog):
                      value=self.format_stat_description(records, none_msg="No commands used yet."), inline=False)
 
         query = """SELECT channel_id,
-                        COUNT(*) as "uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
-                   AND channel_id IS NOT NULL
+                   AND channel_id <> 0
                    GROUP BY channel_id
                    ORDER BY "uses" DESC
                    LIMIT 5;
@@ -231,15 +257,17 @@ class Stats(LightningCog):
 
     async def command_stats_member(self, ctx: LightningContext, member: discord.Member):
         em = discord.Embed(title=f"Command Stats for {member}", color=LIGHTNING_COLOR)
-        query = "SELECT COUNT(*), MIN(used_at) FROM command_stats WHERE guild_id=$1 AND user_id=$2;"
+        query = """SELECT COALESCE(SUM(uses), 0)::bigint AS count, MIN(first_used_at)
+                   FROM command_usage_daily
+                   WHERE guild_id=$1 AND user_id=$2;"""
         res = await self.bot.pool.fetchrow(query, ctx.guild.id, member.id)
         em.description = f"{res['count']} commands used so far in {ctx.guild.name}."
 
         em.set_footer(text='First command usage on')
         em.timestamp = res[1] or discord.utils.utcnow()
         query2 = """SELECT command_name,
-                        COUNT(*) as "cmd_uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "cmd_uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
                    AND user_id=$2
                    GROUP BY command_name
@@ -250,10 +278,10 @@ class Stats(LightningCog):
         em.add_field(name="Top Commands", value=self.format_stat_description(cmds, none_msg="No commands used yet."))
 
         query = """SELECT command_name,
-                        COUNT(*) as "cmd_uses"
-                   FROM command_stats
+                        SUM(uses)::bigint as "cmd_uses"
+                   FROM command_usage_daily
                    WHERE guild_id=$1
-                   AND used_at > (timezone('UTC', now()) - INTERVAL '1 day')
+                   AND day = timezone('UTC', now())::date
                    AND user_id=$2
                    GROUP BY command_name
                    ORDER BY "cmd_uses" DESC
@@ -274,10 +302,10 @@ class Stats(LightningCog):
     async def wrapped(self, ctx: GuildContext):
         """Shows a summary of your bot usage over the past year"""
         conn = await self.bot.pool.acquire(timeout=200)
-        query = """SELECT COUNT(*)
-                   FROM command_stats
+        query = """SELECT SUM(uses)::bigint
+                   FROM command_usage_daily
                    WHERE user_id=$1
-                   AND used_at > (timezone('UTC', now()) - INTERVAL '1 year');"""
+                   AND day >= (timezone('UTC', now()) - INTERVAL '1 year')::date;"""
         total_cmds = await conn.fetchval(query, ctx.author.id)
         if not total_cmds:
             await self.bot.pool.release(conn)
@@ -288,19 +316,20 @@ class Stats(LightningCog):
         embed.set_thumbnail(url=ctx.author.display_avatar.url)
 
         query = """SELECT command_name,
-                        COUNT(*) as "cmd_uses"
-                   FROM command_stats
-                   WHERE used_at > (timezone('UTC', now()) - INTERVAL '1 year')
+                        SUM(uses)::bigint as "cmd_uses"
+                   FROM command_usage_daily
+                   WHERE day >= (timezone('UTC', now()) - INTERVAL '1 year')::date
                    AND user_id=$1
                    GROUP BY command_name
                    ORDER BY "cmd_uses" DESC
                    LIMIT 5;
                 """
         records = await conn.fetch(query, ctx.author.id)
+        # The hourly rollup isn't per user, but this is covered by command_stats' (user_id, used_at) index
         query = """SELECT TO_CHAR(used_at, 'HH24') AS ts, COUNT (*) as "count"
                    FROM command_stats
                    WHERE user_id=$1
-                   AND used_at > (timezone('UTC', now()) - INTERVAL '1 year')
+                   AND used_at >= (timezone('UTC', now()) - INTERVAL '1 year')::date
                    GROUP BY ts
                    ORDER BY count DESC
                    LIMIT 1;"""
@@ -312,18 +341,18 @@ class Stats(LightningCog):
                             f"*You liked to run commands at {discord.utils.format_dt(ts, style='t')}!*"
 
         # Reminders
-        query = """SELECT COUNT(*)
-                   FROM command_stats
+        query = """SELECT SUM(uses)::bigint
+                   FROM command_usage_daily
                    WHERE user_id=$1
                    AND command_name='remind'
-                   AND used_at > (timezone('UTC', now()) - INTERVAL '1 year');"""
+                   AND day >= (timezone('UTC', now()) - INTERVAL '1 year')::date;"""
         total_cmds = await conn.fetchval(query, ctx.author.id)
         if total_cmds:
-            query = """SELECT COUNT(*)
-                       FROM command_stats
+            query = """SELECT COALESCE(SUM(uses), 0)::bigint
+                       FROM command_usage_daily
                        WHERE user_id=$1
                        AND (command_name='remind delete' OR command_name='remind clear')
-                       AND used_at > (timezone('UTC', now()) - INTERVAL '1 year');"""
+                       AND day >= (timezone('UTC', now()) - INTERVAL '1 year')::date;"""
             deleted = await conn.fetchval(query, ctx.author.id)
 
             value = f"In the past year, you've made {total_cmds} reminders!\nOut of {total_cmds} reminders, you've"\
@@ -409,17 +438,17 @@ class Stats(LightningCog):
         """Sends stats on the most popular commands used in the bot"""
         async with ctx.typing():
             query = """SELECT command_name,
-                        COUNT (*) as "cmd_uses"
-                       FROM command_stats
+                        SUM(uses)::bigint as "cmd_uses"
+                       FROM command_usage_hourly
                        GROUP BY command_name
                        ORDER BY "cmd_uses" DESC
                        LIMIT 10;
                     """
             async with self.bot.pool.acquire() as conn:
                 records = await conn.fetch(query)
-                total = await conn.fetchval("SELECT COUNT(*) FROM command_stats;")
-                query = """SELECT COUNT(*) FROM command_stats
-                           WHERE used_at > (timezone('UTC', now()) - INTERVAL '1 day');"""
+                total = await conn.fetchval("SELECT COALESCE(SUM(uses), 0)::bigint FROM command_usage_hourly;")
+                query = """SELECT COALESCE(SUM(uses), 0)::bigint FROM command_usage_hourly
+                           WHERE day = timezone('UTC', now())::date;"""
                 today_total = await conn.fetchval(query)
                 embed = discord.Embed(title="Popular Commands", color=0x841d6e,
                                       description=f"Total commands used: {total}\nTotal commands used today: "
@@ -428,9 +457,9 @@ class Stats(LightningCog):
                                               for (index, (command_name, cmd_uses)) in enumerate(records))
                 embed.add_field(name="All Time", value=commands_used_des)
                 query = """SELECT command_name,
-                            COUNT (*) as "cmd_uses"
-                           FROM command_stats
-                           WHERE used_at > (timezone('UTC', now()) - INTERVAL '1 day')
+                            SUM(uses)::bigint as "cmd_uses"
+                           FROM command_usage_hourly
+                           WHERE day = timezone('UTC', now())::date
                            GROUP BY command_name
                            ORDER BY "cmd_uses" DESC
                            LIMIT 10;
@@ -532,7 +561,7 @@ class Stats(LightningCog):
                            f"{natural_timedelta(self.bot.launch_time, accuracy=None, suffix=False)}\n"
                            f"**Servers**: {len(self.bot.guilds):,}\n**Shards**: {len(self.bot.shards)}")
 
-        query = "SELECT COUNT(*) FROM command_stats;"
+        query = "SELECT COALESCE(SUM(uses), 0)::bigint FROM command_usage_hourly;"
         total_cmds = await self.bot.pool.fetchval(query)
         description.append(f"{total_cmds:,} commands ran.")
 
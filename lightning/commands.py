@@ -22,6 +22,8 @@ from typing import TYPE_CHECKING
 import discord
 from discord.ext import commands
 
+from lightning.tracing import span
+
 if TYPE_CHECKING:
     from lightning.context import LightningContext
 
@@ -135,31 +137,42 @@ class LightningCommand(commands.Command):
         ctx.command = self
 
         try:
-            if not await ctx.bot.can_run(ctx):
-                raise commands.CheckFailure(f'The global check functions for command {self.qualified_name} failed.')
+            with span("checks.global"):
+                if not await ctx.bot.can_run(ctx):
+                    raise commands.CheckFailure(f'The global check functions for command {self.qualified_name} '
+                                                'failed.')
 
             cog = self.cog
             # Other checks should have more priority first
             if cog is not None:
                 local_check = commands.Cog._get_overridden_method(cog.cog_check)
                 if local_check is not None:
-                    ret = await discord.utils.maybe_coroutine(local_check, ctx)
+                    with span("checks.cog"):
+                        ret = await discord.utils.maybe_coroutine(local_check, ctx)
                     if not ret:
                         return False
 
-            if not self.checks:
-                return await self._check_level(ctx)
-
-            checks = self._filter_out_permissions()
-            pred = await discord.utils.async_all(predicate(ctx) for predicate in checks)
-            if pred is False:
-                # An important check failed...
-                return False
+            if self.checks:
+                checks = self._filter_out_permissions()
+                with span("checks.command"):
+                    pred = await discord.utils.async_all(predicate(ctx) for predicate in checks)
+                if pred is False:
+                    # An important check failed...
+                    return False
 
-            return await self._check_level(ctx)
+            with span("checks.level"):
+                return await self._check_level(ctx)
         finally:
             ctx.command = original
 
+    async def prepare(self, ctx: LightningContext, /) -> None:
+        with span("prepare"):
+            await super().prepare(ctx)
+
+    async def _parse_arguments(self, ctx: LightningContext) -> None:
+        with span("parse_arguments"):
+            await super()._parse_arguments(ctx)
+
 
 class LightningGroupCommand(LightningCommand, commands.Group):
     def command(self, *args, **kwargs):
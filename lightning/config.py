@@ -16,7 +16,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from lightning.storage import TOMLStorage
 
@@ -58,10 +58,12 @@ class TokensConfig:
 
 
 class PostgresConfig:
-    __slots__ = ('uri',)
+    __slots__ = ('uri', 'slow_query_threshold')
 
     def __init__(self, data: Dict[str, Any]) -> None:
         self.uri: str = data['uri']
+        # Seconds a query can take before it's logged
+        self.slow_query_threshold: Optional[float] = data.pop('slow_query_threshold', 0.5)
 
 
 class RedisConfig:
@@ -75,11 +77,17 @@ class RedisConfig:
 
 
 class SanctumConfig:
-    __slots__ = ("url", "key")
+    __slots__ = ("url", "key", "cache", "request_timeout", "max_retries", "circuit_breaker_threshold",
+                 "circuit_breaker_timeout")
 
     def __init__(self, data: Dict[str, Any]) -> None:
         self.url = data['url']
         self.key = data['key']
+        self.cache: bool = data.pop('cache', True)
+        self.request_timeout: float = data.pop('request_timeout', 10.0)
+        self.max_retries: int = data.pop('max_retries', 2)
+        self.circuit_breaker_threshold: int = data.pop('circuit_breaker_threshold', 5)
+        self.circuit_breaker_timeout: float = data.pop('circuit_breaker_timeout', 30.0)
 
 
 class PrometheusConfig:
@@ -101,7 +109,10 @@ class LoggingConfig:
 
 class BotConfig:
     __slots__ = ('description', 'spam_count', 'game', 'edit_commands', 'support_server_invite', 'git_repo',
-                 'user_agent', 'beta_prefix', 'disabled_cogs', 'message_cache_max', 'owner_ids')
+                 'user_agent', 'beta_prefix', 'disabled_cogs', 'message_cache_max', 'owner_ids',
+                 'command_stats_retention', 'drop_expired_command_stats', 'slow_callback_threshold',
+                 'loop_stall_threshold', 'trace_sample_rate', 'slow_command_threshold', 'shard_ids', 'shard_count',
+                 'durable_modlog')
 
     def __init__(self, data: Dict[str, Any]) -> None:
         self.description = data.pop("description", None)
@@ -115,3 +126,17 @@ class BotConfig:
         self.disabled_cogs = data.pop('disabled_cogs', [])
         self.message_cache_max = data.pop('message_cache_max', 1000)
         self.owner_ids = data.pop('owner_ids', None)
+        # Months of raw command stats to keep. None keeps everything
+        self.command_stats_retention: Optional[int] = data.pop('command_stats_retention', None)
+        self.drop_expired_command_stats: bool = data.pop('drop_expired_command_stats', False)
+        # Seconds the event loop can be blocked before the running task is recorded, and before a stack is sampled
+        self.slow_callback_threshold: float = data.pop('slow_callback_threshold', 0.1)
+        self.loop_stall_threshold: float = data.pop('loop_stall_threshold', 1.0)
+        # Fraction of command traces to keep, slow commands are always kept
+        self.trace_sample_rate: float = data.pop('trace_sample_rate', 0.01)
+        self.slow_command_threshold: float = data.pop('slow_command_threshold', 2.0)
+        # Shards this process runs when the bot is split across several processes. None runs every shard
+        self.shard_ids: Optional[List[int]] = data.pop('shard_ids', None)
+        self.shard_count: Optional[int] = data.pop('shard_count', None)
+        # Queue modlog entries in Redis Streams so they survive restarts
+        self.durable_modlog: bool = data.pop('durable_modlog', False)
@@ -29,6 +29,7 @@ from lightning.commands import (LightningCommand, LightningGroupCommand,
                                 command, group)
 from lightning.errors import (FlagError, FlagInputError,
                               MissingRequiredFlagArgument)
+from lightning.tracing import span
 
 __all__ = ("Flag",
            "add_flag",
@@ -347,6 +348,10 @@ class FlagCommand(LightningCommand):
         return args
 
     async def _parse_arguments(self, ctx: commands.Context):
+        with span("parse_arguments"):
+            await self._parse_arguments_with_flags(ctx)
+
+    async def _parse_arguments_with_flags(self, ctx: commands.Context):
         ctx.args = [ctx] if self.cog is None else [self.cog, ctx]
         ctx.kwargs = {}
         args = ctx.args
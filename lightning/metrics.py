@@ -0,0 +1,133 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, List, Tuple, TypeVar
+
+from prometheus_client import Counter, Histogram
+
+__all__ = ("TimingStat", "TimingWindow", "LISTENER_TIMING_HIST", "LISTENER_ERRORS_COUNTER", "LOOP_LAG_HIST",
+           "LOOP_STALLS_COUNTER", "COMMAND_STAGE_HIST")
+
+LISTENER_TIMING_HIST = Histogram("lightning_listener_timing", "Time it takes for an event listener to finish",
+                                 ['cog', 'listener', 'event'])
+LISTENER_ERRORS_COUNTER = Counter("lightning_listener_errors", "Exceptions raised by event listeners",
+                                  ['cog', 'listener', 'event'])
+LOOP_LAG_HIST = Histogram("lightning_loop_lag", "How late the event loop was to wake up the lag monitor",
+                          buckets=(.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, float("inf")))
+LOOP_STALLS_COUNTER = Counter("lightning_loop_stalls", "Times the event loop was blocked for longer than the "
+                              "slow callback threshold", ['coro'])
+COMMAND_STAGE_HIST = Histogram("lightning_command_stage_timing", "Time spent in each stage of processing a command",
+                               ['stage'])
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TimingStat:
+    __slots__ = ("count", "total", "max", "failures")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.failures = 0
+
+    def add(self, duration: float, failed: bool = False) -> None:
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        if failed:
+            self.failures += 1
+
+    def merge(self, other: TimingStat) -> None:
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.failures += other.failures
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class TimingWindow(Generic[K]):
+    """Keeps per-minute timing aggregates so recent slow spots can be looked up from a command.
+
+    Prometheus histograms are cumulative, so they can't answer "what was slow in the last 10 minutes" without a
+    Prometheus server to query.
+
+    Parameters
+    ----------
+    minutes : int
+        How many minutes of history to keep.
+    """
+    __slots__ = ("minutes", "_buckets")
+
+    def __init__(self, *, minutes: int = 60) -> None:
+        self.minutes = minutes
+        self._buckets: OrderedDict[int, Dict[K, TimingStat]] = OrderedDict()
+
+    def _current_bucket(self) -> Dict[K, TimingStat]:
+        minute = int(time.monotonic() // 60)
+        bucket = self._buckets.get(minute)
+        if bucket is None:
+            bucket = self._buckets[minute] = {}
+            while next(iter(self._buckets)) <= minute - self.minutes:
+                self._buckets.popitem(last=False)
+        return bucket
+
+    def record(self, key: K, duration: float, *, failed: bool = False) -> None:
+        bucket = self._current_bucket()
+        stat = bucket.get(key)
+        if stat is None:
+            stat = bucket[key] = TimingStat()
+        stat.add(duration, failed)
+
+    def summary(self, minutes: int) -> Dict[K, TimingStat]:
+        """Merges the stats recorded in the last ``minutes`` minutes"""
+        oldest = int(time.monotonic() // 60) - minutes
+        merged: Dict[K, TimingStat] = {}
+        for minute, bucket in reversed(self._buckets.items()):
+            if minute <= oldest:
+                break
+
+            for key, stat in bucket.items():
+                if key not in merged:
+                    merged[key] = TimingStat()
+                merged[key].merge(stat)
+        return merged
+
+    def slowest(self, minutes: int, *, limit: int = 10, by: str = "total") -> List[Tuple[K, TimingStat]]:
+        """Returns the keys that took the most time in the last ``minutes`` minutes.
+
+        Parameters
+        ----------
+        minutes : int
+            How far back to look.
+        limit : int
+            The amount of keys to return.
+        by : str
+            The :class:`TimingStat` attribute to sort by. Either ``total``, ``mean`` or ``max``.
+        """
+        stats = self.summary(minutes)
+        return sorted(stats.items(), key=lambda item: getattr(item[1], by), reverse=True)[:limit]
+
+    def clear(self) -> None:
+        self._buckets.clear()
@@ -17,8 +17,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 from __future__ import annotations
 
 import datetime
-from typing import (TYPE_CHECKING, Any, Dict, List, Optional, Tuple, TypedDict,
-                    Union)
+from typing import (TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple,
+                    TypedDict, Union)
 
 import discord
 
@@ -74,7 +74,7 @@ if TYPE_CHECKING:
 
 
 class LoggingConfig:
-    __slots__ = ('logging')
+    __slots__ = ('logging', '_routes')
 
     def __init__(self, records):
         self.logging: Dict[int, LogConfig] = {}
@@ -82,19 +82,35 @@ class LoggingConfig:
             self.logging[record['channel_id']] = {"types": LoggingType(record['types']),
                                                   "format": record['format'],
                                                   "webhook_url": record['webhook_url']}
+        self._compile()
 
-    def get_channels_with_feature(self, log_type: int) -> List[Tuple[int, Dict[str, Any]]]:
-        channels = []
-        for key, value in list(self.logging.items()):
-            if log_type in value['types']:
-                channels.append((key, value))
-        return channels
+    def _compile(self) -> None:
+        # LoggingType bit -> the channels that log it
+        routes: Dict[int, List[Tuple[int, LogConfig]]] = {}
+        for channel_id, config in self.logging.items():
+            value = int(config['types'])
+            while value:
+                bit = value & -value
+                routes.setdefault(bit, []).append((channel_id, config))
+                value ^= bit
+
+        self._routes: Dict[int, Tuple[Tuple[int, LogConfig], ...]] = {bit: tuple(channels)
+                                                                       for bit, channels in routes.items()}
+
+    def get_channels_with_feature(self, log_type: int) -> Tuple[Tuple[int, LogConfig], ...]:
+        value = int(log_type)
+        if value & (value - 1) == 0:
+            return self._routes.get(value, ())
+
+        # More than one flag, every one of them has to be logged
+        return tuple((key, config) for key, config in self.logging.items() if log_type in config['types'])
 
     def get(self, key):
         return self.logging.get(key, None)
 
     def remove(self, key):
         del self.logging[key]
+        self._compile()
 
 
 class CommandOverrides:
@@ -272,7 +288,7 @@ class Timer:
         self.timezone: str = timezone
 
     @classmethod
-    def from_record(cls, record: dict):
+    def from_record(cls, record: Mapping[str, Any]):
         return cls(record['id'],
                    record['event'],
                    record['created'],
@@ -287,7 +303,7 @@ class Timer:
 class GuildBotConfig:
     __slots__ = ('bot', 'guild_id', 'toggleroles', 'prefixes', 'autorole_id', 'permissions')
 
-    def __init__(self, bot: LightningBot, record):
+    def __init__(self, bot: LightningBot, record: Mapping[str, Any]):
         self.bot: LightningBot = bot
 
         self.guild_id: int = record['guild_id']
@@ -388,7 +404,8 @@ class GuildAutoModRule:
 
 
 class InfractionRecord:
-    def __init__(self, bot: LightningBot, record: Dict[str, Any]):
+    """An infraction, built from a Sanctum API response or straight from an ``infractions`` row"""
+    def __init__(self, bot: LightningBot, record: Mapping[str, Any]):
         self.id: int = record['id']
 
         self.guild = bot.get_guild(record['guild_id']) or record['guild_id']
@@ -397,7 +414,10 @@ class InfractionRecord:
 
         self.action = ActionType(record['action'])
         self.reason: str = record['reason'] or "No reason provided."
-        self.created_at = datetime.datetime.fromisoformat(record['created_at'])
+        created_at = record['created_at']
+        # Rows already have a datetime, API responses have an ISO 8601 string
+        self.created_at = created_at if isinstance(created_at, datetime.datetime) else \
+            datetime.datetime.fromisoformat(created_at)
         self.active: bool = record['active']
         self.extra: dict[str, Any] = record['extra']
 
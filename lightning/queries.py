@@ -0,0 +1,30 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Statements run on hot paths (events, checks, config lookups).
+# These are prepared on every new pool connection and their cache hits are tracked under the names below.
+from lightning.utils.database import statements
+
+__all__ = ("GET_GUILD_CONFIG", "GET_GUILD_MOD_CONFIG", "GET_PUNISHMENT_ROLES", "GET_WARN_COUNT", "GET_FIRST_SPOKE")
+
+GET_GUILD_CONFIG = statements.register("guild_config", "SELECT * FROM guild_config WHERE guild_id=$1;")
+GET_GUILD_MOD_CONFIG = statements.register("guild_mod_config", "SELECT * FROM guild_mod_config WHERE guild_id=$1;")
+GET_PUNISHMENT_ROLES = statements.register("punishment_roles",
+                                           "SELECT punishment_roles FROM roles WHERE guild_id=$1 AND user_id=$2;")
+GET_WARN_COUNT = statements.register("warn_count", "SELECT COUNT(*) FROM infractions WHERE user_id=$1 AND "
+                                                   "guild_id=$2 AND action=$3;")
+GET_FIRST_SPOKE = statements.register("first_spoke",
+                                      "SELECT first_spoke_at FROM spoke_tracking WHERE guild_id=$1 AND user_id=$2;")
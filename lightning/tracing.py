@@ -0,0 +1,192 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import collections
+import contextlib
+import functools
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Deque, Iterator, List, Optional, Tuple
+
+from lightning.metrics import COMMAND_STAGE_HIST, TimingWindow
+
+if TYPE_CHECKING:
+    from discord.http import HTTPClient
+
+__all__ = ("Span", "Trace", "Tracer", "current_trace", "span", "instrument_http")
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_depth: ContextVar[int] = ContextVar("_current_depth", default=0)
+
+
+class Span:
+    """A timed stage of a command invocation.
+
+    Attributes
+    ----------
+    name : str
+        The stage's name. This is used as a metric label, so it should have a small set of values.
+    detail : Optional[str]
+        Extra information for trace dumps, such as the route of an HTTP request.
+    start : float
+        When the span started, relative to the start of the trace.
+    duration : float
+        How long the span took.
+    depth : int
+        How many spans this span is nested in.
+    """
+    __slots__ = ("name", "detail", "start", "duration", "depth")
+
+    def __init__(self, name: str, detail: Optional[str], start: float, duration: float, depth: int) -> None:
+        self.name = name
+        self.detail = detail
+        self.start = start
+        self.duration = duration
+        self.depth = depth
+
+    def __repr__(self) -> str:
+        return f"<Span name={self.name!r} duration={self.duration}>"
+
+
+class Trace:
+    """The spans recorded while processing a single command message"""
+    __slots__ = ("command", "started_at", "start", "duration", "spans", "failed", "finished")
+
+    def __init__(self) -> None:
+        self.command: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+        self.failed = False
+        self.finished = False
+
+    def add_span(self, name: str, start: float, duration: float, *, detail: Optional[str] = None) -> None:
+        # Tasks spawned by a command can outlive it, their spans aren't part of the command anymore.
+        if self.finished:
+            return
+        self.spans.append(Span(name, detail, start - self.start, duration, _current_depth.get()))
+
+    def render(self) -> str:
+        """Renders the trace as an indented tree of spans"""
+        header = f"{self.command} took {self.duration * 1000:.1f}ms at {self.started_at.isoformat()}"
+        if self.failed:
+            header += " (failed)"
+
+        lines = [header]
+        for s in sorted(self.spans, key=lambda s: (s.start, s.depth)):
+            name = f"{'  ' * (s.depth + 1)}{s.name}"
+            offset = f"+{s.start * 1000:.1f}ms"
+            line = f"{name:<30} {offset:>10} {s.duration * 1000:>9.1f}ms"
+            if s.detail:
+                line += f"  {s.detail}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"<Trace command={self.command!r} duration={self.duration} spans={len(self.spans)}>"
+
+
+@contextlib.contextmanager
+def span(name: str, *, detail: Optional[str] = None) -> Iterator[None]:
+    """Times the wrapped block as a span of the current trace. This does nothing outside of a trace."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    depth = _current_depth.get()
+    token = _current_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_depth.reset(token)
+        trace.add_span(name, start, time.perf_counter() - start, detail=detail)
+
+
+def instrument_http(http: HTTPClient) -> None:
+    """Wraps a :class:`discord.http.HTTPClient` so requests made during a trace are recorded as spans"""
+    request = http.request
+
+    @functools.wraps(request)
+    async def traced(route, **kwargs) -> Any:
+        if current_trace.get() is None:
+            return await request(route, **kwargs)
+
+        with span("discord", detail=f"{route.method} {route.path}"):
+            return await request(route, **kwargs)
+
+    http.request = traced  # type: ignore
+
+
+class Tracer:
+    """Collects finished traces.
+
+    Every trace's spans are exported to the stage histogram and kept in a per-minute window. A sample of traces, along
+    with every trace slower than ``slow_threshold``, is kept around so it can be dumped later.
+
+    Parameters
+    ----------
+    sample_rate : float
+        The fraction of traces to keep, between 0 and 1.
+    slow_threshold : float
+        Traces that took longer than this many seconds are always kept.
+    history : int
+        How many traces to keep.
+    """
+    def __init__(self, *, sample_rate: float = 0.01, slow_threshold: float = 2.0, history: int = 50) -> None:
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.traces: Deque[Trace] = collections.deque(maxlen=history)
+        # (command, stage) -> timings for the last hour
+        self.stage_timings: TimingWindow[Tuple[str, str]] = TimingWindow()
+
+    def start(self) -> Tuple[Trace, Any]:
+        """Starts a trace in the current context. The returned token must be passed to :meth:`finish`."""
+        trace = Trace()
+        return trace, current_trace.set(trace)
+
+    def discard(self, token: Any) -> None:
+        """Stops tracing in the current context without recording anything"""
+        trace = current_trace.get()
+        if trace is not None:
+            trace.finished = True
+        current_trace.reset(token)
+
+    def finish(self, trace: Trace, token: Any, *, command: str, failed: bool = False) -> None:
+        trace.duration = time.perf_counter() - trace.start
+        trace.command = command
+        trace.failed = failed
+        trace.finished = True
+        current_trace.reset(token)
+
+        self.stage_timings.record((command, "total"), trace.duration, failed=failed)
+        for s in trace.spans:
+            COMMAND_STAGE_HIST.labels(s.name).observe(s.duration)
+            self.stage_timings.record((command, s.name), s.duration)
+
+        if trace.duration >= self.slow_threshold or random.random() < self.sample_rate:
+            self.traces.append(trace)
+
+    def find(self, command: Optional[str] = None, *, limit: int = 5) -> List[Trace]:
+        """Returns the most recent kept traces, optionally only those of a command"""
+        traces = [t for t in reversed(self.traces) if command is None or t.command == command]
+        return traces[:limit]
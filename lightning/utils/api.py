@@ -0,0 +1,408 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import re
+import time
+from typing import Any, Collection, Dict, Hashable, Optional, Tuple
+
+import aiohttp
+import orjson
+from lru import LRU
+from prometheus_client import Counter, Gauge, Histogram
+from sanctum import HTTPClient
+from sanctum.exceptions import HTTPException, NotFound
+
+from lightning import tracing
+from lightning.metrics import TimingStat
+
+__all__ = ("APIUnavailable", "CircuitBreaker", "EndpointStat", "CachedHTTPClient", "DEFAULT_TTLS",
+           "IDEMPOTENT_ROUTES", "endpoint_of")
+log = logging.getLogger(__name__)
+
+API_LATENCY_HIST = Histogram("lightning_api_request_latency", "Time it takes for a Sanctum API request to finish",
+                             ['method', 'endpoint'])
+API_ERRORS_COUNTER = Counter("lightning_api_request_errors", "Sanctum API requests that failed",
+                             ['method', 'endpoint', 'status'])
+API_CACHE_COUNTER = Counter("lightning_api_cache", "Sanctum API cache lookups", ['endpoint', 'result'])
+API_BREAKER_GAUGE = Gauge("lightning_api_circuit_breaker", "State of the Sanctum API circuit breaker "
+                                                           "(0 is closed, 1 is half-open, 2 is open)")
+
+# How long, in seconds, responses of each endpoint are cached. Endpoints that aren't listed aren't cached.
+DEFAULT_TTLS: Dict[str, float] = {
+    "/guilds/{id}": 300.0,
+    "/guilds/{id}/config": 60.0,
+    "/guilds/{id}/config/moderation": 60.0,
+    "/guilds/{id}/prefixes": 60.0,
+    "/guilds/{id}/automod": 60.0,
+    "/guilds/{id}/automod/rules": 60.0,
+    "/guilds/{id}/reports/{id}": 30.0,
+    "/guilds/{id}/infractions": 15.0,
+    "/guilds/{id}/infractions/{id}": 30.0,
+    "/guilds/{id}/users/{id}/infractions": 30.0,
+    "/timers/{id}": 15.0,
+    "/users/{id}/reminders": 15.0,
+    "/users/{id}/reminders/{id}": 15.0,
+}
+
+# Routes, besides GETs, that leave the API in the same state when they're sent twice. Most of the API's PUT routes
+# create a new row every time (timers, infractions, reports, pastes), so they're never retried.
+IDEMPOTENT_ROUTES: Tuple[Tuple[str, str], ...] = (
+    ("PUT", "/guilds/{id}"),
+    ("PUT", "/guilds/{id}/prefixes"),
+    ("PUT", "/guilds/{id}/automod/ignores"),
+    ("DELETE", "/guilds/{id}/leave"),
+    ("DELETE", "/timers/{id}"),
+    ("DELETE", "/users/{id}/reminders/{id}"),
+    ("DELETE", "/guilds/{id}/infractions/{id}"),
+    ("DELETE", "/guilds/{id}/users/{id}/infractions"),
+)
+
+_IDS = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(path: str) -> str:
+    """Replaces the IDs in a path so it can be used as a metric label and cache policy key"""
+    return _IDS.sub("/{id}", path)
+
+
+def _invalidation_prefixes(path: str) -> Tuple[str, ...]:
+    # Mutations can change any cached response of the same guild. Reminders are timers, so user reminders and timers
+    # are invalidated together.
+    parts = path.split("/", 3)
+    if len(parts) < 2:
+        return ()
+
+    if parts[1] == "guilds" and len(parts) > 2:
+        return (f"/guilds/{parts[2]}",)
+    if parts[1] == "users" and len(parts) > 2:
+        return (f"/users/{parts[2]}", "/timers")
+    if parts[1] == "timers":
+        return ("/timers", "/users")
+    return ()
+
+
+class APIUnavailable(HTTPException):
+    """Raised instead of sending a request while the circuit breaker is open"""
+    def __init__(self, path: str) -> None:
+        super().__init__(503, {"message": f"The API is currently unavailable, {path} was not requested"})
+
+
+class CircuitBreaker:
+    """Stops sending requests to a failing service for a while.
+
+    After ``threshold`` consecutive failures, the breaker opens and requests are refused. Once ``reset_timeout``
+    seconds have passed, a single trial request is let through. The breaker closes if it succeeds and opens again if
+    it fails.
+
+    Parameters
+    ----------
+    threshold : int
+        How many consecutive failures open the breaker.
+    reset_timeout : float
+        How many seconds the breaker stays open before a trial request is allowed.
+    """
+    CLOSED = "closed"
+    HALF_OPEN = "half-open"
+    OPEN = "open"
+
+    def __init__(self, *, threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a request can be sent"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+
+        # A trial request that never finished (e.g. it was cancelled) shouldn't keep the breaker half-open forever
+        now = time.monotonic()
+        if self._trial_at is None or now - self._trial_at >= self.reset_timeout:
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            log.info("Sanctum API circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_at = None
+        if self.opened_at is None and self.failures < self.threshold:
+            return
+
+        if self.opened_at is None:
+            log.warning(f"Sanctum API circuit breaker opened after {self.failures} consecutive failures")
+        self.opened_at = time.monotonic()
+
+
+class EndpointStat(TimingStat):
+    """Request timings and cache lookups of an endpoint since startup"""
+    __slots__ = ("hits", "misses", "coalesced", "stale")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+
+
+class _CacheEntry:
+    # Responses are stored serialized so every caller gets its own copy to mutate
+    __slots__ = ("payload", "not_found", "expires_at")
+
+    def __init__(self, payload: bytes, not_found: bool, expires_at: float) -> None:
+        self.payload = payload
+        self.not_found = not_found
+        self.expires_at = expires_at
+
+    def value(self) -> Any:
+        data = orjson.loads(self.payload)
+        if self.not_found:
+            raise NotFound(404, data)
+        return data
+
+
+class CachedHTTPClient(HTTPClient):
+    """A Sanctum API client that caches and coalesces reads.
+
+    - GET responses of the endpoints in ``ttls`` are cached, including 404s for ``negative_ttl`` seconds.
+    - Concurrent identical GETs share a single request.
+    - Mutating requests invalidate the cached responses they can change.
+    - GETs and the routes in ``idempotent_routes`` are retried with jittered exponential backoff on server errors,
+      timeouts and connection errors. A retried DELETE that gets a 404 already went through, so it returns None.
+    - Failing requests trip a :class:`CircuitBreaker`. While it's open, requests fail immediately with
+      :class:`APIUnavailable` and cached reads are served even if they expired.
+
+    Parameters
+    ----------
+    api_url : str
+        The API's URL.
+    token : str
+        The API key.
+    ttls : Optional[Dict[str, float]]
+        Cache TTLs by endpoint, as returned by :func:`endpoint_of`. Defaults to :data:`DEFAULT_TTLS`.
+    negative_ttl : float
+        How many seconds 404 responses are cached for.
+    max_entries : int
+        The maximum amount of cached responses.
+    request_timeout : float
+        How many seconds a single attempt of a request can take.
+    idempotent_routes : Optional[Collection[Tuple[str, str]]]
+        The methods and endpoints, besides GETs, that are safe to retry. Defaults to :data:`IDEMPOTENT_ROUTES`.
+    max_retries : int
+        How many times an idempotent request is retried.
+    retry_backoff : float
+        The base delay between retries, in seconds.
+    breaker_threshold : int
+        How many consecutive failures open the circuit breaker.
+    breaker_timeout : float
+        How many seconds the circuit breaker stays open.
+    """
+    def __init__(self, api_url: str, token: str, *, ttls: Optional[Dict[str, float]] = None,
+                 negative_ttl: float = 10.0, max_entries: int = 4096, request_timeout: float = 10.0,
+                 idempotent_routes: Optional[Collection[Tuple[str, str]]] = None, max_retries: int = 2,
+                 retry_backoff: float = 0.25, breaker_threshold: int = 5, breaker_timeout: float = 30.0) -> None:
+        super().__init__(api_url, token)
+        self.ttls = DEFAULT_TTLS.copy() if ttls is None else ttls
+        self.negative_ttl = negative_ttl
+        self.request_timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self.idempotent_routes = frozenset(IDEMPOTENT_ROUTES if idempotent_routes is None else idempotent_routes)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = CircuitBreaker(threshold=breaker_threshold, reset_timeout=breaker_timeout)
+        self.stats: Dict[str, EndpointStat] = {}
+
+        self._cache = LRU(max_entries)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Bumped on every invalidation so reads that started before a mutation don't cache what they got
+        self._generation = 0
+
+        states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        API_BREAKER_GAUGE.set_function(lambda: states[self.breaker.state])
+
+    def _get_stat(self, method: str, endpoint: str) -> EndpointStat:
+        key = f"{method} {endpoint}"
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = EndpointStat()
+        return stat
+
+    def invalidate(self, prefix: str) -> int:
+        """Removes the cached responses of ``prefix`` and every path under it.
+
+        Returns
+        -------
+        int
+            How many responses were removed.
+        """
+        self._generation += 1
+        keys = [key for key in self._cache.keys() if key[0] == prefix or key[0].startswith(f"{prefix}/")]
+        for key in keys:
+            del self._cache[key]
+        return len(keys)
+
+    def clear_cache(self) -> None:
+        self._generation += 1
+        self._cache.clear()
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> Any:
+        endpoint = endpoint_of(path)
+        if method != "GET":
+            try:
+                return await self._send(method, path, endpoint, kwargs)
+            finally:
+                for prefix in _invalidation_prefixes(path):
+                    self.invalidate(prefix)
+
+        ttl = self.ttls.get(endpoint)
+        if ttl is None:
+            return await self._send(method, path, endpoint, kwargs)
+
+        stat = self._get_stat(method, endpoint)
+        params = kwargs.get("params")
+        key = (path, tuple(sorted(params.items())) if params else ())
+
+        entry: Optional[_CacheEntry] = self._cache.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            stat.hits += 1
+            API_CACHE_COUNTER.labels(endpoint, "hit").inc()
+            return entry.value()
+
+        task = self._inflight.get(key)
+        if task is None:
+            stat.misses += 1
+            API_CACHE_COUNTER.labels(endpoint, "miss").inc()
+            # The request runs in its own task so one caller being cancelled doesn't fail the others
+            task = asyncio.ensure_future(self._fetch(key, path, endpoint, kwargs, ttl, entry))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        else:
+            stat.coalesced += 1
+            API_CACHE_COUNTER.labels(endpoint, "coalesced").inc()
+
+        return (await asyncio.shield(task)).value()
+
+    def _fetch_done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Retrieve the exception so it isn't logged when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, key: Hashable, path: str, endpoint: str, kwargs: Dict[str, Any], ttl: float,
+                     stale: Optional[_CacheEntry]) -> _CacheEntry:
+        generation = self._generation
+        try:
+            data = await self._send("GET", path, endpoint, kwargs)
+        except NotFound as e:
+            entry = _CacheEntry(orjson.dumps(e.data), True, time.monotonic() + self.negative_ttl)
+        except (HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if stale is None or not _is_outage(e):
+                raise
+
+            self._get_stat("GET", endpoint).stale += 1
+            API_CACHE_COUNTER.labels(endpoint, "stale").inc()
+            log.debug(f"Serving a stale response for {path} ({e!r})")
+            return stale
+        else:
+            entry = _CacheEntry(orjson.dumps(data), False, time.monotonic() + ttl)
+
+        if generation == self._generation:
+            self._cache[key] = entry
+        return entry
+
+    async def _perform(self, method: str, path: str, **kwargs: Any) -> Any:
+        """Sends a single attempt of a request. Subclasses can override this to change how requests are made."""
+        return await super().request(method, path, **kwargs)
+
+    async def _send(self, method: str, path: str, endpoint: str, kwargs: Dict[str, Any]) -> Any:
+        kwargs.setdefault("timeout", self.request_timeout)
+        stat = self._get_stat(method, endpoint)
+        idempotent = method == "GET" or (method, endpoint) in self.idempotent_routes
+        attempts = self.max_retries + 1 if idempotent else 1
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                API_ERRORS_COUNTER.labels(method, endpoint, "circuit_open").inc()
+                raise APIUnavailable(path)
+
+            start = time.perf_counter()
+            try:
+                with tracing.span("sanctum", detail=f"{method} {path}"):
+                    data = await self._perform(method, path, **kwargs)
+            except (HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                duration = time.perf_counter() - start
+                stat.add(duration, True)
+                API_LATENCY_HIST.labels(method, endpoint).observe(duration)
+                API_ERRORS_COUNTER.labels(method, endpoint, _status_of(e)).inc()
+                if not _is_outage(e):
+                    # The API answered, it just didn't like the request
+                    self.breaker.record_success()
+                    if attempt and method == "DELETE" and isinstance(e, NotFound):
+                        # An earlier attempt deleted it, we just never got the response
+                        return None
+                    raise
+
+                self.breaker.record_failure()
+                if attempt + 1 == attempts:
+                    raise
+
+                delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                log.debug(f"{method} {path} failed ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                duration = time.perf_counter() - start
+                stat.add(duration)
+                API_LATENCY_HIST.labels(method, endpoint).observe(duration)
+                self.breaker.record_success()
+                return data
+
+
+def _status_of(error: BaseException) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.status_code)
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return "connection"
+
+
+def _is_outage(error: BaseException) -> bool:
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
@@ -0,0 +1,374 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Deque, Iterable, List, Optional, Sequence, Tuple, Union
+
+import asyncpg
+import orjson
+from prometheus_client import Counter, Gauge, Histogram
+
+__all__ = ("BulkWriter", "BulkBuffer")
+log = logging.getLogger(__name__)
+
+BULK_PENDING_ROWS = Gauge("lightning_bulk_pending_rows", "Rows waiting to be written to the database", ['writer'])
+BULK_SPILLED_ROWS = Gauge("lightning_bulk_spilled_rows", "Rows spilled to disk while the database was unavailable",
+                          ['writer'])
+BULK_INSERT_LATENCY = Histogram("lightning_bulk_insert_seconds", "Time it takes to write a batch", ['writer'])
+BULK_FAILURES = Counter("lightning_bulk_insert_failures", "Batches that failed to write", ['writer', 'reason'])
+
+# Errors that mean the database is unreachable rather than that the batch itself is bad
+RETRYABLE_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                    asyncpg.CannotConnectNowError, asyncpg.TooManyConnectionsError,
+                    # The table was swapped out from under us (e.g. by a migration), asyncpg re-prepares on retry
+                    asyncpg.InvalidCachedStatementError, asyncpg.exceptions.OutdatedSchemaCacheError)
+
+
+class BulkWriter:
+    """Writes batches of rows into a table through a binary COPY.
+
+    Rows are copied into a temporary staging table that is dropped when the transaction commits and are then
+    merged into the target table with a single set-based ``INSERT``. Unlike passing rows through
+    ``jsonb_to_recordset``, nothing is serialized to text, so timestamps and integers travel in Postgres' binary
+    format end to end and there is no bind parameter limit to chunk around.
+
+    Parameters
+    ----------
+    table : str
+        The table to merge rows into.
+    columns : Sequence[str]
+        The columns, in the order each record provides them.
+    conflict : Optional[str]
+        An optional ``ON CONFLICT`` clause to append to the merge statement.
+    staging : Optional[str]
+        The name of the staging table. Defaults to ``_bulk_<table>``.
+    """
+    __slots__ = ("table", "columns", "conflict", "staging", "_merge_statements")
+
+    def __init__(self, table: str, columns: Sequence[str], *, conflict: Optional[str] = None,
+                 staging: Optional[str] = None) -> None:
+        self.table = table
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.conflict = conflict
+        self.staging = staging or f"_bulk_{table}"
+        self._merge_statements = []
+
+    @property
+    def _column_list(self) -> str:
+        return ", ".join(self.columns)
+
+    @property
+    def create_staging_query(self) -> str:
+        # CREATE TABLE AS copies the column types but none of the constraints (NOT NULL, identity, etc.)
+        return f"""CREATE TEMPORARY TABLE {self.staging} ON COMMIT DROP AS
+                   SELECT {self._column_list} FROM {self.table} WITH NO DATA;"""
+
+    @property
+    def merge_query(self) -> str:
+        query = f"""INSERT INTO {self.table} ({self._column_list})
+                    SELECT {self._column_list} FROM {self.staging}"""
+        if self.conflict:
+            query += f"\n{self.conflict}"
+        return query
+
+    def add_merge_statement(self, query: str) -> None:
+        """Registers an extra statement that runs after the merge, inside the same transaction.
+
+        The statement can read the batch through the staging table by using ``{staging}`` in the query.
+
+        Parameters
+        ----------
+        query : str
+            The statement to run.
+        """
+        self._merge_statements.append(query)
+
+    async def write(self, conn: Union[asyncpg.Connection, asyncpg.Pool],
+                    records: Iterable[Sequence]) -> int:
+        """Copies records into the staging table and merges them into the target table.
+
+        Parameters
+        ----------
+        conn : Union[asyncpg.Connection, asyncpg.Pool]
+            The connection (or pool to acquire a connection from) to write with.
+        records : Iterable[Sequence]
+            The rows to write. Each row must provide values in the same order as :attr:`columns`.
+
+        Returns
+        -------
+        int
+            The amount of rows copied.
+        """
+        records = records if isinstance(records, list) else list(records)
+        if not records:
+            return 0
+
+        if isinstance(conn, asyncpg.Pool):
+            async with conn.acquire() as connection:
+                return await self._write(connection, records)
+
+        return await self._write(conn, records)
+
+    async def _write(self, connection: asyncpg.Connection, records: list) -> int:
+        async with connection.transaction():
+            await connection.execute(self.create_staging_query)
+            await connection.copy_records_to_table(self.staging, records=records, columns=self.columns)
+            await connection.execute(self.merge_query)
+            for statement in self._merge_statements:
+                await connection.execute(statement.format(staging=self.staging))
+
+        log.debug(f"Copied {len(records)} rows into {self.table}")
+        return len(records)
+
+
+def _spill_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return {"__datetime__": obj.isoformat()}
+    raise TypeError
+
+
+def _spill_decode(value: Any) -> Any:
+    if isinstance(value, dict) and "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    return value
+
+
+class BulkBuffer:
+    """A double-buffered batch of rows that is periodically written with a :class:`BulkWriter`.
+
+    Producers append to the live buffer without waiting on anything. :meth:`flush` swaps the buffer out and writes
+    it, so the database round trip never holds up producers.
+
+    Batches that fail because the database is unreachable are kept and retried on the next flush. Once more than
+    ``max_pending_rows`` are waiting, the oldest batches are spilled to ``spill_path`` and replayed after the
+    database comes back. Batches that fail for any other reason are dropped, except for spilled rows, which are
+    kept in a quarantine file.
+
+    Parameters
+    ----------
+    writer : BulkWriter
+        The writer to write batches with.
+    name : str
+        A name for logs and metrics.
+    max_pending_rows : int
+        The amount of rows to keep in memory for retrying.
+    spill_path : Optional[str]
+        The file to spill rows to. If not provided, rows over the limit are dropped instead.
+    replay_chunk_size : int
+        The amount of spilled rows to write at once when replaying. Chunks the database rejects are moved to
+        ``<spill_path>.rejected`` instead of being dropped.
+    """
+
+    def __init__(self, writer: BulkWriter, *, name: str, max_pending_rows: int = 50_000,
+                 spill_path: Optional[str] = None, replay_chunk_size: int = 5000) -> None:
+        self.writer = writer
+        self.name = name
+        self.max_pending_rows = max_pending_rows
+        self.spill_path = spill_path
+        self.replay_chunk_size = replay_chunk_size
+
+        self._buffer: List[Sequence] = []
+        self._pending: Deque[List[Sequence]] = collections.deque()
+        self._pending_rows = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buffer) + self._pending_rows
+
+    def append(self, record: Sequence) -> None:
+        """Adds a row to the live buffer."""
+        self._buffer.append(record)
+
+    @property
+    def has_spilled_rows(self) -> bool:
+        """Whether there are rows on disk that still need to be replayed"""
+        if not self.spill_path:
+            return False
+        return os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")
+
+    def _update_metrics(self) -> None:
+        BULK_PENDING_ROWS.labels(writer=self.name).set(len(self))
+
+    async def flush(self, conn: Union[asyncpg.Connection, asyncpg.Pool]) -> int:
+        """Writes the live buffer and any batches waiting to be retried.
+
+        Parameters
+        ----------
+        conn : Union[asyncpg.Connection, asyncpg.Pool]
+            The connection or pool to write with.
+
+        Returns
+        -------
+        int
+            The amount of rows written.
+        """
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                self._pending.append(batch)
+                self._pending_rows += len(batch)
+
+            total = 0
+            try:
+                while self._pending:
+                    total += await self._write(conn, self._pending[0])
+                    self._pending_rows -= len(self._pending.popleft())
+
+                if self.has_spilled_rows:
+                    total += await self._replay_spill(conn)
+            except RETRYABLE_ERRORS as e:
+                BULK_FAILURES.labels(writer=self.name, reason="unavailable").inc()
+                log.warning(f"Unable to write {self._pending_rows} {self.name} rows, retrying later. ({e!r})")
+                await self._enforce_limit()
+            finally:
+                self._update_metrics()
+
+            return total
+
+    async def _insert(self, conn, batch: List[Sequence]) -> int:
+        start = time.perf_counter()
+        total = await self.writer.write(conn, batch)
+        BULK_INSERT_LATENCY.labels(writer=self.name).observe(time.perf_counter() - start)
+        return total
+
+    async def _write(self, conn, batch: List[Sequence]) -> int:
+        try:
+            return await self._insert(conn, batch)
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            # Retrying a batch the database rejected will never succeed
+            BULK_FAILURES.labels(writer=self.name, reason="rejected").inc()
+            log.exception(f"Dropping a batch of {len(batch)} {self.name} rows", exc_info=e)
+            return 0
+
+    async def _enforce_limit(self) -> None:
+        spill: List[Sequence] = []
+        while self._pending_rows > self.max_pending_rows and len(self._pending) > 1:
+            batch = self._pending.popleft()
+            self._pending_rows -= len(batch)
+            spill.extend(batch)
+
+        if spill:
+            await self._spill(spill)
+
+    async def spill(self) -> None:
+        """Moves everything that is still waiting to be written to disk."""
+        async with self._lock:
+            rows = [row for batch in self._pending for row in batch]
+            rows.extend(self._buffer)
+            self._pending.clear()
+            self._pending_rows = 0
+            self._buffer = []
+
+            if rows:
+                await self._spill(rows)
+            self._update_metrics()
+
+    async def _spill(self, rows: List[Sequence]) -> None:
+        if not self.spill_path:
+            log.warning(f"Dropping {len(rows)} {self.name} rows, there is no spill file configured.")
+            return
+
+        def dump():
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "ab") as fp:
+                for row in rows:
+                    fp.write(orjson.dumps(row, default=_spill_default, option=orjson.OPT_PASSTHROUGH_DATETIME))
+                    fp.write(b"\n")
+
+        await asyncio.get_running_loop().run_in_executor(None, dump)
+        BULK_SPILLED_ROWS.labels(writer=self.name).inc(len(rows))
+        log.info(f"Spilled {len(rows)} {self.name} rows to {self.spill_path}")
+
+    def _read_spill_chunk(self, path: str, offset: int) -> Tuple[List[bytes], int]:
+        lines = []
+        with open(path, "rb") as fp:
+            fp.seek(offset)
+            while len(lines) < self.replay_chunk_size:
+                line = fp.readline()
+                if not line:
+                    break
+                if line.strip():
+                    lines.append(line)
+            return lines, fp.tell()
+
+    async def _replay_spill(self, conn) -> int:
+        # Claim the file first so rows spilled while we are writing go to a fresh file
+        replaying = f"{self.spill_path}.replay"
+        if not os.path.exists(replaying):
+            os.replace(self.spill_path, replaying)
+
+        # How far into the file has been written already, so a replay interrupted by an outage resumes from there
+        progress = f"{replaying}.offset"
+        rejected_path = f"{self.spill_path}.rejected"
+
+        def read_offset() -> int:
+            try:
+                with open(progress) as fp:
+                    return int(fp.read() or 0)
+            except FileNotFoundError:
+                return 0
+
+        def save_offset(offset: int) -> None:
+            with open(progress, "w") as fp:
+                fp.write(str(offset))
+
+        def quarantine(lines: List[bytes]) -> None:
+            with open(rejected_path, "ab") as fp:
+                fp.writelines(lines)
+
+        loop = asyncio.get_running_loop()
+        offset = await loop.run_in_executor(None, read_offset)
+        total = rejected = 0
+        while True:
+            lines, next_offset = await loop.run_in_executor(None, self._read_spill_chunk, replaying, offset)
+            if not lines:
+                break
+
+            try:
+                rows = [[_spill_decode(value) for value in orjson.loads(line)] for line in lines]
+                total += await self._insert(conn, rows)
+            except RETRYABLE_ERRORS:
+                raise
+            except Exception as e:
+                BULK_FAILURES.labels(writer=self.name, reason="rejected").inc()
+                log.exception(f"Moving {len(lines)} spilled {self.name} rows the database rejected to "
+                              f"{rejected_path}", exc_info=e)
+                await loop.run_in_executor(None, quarantine, lines)
+                rejected += len(lines)
+
+            offset = next_offset
+            await loop.run_in_executor(None, save_offset, offset)
+
+        os.remove(replaying)
+        if os.path.exists(progress):
+            os.remove(progress)
+        BULK_SPILLED_ROWS.labels(writer=self.name).set(0)
+
+        if rejected:
+            log.warning(f"Replayed {total} spilled {self.name} rows, {rejected} were rejected and kept in "
+                        f"{rejected_path}")
+        elif total:
+            log.info(f"Replayed {total} spilled {self.name} rows")
+        return total
@@ -0,0 +1,387 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+
+import asyncpg
+import orjson
+from prometheus_client import Counter, Gauge, Histogram
+
+from lightning import tracing
+from lightning.metrics import TimingStat
+
+__all__ = ("InstrumentedConnection", "InstrumentedPool", "QueryStat", "QueryStatistics", "query_stats",
+           "Statement", "StatementStat", "StatementRegistry", "statements", "fingerprint", "create_instrumented_pool",
+           "encode_json", "encode_jsonb", "decode_jsonb", "set_json_codecs", "init_connection")
+log = logging.getLogger(__name__)
+
+QUERY_LATENCY_HIST = Histogram("lightning_db_query_latency", "Time it takes for a query to finish", ['query'])
+QUERY_ROWS_COUNTER = Counter("lightning_db_query_rows", "Rows returned or affected by queries", ['query'])
+QUERY_ERRORS_COUNTER = Counter("lightning_db_query_errors", "Queries that raised an exception", ['query'])
+POOL_WAIT_HIST = Histogram("lightning_db_pool_wait", "Time spent waiting to acquire a connection from the pool",
+                           buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, float("inf")))
+POOL_ACQUIRES_COUNTER = Counter("lightning_db_pool_acquires", "Connections acquired from the pool")
+POOL_WAITING_GAUGE = Gauge("lightning_db_pool_waiting", "Tasks waiting to acquire a connection from the pool")
+POOL_IN_USE_GAUGE = Gauge("lightning_db_pool_in_use", "Connections currently acquired from the pool")
+POOL_SIZE_GAUGE = Gauge("lightning_db_pool_size", "Connections currently open in the pool")
+STATEMENT_HITS_COUNTER = Counter("lightning_db_statement_cache_hits",
+                                 "Registered statements served from a connection's statement cache", ['statement'])
+STATEMENT_PREPARES_COUNTER = Counter("lightning_db_statement_prepares", "Registered statements prepared",
+                                     ['statement'])
+STATEMENT_REPREPARES_COUNTER = Counter("lightning_db_statement_reprepares",
+                                       "Registered statements prepared again on the same connection", ['statement'])
+STATEMENT_PREPARE_HIST = Histogram("lightning_db_statement_prepare_latency",
+                                   "Time it takes to prepare a registered statement", ['statement'])
+
+T = TypeVar("T")
+
+# jsonb's binary format is a version byte followed by the JSON text
+JSONB_VERSION = b"\x01"
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])-?\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(query: str) -> Tuple[str, str]:
+    """Normalizes a query so queries that only differ in literals or whitespace are grouped together.
+
+    Returns
+    -------
+    Tuple[str, str]
+        A short ID for the query, which is used as a metric label, and the normalized query.
+    """
+    normalized = " ".join(_IN_LISTS.sub("IN (?)", _LITERALS.sub("?", query)).split())
+    return hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest(), normalized
+
+
+def _redact(args: Sequence[Any]) -> str:
+    return ", ".join(f"${i}={type(arg).__name__}" for i, arg in enumerate(args, start=1))
+
+
+def _status_rows(status: Optional[str]) -> int:
+    # Command tags look like "INSERT 0 5", "UPDATE 3" or "CREATE TABLE"
+    if status:
+        count = status.rpartition(" ")[2]
+        if count.isdigit():
+            return int(count)
+    return 0
+
+
+def encode_json(value: Any) -> bytes:
+    # json.dumps turns non-str keys (like IDs) into strings, orjson needs to be told to.
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def encode_jsonb(value: Any) -> bytes:
+    return JSONB_VERSION + encode_json(value)
+
+
+def decode_jsonb(data: bytes) -> Any:
+    return orjson.loads(memoryview(data)[1:])
+
+
+async def set_json_codecs(connection: asyncpg.Connection) -> None:
+    """Sets orjson backed codecs for json and jsonb.
+
+    The codecs use the binary format so values go straight between orjson and the wire without being decoded to str.
+    """
+    await connection.set_type_codec('json', encoder=encode_json, decoder=orjson.loads, schema='pg_catalog',
+                                    format='binary')
+    await connection.set_type_codec('jsonb', encoder=encode_jsonb, decoder=decode_jsonb, schema='pg_catalog',
+                                    format='binary')
+
+
+class QueryStat(TimingStat):
+    __slots__ = ("rows", )
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rows = 0
+
+    @property
+    def rows_per_call(self) -> float:
+        return self.rows / self.count if self.count else 0.0
+
+
+class QueryStatistics:
+    """Keeps cumulative statistics for every query fingerprint since startup, similar to pg_stat_statements."""
+    def __init__(self) -> None:
+        self.queries: Dict[str, QueryStat] = {}
+        self.texts: Dict[str, str] = {}
+
+    def record(self, query: str, args: Sequence[Any], start: float, rows: int, *, failed: bool = False,
+               slow_threshold: Optional[float] = None) -> None:
+        """Records a query that started at ``start``. It's logged if it took longer than ``slow_threshold`` seconds."""
+        duration = time.perf_counter() - start
+        if isinstance(query, Statement):
+            query_id, normalized = query.name, query.normalized
+        else:
+            query_id, normalized = fingerprint(query)
+
+        stat = self.queries.get(query_id)
+        if stat is None:
+            stat = self.queries[query_id] = QueryStat()
+            self.texts[query_id] = normalized
+        stat.add(duration, failed)
+        stat.rows += rows
+
+        QUERY_LATENCY_HIST.labels(query_id).observe(duration)
+        if rows:
+            QUERY_ROWS_COUNTER.labels(query_id).inc(rows)
+        if failed:
+            QUERY_ERRORS_COUNTER.labels(query_id).inc()
+
+        if trace := tracing.current_trace.get():
+            trace.add_span("postgres", start, duration, detail=normalized[:120])
+
+        if slow_threshold is not None and duration >= slow_threshold:
+            log.warning(f"Slow query {query_id} took {duration:.3f}s ({rows} rows): {normalized} "
+                        f"[{_redact(args)}]")
+
+    def slowest(self, *, limit: int = 10, by: str = "total") -> List[Tuple[str, QueryStat]]:
+        return sorted(self.queries.items(), key=lambda item: getattr(item[1], by), reverse=True)[:limit]
+
+
+query_stats = QueryStatistics()
+
+
+class Statement(str):
+    """A query declared in a :class:`StatementRegistry`.
+
+    This is a str, so it can be passed anywhere a query is accepted. Registered statements are prepared when a
+    connection is created and are reported under their name instead of a fingerprint.
+    """
+    name: str
+    normalized: str
+
+    def __new__(cls, name: str, query: str) -> Statement:
+        self = super().__new__(cls, query)
+        self.name = name
+        self.normalized = fingerprint(query)[1]
+        return self
+
+    def __repr__(self) -> str:
+        return f"<Statement name={self.name!r}>"
+
+
+class StatementStat(TimingStat):
+    """Statement cache statistics for a registered statement. The timings are how long preparing it took."""
+    __slots__ = ("hits", "reprepares")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.hits = 0
+        self.reprepares = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.count
+        return self.hits / total if total else 0.0
+
+
+class StatementRegistry:
+    """Declares hot queries once so they can be prepared up front and tracked by name"""
+    def __init__(self) -> None:
+        self.statements: Dict[str, Statement] = {}
+        self.stats: Dict[str, StatementStat] = {}
+
+    def register(self, name: str, query: str) -> Statement:
+        """Registers a statement.
+
+        Parameters
+        ----------
+        name : str
+            A unique name for the statement. This is used as a metric label.
+        query : str
+            The statement's query.
+
+        Returns
+        -------
+        Statement
+            The registered statement.
+
+        Raises
+        ------
+        ValueError
+            Another statement is already registered under the name.
+        """
+        if name in self.statements:
+            raise ValueError(f"A statement named {name!r} is already registered")
+
+        statement = self.statements[name] = Statement(name, query)
+        self.stats[name] = StatementStat()
+        return statement
+
+    def get(self, name: str) -> Optional[Statement]:
+        return self.statements.get(name)
+
+    def __iter__(self) -> Iterator[Statement]:
+        return iter(self.statements.values())
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+
+statements = StatementRegistry()
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """A connection that records every query it runs in :data:`query_stats`.
+
+    Lookups of registered statements in the statement cache are recorded in :data:`statements`. Queries that take
+    longer than :attr:`slow_threshold` seconds are logged, which :class:`InstrumentedPool` sets for its connections.
+    """
+    slow_threshold: Optional[float] = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Names of the registered statements that have been prepared on this connection
+        self._prepared_statements: Set[str] = set()
+
+    async def _get_statement(self, query: str, timeout: Optional[float], **kwargs: Any) -> Any:
+        stat = statements.stats.get(query.name) if isinstance(query, Statement) else None
+        if stat is None:
+            return await super()._get_statement(str(query), timeout, **kwargs)
+
+        record_class = kwargs.get("record_class") or self._protocol.get_record_class()
+        cached = self._stmt_cache.get((query, record_class, kwargs.get("ignore_custom_codec", False)))
+
+        start = time.perf_counter()
+        # The protocol only accepts exact str instances
+        statement = await super()._get_statement(str(query), timeout, **kwargs)
+        if cached is not None and statement is cached:
+            stat.hits += 1
+            STATEMENT_HITS_COUNTER.labels(query.name).inc()
+            return statement
+
+        duration = time.perf_counter() - start
+        stat.add(duration)
+        STATEMENT_PREPARES_COUNTER.labels(query.name).inc()
+        STATEMENT_PREPARE_HIST.labels(query.name).observe(duration)
+        # The cache was cleared (e.g. after a schema change) or the statement was evicted from it
+        if query.name in self._prepared_statements:
+            stat.reprepares += 1
+            STATEMENT_REPREPARES_COUNTER.labels(query.name).inc()
+            log.debug(f"Re-prepared statement {query.name} in {duration * 1000:.2f}ms")
+        self._prepared_statements.add(query.name)
+        return statement
+
+    async def prepare_statements(self) -> None:
+        """Prepares every registered statement into this connection's statement cache"""
+        for statement in statements:
+            try:
+                await self._get_statement(statement, self._config.command_timeout)
+            except asyncpg.PostgresError as e:
+                log.warning(f"Unable to prepare statement {statement.name}: {e}")
+
+    async def _instrument(self, query: str, args: Sequence[Any], coro: Awaitable[T],
+                          count_rows: Callable[[T], int]) -> T:
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except BaseException:
+            query_stats.record(query, args, start, 0, failed=True, slow_threshold=self.slow_threshold)
+            raise
+
+        query_stats.record(query, args, start, count_rows(result), slow_threshold=self.slow_threshold)
+        return result
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> str:
+        return await self._instrument(query, args, super().execute(query, *args, **kwargs), _status_rows)
+
+    async def executemany(self, command: str, args: Any, **kwargs: Any) -> None:
+        # args can be any iterable, even an async one, so rows are only counted when that's free
+        rows = len(args) if hasattr(args, '__len__') else 0
+        return await self._instrument(command, (), super().executemany(command, args, **kwargs), lambda _: rows)
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> List[asyncpg.Record]:
+        return await self._instrument(query, args, super().fetch(query, *args, **kwargs), len)
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._instrument(query, args, super().fetchval(query, *args, **kwargs),
+                                      lambda value: 0 if value is None else 1)
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> Optional[asyncpg.Record]:
+        return await self._instrument(query, args, super().fetchrow(query, *args, **kwargs),
+                                      lambda record: 0 if record is None else 1)
+
+    async def fetchmany(self, query: str, args: Any, **kwargs: Any) -> List[asyncpg.Record]:
+        return await self._instrument(query, (), super().fetchmany(query, args, **kwargs), len)
+
+    async def copy_records_to_table(self, table_name: str, **kwargs: Any) -> str:
+        return await self._instrument(f"COPY {table_name}", (), super().copy_records_to_table(table_name, **kwargs),
+                                      _status_rows)
+
+
+class InstrumentedPool(asyncpg.Pool):
+    """A pool that measures how long it takes to acquire connections.
+
+    The pool's connections should be :class:`InstrumentedConnection` so queries are recorded too. Their queries that
+    take longer than ``slow_threshold`` seconds are logged.
+    """
+
+    def __init__(self, *args: Any, slow_threshold: Optional[float] = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.slow_threshold = slow_threshold
+        POOL_IN_USE_GAUGE.set_function(lambda: self.get_size() - self.get_idle_size())
+        POOL_SIZE_GAUGE.set_function(self.get_size)
+
+    async def _acquire(self, timeout: Optional[float]) -> Any:
+        start = time.perf_counter()
+        POOL_WAITING_GAUGE.inc()
+        try:
+            with tracing.span("postgres.acquire"):
+                connection = await super()._acquire(timeout)
+        finally:
+            POOL_WAITING_GAUGE.dec()
+            POOL_WAIT_HIST.observe(time.perf_counter() - start)
+
+        POOL_ACQUIRES_COUNTER.inc()
+        return connection
+
+    async def _get_new_connection(self) -> Any:
+        connection = await super()._get_new_connection()
+        if isinstance(connection, InstrumentedConnection):
+            connection.slow_threshold = self.slow_threshold
+        return connection
+
+
+async def init_connection(connection: asyncpg.Connection) -> None:
+    """Initializes a new pool connection.
+
+    This sets the json codecs and, for :class:`InstrumentedConnection`, prepares the registered statements.
+    """
+    await set_json_codecs(connection)
+    if isinstance(connection, InstrumentedConnection):
+        await connection.prepare_statements()
+
+
+def create_instrumented_pool(dsn: Optional[str] = None, *, min_size: int = 10, max_size: int = 10,
+                             max_queries: int = 50000, max_inactive_connection_lifetime: float = 300.0,
+                             **kwargs: Any) -> InstrumentedPool:
+    """Mirrors :func:`asyncpg.create_pool`, but creates an :class:`InstrumentedPool`"""
+    kwargs.setdefault("connection_class", InstrumentedConnection)
+    kwargs.setdefault("record_class", asyncpg.Record)
+    return InstrumentedPool(dsn, min_size=min_size, max_size=max_size, max_queries=max_queries,
+                            max_inactive_connection_lifetime=max_inactive_connection_lifetime, loop=None, **kwargs)
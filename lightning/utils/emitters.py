@@ -18,13 +18,140 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Optional
+import time
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
 
 import aiohttp
 import discord
+from discord.http import HTTPClient, Route
+from prometheus_client import Counter, Gauge
 
 log = logging.getLogger(__name__)
 
+EMITTER_ENTRIES_COUNTER = Counter("lightning_emitter_entries", "Log entries handled by emitters", ['result'])
+EMITTER_MESSAGES_COUNTER = Counter("lightning_emitter_messages", "Messages sent by emitters")
+EMITTERS_GAUGE = Gauge("lightning_emitters", "Emitters registered with the emitter scheduler", ['state'])
+
+MESSAGE_CONTENT_LIMIT = 2000
+MESSAGE_EMBEDS_LIMIT = 10
+MESSAGE_EMBEDS_TOTAL_LIMIT = 6000
+# Keys an entry can have and still be packed with its neighbours
+PACKABLE_KEYS = frozenset({"content", "embed", "embeds", "allowed_mentions"})
+
+
+def _merge_mentions(first: Optional[discord.AllowedMentions],
+                    second: Optional[discord.AllowedMentions]) -> Tuple[bool, Optional[discord.AllowedMentions]]:
+    if first is None or second is None:
+        return first is second, None
+
+    if (first.everyone, first.roles, first.replied_user) != (second.everyone, second.roles, second.replied_user):
+        return False, None
+
+    if isinstance(first.users, list) and isinstance(second.users, list):
+        users: Any = list({user.id: user for user in (*first.users, *second.users)}.values())
+    elif first.users == second.users:
+        users = first.users
+    else:
+        return False, None
+
+    return True, discord.AllowedMentions(everyone=first.everyone, users=users, roles=first.roles,
+                                         replied_user=first.replied_user)
+
+
+def pack_entries(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Packs consecutive log entries into as few messages as possible.
+
+    Text-only entries are joined by newlines up to the content limit and embed-only entries are combined up to 10
+    embeds per message. Entries with both, or with anything else like files, are sent on their own so their parts stay
+    together.
+
+    Parameters
+    ----------
+    entries : List[Dict[str, Any]]
+        The entries, as keyword arguments for :meth:`discord.abc.Messageable.send`.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        The messages to send, in order.
+    """
+    return [message for message, _ in _pack_entries(entries)]
+
+
+def _pack_entries(entries: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+    # Pairs each message with how many of the entries, in order, it holds
+    messages: List[Dict[str, Any]] = []
+    counts: List[int] = []
+    # Embed character total of the last message, if it only has embeds
+    embeds_length = 0
+
+    for entry in entries:
+        content = entry.get("content")
+        embeds = list(entry.get("embeds") or ())
+        if entry.get("embed"):
+            embeds.append(entry["embed"])
+
+        previous = messages[-1] if messages else None
+        packable = previous is not None and not entry.keys() - PACKABLE_KEYS and not previous.keys() - PACKABLE_KEYS
+
+        if packable and content and not embeds and previous.get("content") and not previous.get("embeds"):
+            if len(previous["content"]) + len(content) + 1 <= MESSAGE_CONTENT_LIMIT:
+                mergeable, mentions = _merge_mentions(previous.get("allowed_mentions"),
+                                                      entry.get("allowed_mentions"))
+                if mergeable:
+                    previous["content"] = f"{previous['content']}\n{content}"
+                    if mentions is not None:
+                        previous["allowed_mentions"] = mentions
+                    counts[-1] += 1
+                    continue
+        elif packable and embeds and not content and previous.get("embeds") and not previous.get("content"):
+            length = sum(len(embed) for embed in embeds)
+            if len(previous["embeds"]) + len(embeds) <= MESSAGE_EMBEDS_LIMIT and \
+                    embeds_length + length <= MESSAGE_EMBEDS_TOTAL_LIMIT:
+                previous["embeds"].extend(embeds)
+                embeds_length += length
+                counts[-1] += 1
+                continue
+
+        message = {key: value for key, value in entry.items() if key != "embed"}
+        if embeds:
+            message["embeds"] = embeds
+        elif "embeds" in message:
+            del message["embeds"]
+        if content is None:
+            message.pop("content", None)
+        embeds_length = sum(len(embed) for embed in embeds) if not content else 0
+        messages.append(message)
+        counts.append(1)
+
+    return list(zip(messages, counts))
+
+
+def ratelimit_delay(http: HTTPClient, route: Route) -> float:
+    """Returns how long until a route's rate limit bucket has room for another request.
+
+    This reads the bucket discord.py fills in from the X-RateLimit headers of previous responses. The lookup mirrors
+    :meth:`discord.http.HTTPClient.request` and returns 0 if the bucket can't be found.
+    """
+    try:
+        bucket_hash = http._bucket_hashes.get(route.key)
+        key = f"{bucket_hash or route.key}:{route.major_parameters}"
+        ratelimit = http._buckets.get(key)
+    except AttributeError:
+        return 0.0
+
+    if ratelimit is None or ratelimit.remaining > 0 or ratelimit.expires is None:
+        return 0.0
+
+    return max(0.0, ratelimit.expires - asyncio.get_running_loop().time())
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether sending a message failed in a way that's worth retrying later"""
+    if isinstance(error, discord.HTTPException):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
 
 class Emitter:
     """Base emitter"""
@@ -46,7 +173,8 @@ class Emitter:
         """
         Closes the emitter loop
         """
-        self._task.cancel()
+        if self._task:
+            self._task.cancel()
 
     def running(self) -> bool:
         return not self.closed
@@ -96,30 +224,335 @@ class WebhookEmbedEmitter(Emitter):
             await self.webhook.send(embeds=embeds)
 
 
-class TextChannelEmitter(Emitter):
-    """An emitter designed for a text channel"""
-    def __init__(self, channel: discord.TextChannel):
-        super().__init__(task_name=f"textchannel-emitter-{channel.id}")
-        self.channel = channel
+class BatchingEmitter(Emitter):
+    """An emitter that drains everything queued and packs it into as few messages as possible.
+
+    Subclasses implement :meth:`deliver` and can override :meth:`ratelimit_delay` to wait out the destination's rate
+    limit before a batch is packed, so entries that arrive meanwhile end up in the same messages.
+
+    Emitters either run their own task with :meth:`start`, or are delivered by an :class:`EmitterScheduler` once
+    they're registered with it. Deliveries are serialized by :attr:`lock`, so batches delivered from elsewhere with
+    :meth:`deliver_batch` never interleave with queued ones.
+
+    Parameters
+    ----------
+    max_size : int
+        How many entries can be queued. Entries past this are dropped and summarized.
+    """
+    def __init__(self, *, max_size: int = 1000, task_name=None):
+        super().__init__(task_name=task_name)
+        self._queue = asyncio.Queue(max_size)
+        self.dropped = 0
+        self.scheduler: Optional[EmitterScheduler] = None
+        self.scheduler_key: Optional[Hashable] = None
+        # Whether the emitter is waiting in, or being delivered by, its scheduler
+        self.scheduled = False
+        self.last_active = time.monotonic()
+        self.lock = asyncio.Lock()
+        # Whether the destination no longer exists, so nothing can be delivered to it anymore
+        self.gone = False
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or (self.scheduler is None and super().closed)
+
+    @property
+    def pending(self) -> int:
+        """How many entries are waiting to be delivered"""
+        return self._queue.qsize() + bool(self.dropped)
+
+    def close(self) -> None:
+        self._closed = True
+        super().close()
+        if self.scheduler is not None:
+            self.scheduler.discard(self)
 
     async def put(self, content=None, **kwargs):
-        await self._queue.put({'content': content, **kwargs})
+        if self._closed:
+            # Nothing would ever deliver this
+            EMITTER_ENTRIES_COUNTER.labels("dropped").inc()
+            return
+
+        try:
+            self._queue.put_nowait({'content': content, **kwargs})
+        except asyncio.QueueFull:
+            self.dropped += 1
+            EMITTER_ENTRIES_COUNTER.labels("dropped").inc()
+
+        if self.scheduler is not None:
+            self.scheduler.schedule(self)
 
     async def send(self, *args, **kwargs):
-        """Alias function for TextChannelEmitter.put"""
+        """Alias function for BatchingEmitter.put"""
         await self.put(*args, **kwargs)
 
+    def ratelimit_delay(self) -> float:
+        """Returns how many seconds to wait before the next message can be sent"""
+        return 0.0
+
+    async def deliver(self, message: Dict[str, Any]) -> bool:
+        """Sends one packed message. Subclasses should override this method.
+
+        Returns
+        -------
+        bool
+            False if sending failed in a way that's worth retrying, True if it was sent or can never be.
+        """
+        raise NotImplementedError
+
+    def drain(self, *entries: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Takes everything that is queued and packs it into messages, after any entries given"""
+        entries = list(entries)
+        while not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+
+        EMITTER_ENTRIES_COUNTER.labels("sent").inc(len(entries))
+        if self.dropped:
+            entries.append({'content': f"\N{HORIZONTAL ELLIPSIS}and {self.dropped} more events"})
+            self.dropped = 0
+
+        return pack_entries(entries)
+
+    async def flush(self, *entries: Dict[str, Any]) -> None:
+        """Delivers everything that is queued, after any entries given"""
+        async with self.lock:
+            for message in self.drain(*entries):
+                await self.deliver(message)
+                EMITTER_MESSAGES_COUNTER.inc()
+                if self.closed:
+                    return
+
+        self.last_active = time.monotonic()
+
+    async def deliver_batch(self, entries: List[Dict[str, Any]]) -> int:
+        """Packs and delivers entries that weren't queued, like ones kept elsewhere until they're delivered.
+
+        Delivery stops at the first message that fails in a way that's worth retrying, or once the emitter is closed.
+
+        Returns
+        -------
+        int
+            How many of the entries, from the start, were delivered or can never be. The rest should be kept and
+            delivered again later.
+        """
+        handled = 0
+        async with self.lock:
+            for message, count in _pack_entries(entries):
+                if not await self.deliver(message):
+                    break
+                handled += count
+                EMITTER_MESSAGES_COUNTER.inc()
+                if self.closed:
+                    break
+
+        if self.gone:
+            handled = len(entries)
+        EMITTER_ENTRIES_COUNTER.labels("sent").inc(handled)
+        self.last_active = time.monotonic()
+        return handled
+
     async def _emit(self):
         while not self.closed:
-            msg = await self._queue.get()
+            entry = await self._queue.get()
+
+            delay = self.ratelimit_delay()
+            if delay:
+                await asyncio.sleep(delay)
+
+            await self.flush(entry)
+
+
+class EmitterScheduler:
+    """Delivers batching emitters from a few shared worker tasks instead of a task per emitter.
+
+    Emitters with pending entries wait in a ready queue until a worker takes them. A worker delivers everything the
+    emitter has queued at that point. If the emitter is rate limited, it's put back in the queue once the rate limit
+    runs out, so the worker can move on to other emitters. Emitters that stay idle for ``idle_timeout`` seconds are
+    unregistered so their state can be freed.
+
+    Parameters
+    ----------
+    workers : int
+        How many emitters can be delivering at once. Eight is plenty to keep up with Discord's global rate limit of
+        50 requests per second.
+    idle_timeout : float
+        How long, in seconds, an emitter can go without entries before it's unregistered.
+    """
+    def __init__(self, *, workers: int = 8, idle_timeout: float = 600.0) -> None:
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.emitters: Dict[Hashable, BatchingEmitter] = {}
+        self._ready: asyncio.Queue[BatchingEmitter] = asyncio.Queue()
+        self._active: Set[BatchingEmitter] = set()
+        self._tasks: List[asyncio.Task] = []
+
+        EMITTERS_GAUGE.labels("active").set_function(lambda: self.active)
+        EMITTERS_GAUGE.labels("idle").set_function(lambda: self.idle)
+
+    @property
+    def active(self) -> int:
+        """How many emitters have entries waiting or are delivering them"""
+        return len(self._active)
+
+    @property
+    def idle(self) -> int:
+        """How many registered emitters have nothing to deliver"""
+        return sum(not emitter.scheduled for emitter in self.emitters.values())
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(), name=f"emitter-scheduler-worker-{i}")
+                       for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reap_loop(), name="emitter-scheduler-reaper"))
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        for emitter in list(self.emitters.values()):
+            emitter.close()
+
+    def get(self, key: Hashable) -> Optional[BatchingEmitter]:
+        return self.emitters.get(key)
+
+    def add(self, key: Hashable, emitter: BatchingEmitter) -> BatchingEmitter:
+        """Registers an emitter. Any emitter already registered under the key is closed."""
+        previous = self.emitters.get(key)
+        if previous is not None and previous is not emitter:
+            previous.close()
+
+        emitter.scheduler = self
+        emitter.scheduler_key = key
+        self.emitters[key] = emitter
+        if emitter.pending:
+            self.schedule(emitter)
+        return emitter
+
+    def discard(self, emitter: BatchingEmitter) -> None:
+        """Unregisters an emitter"""
+        if self.emitters.get(emitter.scheduler_key) is emitter:
+            del self.emitters[emitter.scheduler_key]
+
+    def schedule(self, emitter: BatchingEmitter) -> None:
+        """Queues an emitter for delivery, unless it's queued already"""
+        if emitter.scheduled or emitter.closed:
+            return
+
+        emitter.scheduled = True
+        self._active.add(emitter)
+        self._ready.put_nowait(emitter)
+
+    def _unschedule(self, emitter: BatchingEmitter) -> None:
+        emitter.scheduled = False
+        self._active.discard(emitter)
+
+    def reap(self) -> int:
+        """Closes and unregisters emitters that have been idle for longer than ``idle_timeout``.
+
+        Emitters that are queued, have entries waiting or are in the middle of a delivery are never idle.
+
+        Returns
+        -------
+        int
+            How many emitters were unregistered.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [emitter for emitter in self.emitters.values()
+                if not emitter.scheduled and not emitter.pending and not emitter.lock.locked()
+                and emitter.last_active < cutoff]
+        for emitter in idle:
+            # Closing keeps anything still holding on to the emitter from using it alongside its replacement
+            emitter.close()
+        return len(idle)
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            if reaped := self.reap():
+                log.debug(f"Reaped {reaped} idle emitters")
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            emitter = await self._ready.get()
+            if emitter.closed:
+                self._unschedule(emitter)
+                continue
+
+            delay = emitter.ratelimit_delay()
+            if delay:
+                # Entries that arrive while waiting are delivered with the rest
+                loop.call_later(delay, self._ready.put_nowait, emitter)
+                continue
 
             try:
-                await self.channel.send(**msg)
-            except discord.NotFound:
-                self.close()
-            except (asyncio.TimeoutError, aiohttp.ClientError, discord.HTTPException):
-                pass
-
-            # Rough estimate to wait before sending again without hitting ratelimits.
-            # We may need to rethink this...
-            await asyncio.sleep(0.7)
+                await emitter.flush()
+            except Exception as e:
+                log.exception("An exception occurred while delivering an emitter's entries", exc_info=e)
+
+            if emitter.pending and not emitter.closed:
+                # More entries arrived while delivering, go to the back of the queue
+                self._ready.put_nowait(emitter)
+            else:
+                self._unschedule(emitter)
+
+
+class TextChannelEmitter(BatchingEmitter):
+    """An emitter designed for a text channel"""
+    def __init__(self, channel: discord.TextChannel, *, max_size: int = 1000):
+        super().__init__(max_size=max_size, task_name=f"textchannel-emitter-{channel.id}")
+        self.channel = channel
+        self._route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel.id)
+
+    def ratelimit_delay(self) -> float:
+        return ratelimit_delay(self.channel._state.http, self._route)
+
+    async def deliver(self, message: Dict[str, Any]) -> bool:
+        try:
+            await self.channel.send(**message)
+        except discord.NotFound:
+            self.gone = True
+            self.close()
+        except (asyncio.TimeoutError, aiohttp.ClientError, discord.HTTPException) as e:
+            return not is_transient(e)
+        return True
+
+
+class WebhookChannelEmitter(TextChannelEmitter):
+    """An emitter that delivers to a text channel through one of its webhooks.
+
+    Webhooks have their own rate limit buckets. If the webhook gets deleted, the emitter falls back to sending as the
+    bot in the channel.
+
+    Parameters
+    ----------
+    channel : discord.TextChannel
+        The channel the webhook posts in.
+    url : str
+        The webhook's URL.
+    session : aiohttp.ClientSession
+        The session to send requests with. This should be shared between emitters.
+    """
+    def __init__(self, channel: discord.TextChannel, url: str, *, session: aiohttp.ClientSession,
+                 max_size: int = 1000):
+        super().__init__(channel, max_size=max_size)
+        self.webhook_url = url
+        self.webhook: Optional[discord.Webhook] = discord.Webhook.from_url(url, session=session)
+
+    def ratelimit_delay(self) -> float:
+        # The webhook adapter waits out its own rate limits while sending
+        return 0.0 if self.webhook else super().ratelimit_delay()
+
+    async def deliver(self, message: Dict[str, Any]) -> bool:
+        if self.webhook is None:
+            return await super().deliver(message)
+
+        try:
+            await self.webhook.send(**message)
+        except discord.NotFound:
+            log.info(f"Webhook for channel {self.channel.id} is gone, sending as the bot instead")
+            self.webhook = None
+            return await super().deliver(message)
+        except (asyncio.TimeoutError, aiohttp.ClientError, discord.HTTPException) as e:
+            return not is_transient(e)
+        return True
@@ -15,10 +15,9 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import asyncio
-import json
 import logging
 import subprocess
-from typing import Optional, Union
+from typing import Optional, Type, Union
 
 import aiohttp
 import asyncpg
@@ -26,6 +25,9 @@ import discord
 
 from lightning import errors
 from lightning.constants import Emoji
+from lightning.utils.database import (InstrumentedPool,
+                                      create_instrumented_pool,
+                                      init_connection)
 
 log = logging.getLogger(__name__)
 
@@ -109,14 +111,19 @@ async def run_in_shell(command: str):
     return stdout.decode('utf-8'), stderr.decode('utf-8')
 
 
-async def create_pool(dsn: str, **kwargs) -> asyncpg.Pool:
-    """Creates a connection pool with type codecs for json and jsonb"""
+async def create_pool(dsn: str, *, slow_query_threshold: Optional[float] = None,
+                      record_class: Type[asyncpg.Record] = asyncpg.Record, **kwargs) -> InstrumentedPool:
+    """Creates an instrumented connection pool with orjson codecs for json and jsonb.
 
-    async def init(connection: asyncpg.Connection):
-        await connection.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
-        await connection.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+    Statements registered in :mod:`lightning.queries` are prepared on every new connection. Queries that take longer
+    than ``slow_query_threshold`` seconds are logged.
 
-    return await asyncpg.create_pool(dsn, init=init, **kwargs)
+    Rows are returned as ``record_class``, which must subclass :class:`asyncpg.Record`. The hot models
+    (:class:`~lightning.models.GuildBotConfig`, :meth:`~lightning.models.Timer.from_record` and
+    :class:`~lightning.models.InfractionRecord`) build straight from any record class, without copying rows to dicts.
+    """
+    return await create_instrumented_pool(dsn, init=init_connection, slow_threshold=slow_query_threshold,
+                                          record_class=record_class, **kwargs)
 
 
 async def safe_delete(message) -> bool:
@@ -0,0 +1,424 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import secrets
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Pattern, Tuple
+
+import asyncpg
+import orjson
+from sanctum.exceptions import DataConflict, HTTPException, NotFound
+
+from lightning.utils.api import CachedHTTPClient
+
+__all__ = ("LocalHTTPClient", "routes")
+
+Handler = Callable[..., Awaitable[Any]]
+routes: List[Tuple[str, Pattern[str], Handler]] = []
+
+_PARAMETERS = re.compile(r"{(\w+)}")
+
+
+def route(method: str, template: str) -> Callable[[Handler], Handler]:
+    """Registers a handler for an API route. Parameters ending in ``_id`` only match IDs."""
+    def repl(match: re.Match) -> str:
+        name = match.group(1)
+        return f"(?P<{name}>\\d+)" if name.endswith("_id") else f"(?P<{name}>[^/]+)"
+
+    pattern = re.compile(_PARAMETERS.sub(repl, template))
+
+    def decorator(func: Handler) -> Handler:
+        routes.append((method, pattern, func))
+        return func
+    return decorator
+
+
+def _not_found(record: Any) -> Any:
+    if not record:
+        raise NotFound(404, {"message": "Not Found"})
+    return record
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _updates(data: Dict[str, Any], columns: Tuple[str, ...], *, start: int) -> Tuple[str, List[Any]]:
+    # Builds a SET clause out of the allowed columns in a PATCH payload
+    keys = [key for key in columns if key in data]
+    if not keys:
+        raise HTTPException(400, {"message": "Nothing to update"})
+    clause = ", ".join(f'"{key}"=${i}' for i, key in enumerate(keys, start=start))
+    return clause, [data[key] for key in keys]
+
+
+class LocalHTTPClient(CachedHTTPClient):
+    """An in-process stand-in for the Sanctum API.
+
+    Requests are handled by the functions in :data:`routes`, which run against the bot's own Postgres schema. The bot
+    reads and writes some of the same tables directly (like timers and infractions), so both sides stay consistent.
+    Responses go through JSON just like they would over HTTP.
+
+    This is a :class:`CachedHTTPClient`, so caching, retries and the circuit breaker behave like they do in
+    production. Pass ``ttls={}`` to disable caching.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The pool to run queries on. It should be created with :func:`lightning.utils.helpers.create_pool` so json
+        columns are decoded.
+    latency : float
+        How many seconds every request takes at least.
+    jitter : float
+        Up to how many extra seconds are randomly added to every request.
+    error_rate : float
+        The fraction of requests, between 0 and 1, that fail with a 503 error.
+    **kwargs
+        Keyword arguments that are passed to :class:`CachedHTTPClient`.
+    """
+    def __init__(self, pool: asyncpg.Pool, *, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 **kwargs: Any) -> None:
+        super().__init__("local://sanctum", "", **kwargs)
+        self.pool = pool
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pastes: Dict[str, str] = {}
+
+    async def _perform(self, method: str, path: str, **kwargs: Any) -> Any:
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        timeout = kwargs.get("timeout")
+        if timeout is not None and timeout.total is not None and delay >= timeout.total:
+            await asyncio.sleep(timeout.total)
+            raise asyncio.TimeoutError()
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            raise HTTPException(503, {"message": "Injected failure"})
+
+        for route_method, pattern, handler in routes:
+            if route_method == method and (match := pattern.fullmatch(path)):
+                break
+        else:
+            raise NotFound(404, {"message": f"No route for {method} {path}"})
+
+        arguments = {key: int(value) if key.endswith("_id") else value for key, value in match.groupdict().items()}
+        try:
+            async with self.pool.acquire() as connection:
+                result = await handler(self, connection, params=kwargs.get("params") or {},
+                                       data=kwargs.get("data"), **arguments)
+        except asyncpg.UniqueViolationError as e:
+            raise DataConflict(409, {"message": str(e)}) from e
+        except asyncpg.ForeignKeyViolationError as e:
+            raise NotFound(404, {"message": str(e)}) from e
+
+        return orjson.loads(orjson.dumps(result, default=dict, option=orjson.OPT_NON_STR_KEYS))
+
+
+# Guild state management
+
+@route("GET", "/guilds/{guild_id}")
+async def get_guild(client, connection, *, guild_id: int, **_) -> Any:
+    return _not_found(await connection.fetchrow("SELECT * FROM guilds WHERE id=$1;", guild_id))
+
+
+@route("PUT", "/guilds/{guild_id}")
+async def create_guild(client, connection, *, guild_id: int, data: Dict[str, Any], **_) -> Any:
+    query = """INSERT INTO guilds (id, name, owner_id)
+               VALUES ($1, $2, $3)
+               ON CONFLICT (id) DO UPDATE
+               SET name = EXCLUDED.name, owner_id = EXCLUDED.owner_id, left_at = NULL
+               RETURNING *;"""
+    return await connection.fetchrow(query, guild_id, data.get("name"), data.get("owner_id"))
+
+
+@route("DELETE", "/guilds/{guild_id}/leave")
+async def leave_guild(client, connection, *, guild_id: int, **_) -> Any:
+    query = "UPDATE guilds SET left_at=(NOW() AT TIME ZONE 'UTC') WHERE id=$1 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, guild_id))
+
+
+# Timers and reminders
+
+@route("PUT", "/timers")
+async def create_timer(client, connection, *, data: Dict[str, Any], **_) -> Any:
+    query = """INSERT INTO timers (event, created, expiry, timezone, extra)
+               VALUES ($1, $2, $3, $4, $5)
+               RETURNING *;"""
+    return await connection.fetchrow(query, data['event'], _timestamp(data['created']), _timestamp(data['expiry']),
+                                     data.get('timezone', "UTC"), data.get('extra'))
+
+
+@route("GET", "/timers")
+async def get_timers(client, connection, *, params: Dict[str, Any], **_) -> Any:
+    query = "SELECT * FROM timers ORDER BY expiry LIMIT $1;"
+    return _not_found(await connection.fetch(query, int(params.get("limit", 1))))
+
+
+@route("GET", "/timers/{timer_id}")
+async def get_timer(client, connection, *, timer_id: int, **_) -> Any:
+    return _not_found(await connection.fetchrow("SELECT * FROM timers WHERE id=$1;", timer_id))
+
+
+@route("DELETE", "/timers/{timer_id}")
+async def delete_timer(client, connection, *, timer_id: int, **_) -> Any:
+    return _not_found(await connection.fetchrow("DELETE FROM timers WHERE id=$1 RETURNING *;", timer_id))
+
+
+@route("GET", "/users/{user_id}/reminders")
+async def get_user_reminders(client, connection, *, user_id: int, params: Dict[str, Any], **_) -> Any:
+    query = "SELECT * FROM timers WHERE author_id=$1 ORDER BY expiry LIMIT $2;"
+    return _not_found(await connection.fetch(query, user_id, int(params.get("limit", 10))))
+
+
+@route("GET", "/users/{user_id}/reminders/{reminder_id}")
+async def get_user_reminder(client, connection, *, user_id: int, reminder_id: int, **_) -> Any:
+    query = "SELECT * FROM timers WHERE id=$1 AND author_id=$2;"
+    return _not_found(await connection.fetchrow(query, reminder_id, user_id))
+
+
+@route("PATCH", "/users/{user_id}/reminders/{reminder_id}")
+async def edit_user_reminder(client, connection, *, user_id: int, reminder_id: int, data: Dict[str, Any], **_) -> Any:
+    query = "UPDATE timers SET extra = extra || $3 WHERE id=$1 AND author_id=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, reminder_id, user_id, data))
+
+
+@route("DELETE", "/users/{user_id}/reminders/{reminder_id}")
+async def delete_user_reminder(client, connection, *, user_id: int, reminder_id: int, **_) -> Any:
+    query = "DELETE FROM timers WHERE id=$1 AND author_id=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, reminder_id, user_id))
+
+
+# Infractions
+
+INFRACTION_COLUMNS = ("user_id", "moderator_id", "action", "reason", "created_at", "expiry", "active", "extra")
+
+
+@route("PUT", "/guilds/{guild_id}/infractions")
+async def create_infraction(client, connection, *, guild_id: int, data: Dict[str, Any], **_) -> Any:
+    query = """INSERT INTO infractions (guild_id, user_id, moderator_id, action, reason, created_at, expiry, extra)
+               VALUES ($1, $2, $3, $4, $5, COALESCE($6, NOW() AT TIME ZONE 'UTC'), $7, $8)
+               RETURNING *;"""
+    return await connection.fetchrow(query, guild_id, data['user_id'], data['moderator_id'], data['action'],
+                                     data.get('reason'), _timestamp(data.get('created_at')),
+                                     _timestamp(data.get('expiry')), data.get('extra'))
+
+
+@route("GET", "/guilds/{guild_id}/infractions")
+async def get_infractions(client, connection, *, guild_id: int, params: Dict[str, Any], **_) -> Any:
+    query = "SELECT * FROM infractions WHERE guild_id=$1 AND ($2::int IS NULL OR action=$2) ORDER BY id;"
+    action = params.get("action")
+    return _not_found(await connection.fetch(query, guild_id, int(action) if action is not None else None))
+
+
+@route("GET", "/guilds/{guild_id}/infractions/{infraction_id}")
+async def get_infraction(client, connection, *, guild_id: int, infraction_id: int, **_) -> Any:
+    query = "SELECT * FROM infractions WHERE guild_id=$1 AND id=$2;"
+    return _not_found(await connection.fetchrow(query, guild_id, infraction_id))
+
+
+@route("PATCH", "/guilds/{guild_id}/infractions/{infraction_id}")
+async def edit_infraction(client, connection, *, guild_id: int, infraction_id: int, data: Dict[str, Any],
+                          **_) -> Any:
+    clause, values = _updates(data, INFRACTION_COLUMNS[1:], start=3)
+    query = f"UPDATE infractions SET {clause} WHERE guild_id=$1 AND id=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, guild_id, infraction_id, *values))
+
+
+@route("DELETE", "/guilds/{guild_id}/infractions/{infraction_id}")
+async def delete_infraction(client, connection, *, guild_id: int, infraction_id: int, **_) -> Any:
+    query = "DELETE FROM infractions WHERE guild_id=$1 AND id=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, guild_id, infraction_id))
+
+
+@route("GET", "/guilds/{guild_id}/users/{user_id}/infractions")
+async def get_user_infractions(client, connection, *, guild_id: int, user_id: int, params: Dict[str, Any],
+                               **_) -> Any:
+    query = """SELECT * FROM infractions
+               WHERE guild_id=$1 AND user_id=$2 AND ($3::int IS NULL OR action=$3)
+               ORDER BY id;"""
+    action = params.get("action")
+    return _not_found(await connection.fetch(query, guild_id, user_id, int(action) if action is not None else None))
+
+
+@route("DELETE", "/guilds/{guild_id}/users/{user_id}/infractions")
+async def bulk_delete_user_infractions(client, connection, *, guild_id: int, user_id: int, **_) -> Any:
+    query = "DELETE FROM infractions WHERE guild_id=$1 AND user_id=$2 RETURNING *;"
+    return _not_found(await connection.fetch(query, guild_id, user_id))
+
+
+# Configuration
+
+@route("GET", "/guilds/{guild_id}/config")
+async def get_guild_bot_config(client, connection, *, guild_id: int, **_) -> Any:
+    return _not_found(await connection.fetchrow("SELECT * FROM guild_config WHERE guild_id=$1;", guild_id))
+
+
+@route("GET", "/guilds/{guild_id}/prefixes")
+async def get_guild_prefixes(client, connection, *, guild_id: int, **_) -> Any:
+    return _not_found(await connection.fetchval("SELECT prefixes FROM guild_config WHERE guild_id=$1;", guild_id))
+
+
+@route("PUT", "/guilds/{guild_id}/prefixes")
+async def bulk_upsert_guild_prefixes(client, connection, *, guild_id: int, data: List[str], **_) -> Any:
+    query = """INSERT INTO guild_config (guild_id, prefixes)
+               VALUES ($1, $2)
+               ON CONFLICT (guild_id) DO UPDATE SET prefixes = EXCLUDED.prefixes
+               RETURNING prefixes;"""
+    return await connection.fetchval(query, guild_id, data or [])
+
+
+@route("GET", "/guilds/{guild_id}/config/moderation")
+async def get_guild_moderation_config(client, connection, *, guild_id: int, **_) -> Any:
+    return _not_found(await connection.fetchrow("SELECT * FROM guild_mod_config WHERE guild_id=$1;", guild_id))
+
+
+# Pastes
+
+@route("PUT", "/admin/paste")
+async def create_paste(client, connection, *, data: Dict[str, Any], **_) -> Any:
+    code = secrets.token_urlsafe(8)
+    client.pastes[code] = data['text']
+    return {"code": code, "full_url": f"local://paste/{code}", "delete_token": secrets.token_urlsafe(16)}
+
+
+@route("DELETE", "/admin/paste")
+async def delete_paste(client, connection, *, params: Dict[str, Any], **_) -> Any:
+    code = str(params.get("url", "")).rpartition("/")[2]
+    return {"text": _not_found(client.pastes.pop(code, None))}
+
+
+# AutoMod
+
+async def _automod_rules(connection, guild_id: int) -> List[Dict[str, Any]]:
+    query = """SELECT rules.*, punishment.type AS punishment_type, punishment.duration AS punishment_duration
+               FROM guild_automod_rules AS rules
+               LEFT JOIN guild_automod_punishment AS punishment ON punishment.id = rules.id
+               WHERE rules.guild_id=$1
+               ORDER BY rules.id;"""
+    rules = []
+    for record in await connection.fetch(query, guild_id):
+        rule = dict(record)
+        punishment_type, duration = rule.pop("punishment_type"), rule.pop("punishment_duration")
+        rule["punishment"] = {"type": punishment_type, "duration": duration} if punishment_type else None
+        rules.append(rule)
+    return rules
+
+
+@route("GET", "/guilds/{guild_id}/automod")
+async def get_guild_automod_config(client, connection, *, guild_id: int, **_) -> Any:
+    record = _not_found(await connection.fetchrow("SELECT * FROM guild_automod_config WHERE guild_id=$1;", guild_id))
+    config = dict(record)
+    config["default_ignores"] = config["default_ignores"] or []
+    config["rules"] = await _automod_rules(connection, guild_id)
+    return config
+
+
+@route("PUT", "/guilds/{guild_id}/automod/ignores")
+async def bulk_upsert_guild_automod_default_ignores(client, connection, *, guild_id: int, data: List[int],
+                                                    **_) -> Any:
+    query = """INSERT INTO guild_automod_config (guild_id, default_ignores)
+               VALUES ($1, $2)
+               ON CONFLICT (guild_id) DO UPDATE SET default_ignores = EXCLUDED.default_ignores
+               RETURNING *;"""
+    return await connection.fetchrow(query, guild_id, data or [])
+
+
+@route("GET", "/guilds/{guild_id}/automod/rules")
+async def get_guild_automod_rules(client, connection, *, guild_id: int, **_) -> Any:
+    return _not_found(await _automod_rules(connection, guild_id))
+
+
+@route("PUT", "/guilds/{guild_id}/automod/rules")
+async def create_guild_automod_rule(client, connection, *, guild_id: int, data: Dict[str, Any], **_) -> Any:
+    async with connection.transaction():
+        query = "SELECT true FROM guild_automod_rules WHERE guild_id=$1 AND type=$2;"
+        if await connection.fetchval(query, guild_id, data['type']):
+            raise DataConflict(409, {"message": "Rule already exists"})
+
+        query = """INSERT INTO guild_automod_rules (guild_id, type, count, seconds, ignores)
+                   VALUES ($1, $2, $3, $4, $5)
+                   RETURNING *;"""
+        rule = dict(await connection.fetchrow(query, guild_id, data['type'], data.get('count', 0),
+                                              data.get('seconds', 0), data.get('ignores') or []))
+
+        punishment = data.get("punishment")
+        if punishment:
+            query = "INSERT INTO guild_automod_punishment (id, type, duration) VALUES ($1, $2, $3);"
+            punishment = {"type": punishment['type'], "duration": punishment.get('duration')}
+            await connection.execute(query, rule['id'], punishment['type'], punishment['duration'])
+        rule["punishment"] = punishment or None
+    return rule
+
+
+@route("DELETE", "/guilds/{guild_id}/automod/rules/{rule}")
+async def delete_guild_automod_rule(client, connection, *, guild_id: int, rule: str, **_) -> Any:
+    query = "DELETE FROM guild_automod_rules WHERE guild_id=$1 AND type::text=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, guild_id, rule))
+
+
+# Message reports
+
+@route("GET", "/guilds/{guild_id}/reports/{message_id}")
+async def get_guild_message_report(client, connection, *, guild_id: int, message_id: int, **_) -> Any:
+    query = "SELECT * FROM message_reports WHERE guild_id=$1 AND message_id=$2;"
+    return _not_found(await connection.fetchrow(query, guild_id, message_id))
+
+
+@route("PUT", "/guilds/{guild_id}/reports")
+async def create_guild_message_report(client, connection, *, guild_id: int, data: Dict[str, Any], **_) -> Any:
+    async with connection.transaction():
+        query = """INSERT INTO message_reports (guild_id, message_id, channel_id, report_message_id)
+                   VALUES ($1, $2, $3, $4)
+                   RETURNING *;"""
+        report = await connection.fetchrow(query, guild_id, data['message_id'], data['channel_id'],
+                                           data['report_message_id'])
+        if reporter := data.get("reporter"):
+            query = """INSERT INTO message_reporters (guild_id, message_id, author_id, original, reason)
+                       VALUES ($1, $2, $3, $4, $5);"""
+            await connection.execute(query, guild_id, data['message_id'], reporter['author_id'],
+                                     reporter.get('original', False), reporter.get('reason'))
+    return report
+
+
+@route("PATCH", "/guilds/{guild_id}/reports/{message_id}")
+async def edit_guild_message_report(client, connection, *, guild_id: int, message_id: int, data: Dict[str, Any],
+                                    **_) -> Any:
+    clause, values = _updates(data, ("dismissed", "actioned"), start=3)
+    query = f"UPDATE message_reports SET {clause} WHERE guild_id=$1 AND message_id=$2 RETURNING *;"
+    return _not_found(await connection.fetchrow(query, guild_id, message_id, *values))
+
+
+@route("GET", "/guilds/{guild_id}/reports/{message_id}/reporters")
+async def get_guild_message_reporters(client, connection, *, guild_id: int, message_id: int, **_) -> Any:
+    query = "SELECT * FROM message_reporters WHERE guild_id=$1 AND message_id=$2 ORDER BY reported_at;"
+    return _not_found(await connection.fetch(query, guild_id, message_id))
+
+
+@route("PUT", "/guilds/{guild_id}/reports/{message_id}/reporters")
+async def add_guild_message_reporter(client, connection, *, guild_id: int, message_id: int, data: Dict[str, Any],
+                                     **_) -> Any:
+    query = """INSERT INTO message_reporters (guild_id, message_id, author_id, original, reason)
+               VALUES ($1, $2, $3, false, $4)
+               ON CONFLICT (message_id, author_id) DO UPDATE SET reason = EXCLUDED.reason
+               RETURNING *;"""
+    return await connection.fetchrow(query, guild_id, message_id, data['author_id'], data.get('reason'))
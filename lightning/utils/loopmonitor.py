@@ -0,0 +1,181 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+
+from lightning.metrics import LOOP_LAG_HIST, LOOP_STALLS_COUNTER
+
+__all__ = ("LoopMonitor", "SlowCallback")
+log = logging.getLogger(__name__)
+
+
+class SlowCallback:
+    """A period of time where the event loop was blocked.
+
+    Attributes
+    ----------
+    started_at : datetime
+        Roughly when the loop stopped responding.
+    task_name : Optional[str]
+        The name of the task that was running, if the loop was running a task.
+    coro_name : Optional[str]
+        The qualified name of the task's coroutine.
+    duration : Optional[float]
+        How long the loop was blocked for. This is None while the loop is still blocked.
+    stack : Optional[str]
+        A stack sample of the main thread. Only taken when the loop was blocked for longer than the stall threshold.
+    """
+    __slots__ = ("started_at", "task_name", "coro_name", "duration", "stack")
+
+    def __init__(self, task: Optional[asyncio.Task]) -> None:
+        self.started_at = datetime.now(timezone.utc)
+        self.task_name = task.get_name() if task else None
+        self.coro_name = getattr(task.get_coro(), "__qualname__", None) if task else None
+        self.duration: Optional[float] = None
+        self.stack: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        if self.task_name is None:
+            return "<callback>"
+        return f"{self.task_name} ({self.coro_name})" if self.coro_name else self.task_name
+
+    def __repr__(self) -> str:
+        return f"<SlowCallback name={self.name!r} duration={self.duration}>"
+
+
+class LoopMonitor:
+    """Measures event loop lag and finds out what was blocking the loop.
+
+    A task sleeps for a fixed tick and measures how late it was woken up. Meanwhile, a watchdog thread checks whether
+    the tick is overdue. When it is, the loop is still blocked, so the watchdog can see which task is running and
+    sample the main thread's stack while the offending code is still on it.
+
+    Parameters
+    ----------
+    interval : float
+        How often the loop is ticked, in seconds.
+    slow_threshold : float
+        How long the loop has to be blocked before the running task is recorded.
+    stall_threshold : float
+        How long the loop has to be blocked before a stack sample of the main thread is captured.
+    history : int
+        How many slow callbacks to keep around.
+    """
+    def __init__(self, *, interval: float = 0.25, slow_threshold: float = 0.1, stall_threshold: float = 1.0,
+                 history: int = 50) -> None:
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.stall_threshold = stall_threshold
+        self.slow_callbacks: Deque[SlowCallback] = collections.deque(maxlen=history)
+        # Roughly the last 10 minutes of lag samples
+        self.lags: Deque[float] = collections.deque(maxlen=max(1, int(600 / interval)))
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._main_thread_id = threading.main_thread().ident
+        self._deadline = time.monotonic()
+        self._current: Optional[SlowCallback] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._main_thread_id = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._stopped.clear()
+        self._task = self._loop.create_task(self._tick(), name="lightning-loop-monitor")
+        self._thread = threading.Thread(target=self._watch, name="lightning-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+
+            with self._lock:
+                now = time.monotonic()
+                lag = max(now - self._deadline, 0.0)
+                # The deadline is moved forward before releasing the lock so the watchdog never catches this task
+                # in between ticks.
+                self._deadline = now + self.interval
+                slow, self._current = self._current, None
+
+            LOOP_LAG_HIST.observe(lag)
+            self.lags.append(lag)
+
+            if slow is not None:
+                self._finish(slow, lag)
+
+    def _finish(self, slow: SlowCallback, lag: float) -> None:
+        slow.duration = lag
+        self.slow_callbacks.append(slow)
+        LOOP_STALLS_COUNTER.labels(slow.coro_name or "<callback>").inc()
+
+        if slow.stack:
+            log.warning(f"Event loop was blocked for {lag:.3f}s while running {slow.name}\n{slow.stack}")
+        else:
+            log.warning(f"Event loop was blocked for {lag:.3f}s while running {slow.name}")
+
+    def _watch(self) -> None:
+        poll = min(self.slow_threshold, self.stall_threshold) / 2
+        while not self._stopped.wait(poll):
+            with self._lock:
+                overdue = time.monotonic() - self._deadline
+                if overdue < self.slow_threshold:
+                    continue
+
+                if self._current is None:
+                    # Only the loop's thread mutates the current task mapping, this is a plain dict lookup.
+                    self._current = SlowCallback(asyncio.current_task(self._loop))
+
+                if overdue >= self.stall_threshold and self._current.stack is None:
+                    self._current.stack = self.sample_stack()
+
+    def sample_stack(self) -> Optional[str]:
+        """Returns the current stack of the thread running the event loop"""
+        frame = sys._current_frames().get(self._main_thread_id)
+        if frame is None:
+            return None
+        return "".join(traceback.format_stack(frame))
+
+    def percentiles(self, *percents: float) -> List[float]:
+        """Returns percentiles of the recently recorded lag samples"""
+        if not self.lags:
+            return [0.0 for _ in percents]
+
+        lags = sorted(self.lags)
+        return [lags[min(len(lags) - 1, int(len(lags) * p / 100))] for p in percents]
@@ -80,6 +80,43 @@ log_actions = {
 }
 
 
+# Templates for the busiest events, so each message is built in one pass
+EMOJI_JOIN = ("{emoji} **Member Join**: {mention} | {name}\n"
+              "\N{CLOCK FACE FOUR OCLOCK} __Account Creation__: {created}\n"
+              "\N{LABEL} __User ID__: {id}")
+EMOJI_LEAVE = "{emoji} **Member Leave**: {mention} | {name}\n\N{LABEL} __User ID__: {id}"
+EMOJI_ROLE_CHANGE = "\N{INFORMATION SOURCE} **Member update**: {name} | {id} \n\N{CROWN}__Role change__: {roles}"
+EMOJI_MODERATOR = "\n\N{BLUE BOOK} __Moderator__: {name} ({id})"
+EMOJI_ACTION = ("{emoji} **{title}**: {moderator} {tense} {target}{user_id}\n"
+                "\N{PENCIL}\N{VARIATION SELECTOR-16} __Reason__: \"{reason}\"")
+EMOJI_USER_ID = "\n\N{LABEL} __User ID__: {id}"
+EMOJI_COMMAND = "\N{CLIPBOARD} **Command Used**: {mention} ran `{command}`\n__Channel__: {channel} | {channel_name}"
+EMOJI_NICK_CHANGE = ("\N{INFORMATION SOURCE} **Member update**: {member} | {id} "
+                     "\N{LABEL} __Nickname {change}__: {previous} -> {current}")
+EMOJI_SCREENING = "\N{PASSPORT CONTROL} **Member Completed Screening** {mention} | ({name}"
+MINIMAL_JOIN = "[{timestamp}] **Member Join**: {name} ({id})\n__Account Creation Date__: {created}"
+MINIMAL_LEAVE = "[{timestamp}] **Member Leave**: {name} ({id})"
+MINIMAL_ROLE_CHANGE = "[{timestamp}] **Role Change**\n**User**: {name} ({id})\n"
+MINIMAL_ROLE_CHANGE_NO_TIMESTAMP = "**Role Change**\n**User**:{name} ({id})\n"
+MINIMAL_ROLE = "**Role {change}**: {name} ({id})\n"
+MINIMAL_TIMESTAMP = "[{timestamp}] "
+MINIMAL_ACTION = ("**{title}** | Infraction ID {id}\n**User**: {user}\n**Moderator**: {moderator}{expiry}\n"
+                  "**Reason**: {reason}")
+MINIMAL_COMMAND = "**Command Ran**\n**Command**: {command}\n**User**: {user}\n**Channel**: {channel}"
+MINIMAL_NICK_CHANGE = "**{title}**\n{change}\n**Member**: {member}"
+MINIMAL_MODERATOR = "\n**Moderator**: {moderator}"
+MINIMAL_SCREENING = "**Member Passed Screening**: {name} ({id})"
+EMBED_JOIN_LEAVE = "**User**: {mention} ({id}) \n**Created at**: {created}"
+EMBED_ACTION = ("**User**: {user} <@!{user_id}>\n**Moderator**: {moderator} <@!{moderator_id}>{expiry}\n"
+                "**Reason**: {reason}")
+EMBED_COMMAND = "**Command**: {command}\n**User**: {mention} ({id})\n**Channel**: {channel} ({channel_id})"
+EMBED_NICK_CHANGE = "{change}\n**Member**: {member}"
+EXPIRY = "\n**Expiry**: {expiry}"
+NICK_UPDATE = "**Old Nickname**: {previous}\n**New Nickname**: {current}"
+NICK_ADD = "**New Nickname**: {current}"
+NICK_REMOVE = "**Old Nickname**: {previous}"
+
+
 def construct_dm_message(member, action_verb, location, *, middle=None, reason=None, ending=None):
     msg = [f"You were {action_verb} {location} {member.guild.name}"]
     if middle:
@@ -114,19 +151,10 @@ class EmojiFormat(BaseFormat):
 
     def format_message(self) -> str:
         attrs = log_actions[str(self.log_action).lower()]
-        message = [f"{attrs.emoji} **{attrs.title}**: {self.moderator.mention}"
-                   f" {attrs.tense} "]
-
-        if self.expiry:
-            message.append(self.temp_action_target(self.expiry))
-        else:
-            message.append(self.target_mention_and_safe_name())
-
-        if hasattr(self.target, 'id'):
-            message.append(f"\n\N{LABEL} __User ID__: {self.target.id}")
-
-        message.append(f"\n\N{PENCIL}\N{VARIATION SELECTOR-16} __Reason__: \"{self.reason}\"")
-        return ''.join(message)
+        target = self.temp_action_target(self.expiry) if self.expiry else self.target_mention_and_safe_name()
+        user_id = EMOJI_USER_ID.format(id=self.target.id) if hasattr(self.target, 'id') else ""
+        return EMOJI_ACTION.format(emoji=attrs.emoji, title=attrs.title, moderator=self.moderator.mention,
+                                   tense=attrs.tense, target=target, user_id=user_id, reason=self.reason)
 
     @staticmethod
     def bot_addition(bot: discord.Member, mod) -> str:
@@ -135,8 +163,7 @@ class EmojiFormat(BaseFormat):
 
     @staticmethod
     def completed_screening(member: discord.Member):
-        return f"\N{PASSPORT CONTROL} **Member Completed Screening** {member.mention} | "\
-               f"({escape_markdown_and_mentions(str(member))}"
+        return EMOJI_SCREENING.format(mention=member.mention, name=escape_markdown_and_mentions(str(member)))
 
     @staticmethod
     def role_change(event: MemberRolesUpdateEvent):
@@ -147,31 +174,19 @@ class EmojiFormat(BaseFormat):
             removed = event.removed_roles
             added = event.added_roles
 
-        msg = ["\n👑__Role change__: "]
-        if len(added) != 0 or len(removed) != 0:
-            roles = []
-            for role in removed:
-                roles.append(f"_~~{escape_markdown_and_mentions(role.name)}~~_")
-
-            for role in added:
-                roles.append(f"__**{escape_markdown_and_mentions(role.name)}**__")
-
-            for role in event.after.roles:
-                if role.name == "@everyone":
-                    continue
-
-                if role not in added and role not in removed:
-                    roles.append(escape_markdown_and_mentions(role.name))
-
-        msg.append(", ".join(roles))
-        msg = [f"\N{INFORMATION SOURCE} **Member update**: {escape_markdown_and_mentions(str(event.after))} | "
-               f"{event.after.id} {''.join(msg)}"]
+        changed = {role.id for role in added} | {role.id for role in removed}
+        roles = [f"_~~{escape_markdown_and_mentions(role.name)}~~_" for role in removed]
+        roles.extend(f"__**{escape_markdown_and_mentions(role.name)}**__" for role in added)
+        roles.extend(escape_markdown_and_mentions(role.name) for role in event.after.roles
+                     if role.name != "@everyone" and role.id not in changed)
 
+        msg = EMOJI_ROLE_CHANGE.format(name=escape_markdown_and_mentions(str(event.after)), id=event.after.id,
+                                       roles=", ".join(roles))
         if event.moderator:
-            msg.append(f"\n\N{BLUE BOOK} __Moderator__: "
-                       f"{escape_markdown_and_mentions(str(event.moderator))} ({event.moderator.id})")
+            msg += EMOJI_MODERATOR.format(name=escape_markdown_and_mentions(str(event.moderator)),
+                                          id=event.moderator.id)
 
-        return ''.join(msg)
+        return msg
 
     @staticmethod
     def timed_action_expired(action, user, mod, creation) -> str:
@@ -192,43 +207,30 @@ class EmojiFormat(BaseFormat):
     def join_leave(log_type: str, member) -> str:
         safe_name = escape_markdown_and_mentions(str(member))
         if log_type == "MEMBER_JOIN":
-            msg = f"{Emoji.member_join}"\
-                  f" **Member Join**: {member.mention} | "\
-                  f"{safe_name}\n"\
-                  f"\N{CLOCK FACE FOUR OCLOCK} __Account Creation__: {discord.utils.format_dt(member.created_at)}\n"\
-                  f"\N{LABEL} __User ID__: {member.id}"
-        else:
-            msg = f"{Emoji.member_leave} "\
-                  f"**Member Leave**: {member.mention} | "\
-                  f"{safe_name}\n"\
-                  f"\N{LABEL} __User ID__: {member.id}"
-        return msg
+            return EMOJI_JOIN.format(emoji=Emoji.member_join, mention=member.mention, name=safe_name,
+                                     created=discord.utils.format_dt(member.created_at), id=member.id)
+
+        return EMOJI_LEAVE.format(emoji=Emoji.member_leave, mention=member.mention, name=safe_name, id=member.id)
 
     @staticmethod
     def command_ran(ctx) -> str:
-        command = ctx.command
-        msg = f"\N{CLIPBOARD} **Command Used**: {ctx.author.mention} ran `{command.qualified_name}`\n"\
-              f"__Channel__: {ctx.channel.mention} | {ctx.channel.name}"
-        return msg
+        return EMOJI_COMMAND.format(mention=ctx.author.mention, command=ctx.command.qualified_name,
+                                    channel=ctx.channel.mention, channel_name=ctx.channel.name)
 
     @staticmethod
     def nick_change(member, previous, current, moderator=None):
         if previous is None and current is not None:
-            msg = f"\N{LABEL} __Nickname added__: None -> {current}"
+            change = "added"
         elif previous is not None and current is not None:
-            msg = f"\N{LABEL} __Nickname changed__: {previous} -> {current}"
+            change = "changed"
         elif previous is not None and current is None:
-            msg = f"\N{LABEL} __Nickname removed__: {previous} -> None"
-
-        msg = [f"\N{INFORMATION SOURCE} **Member update**: {member} | "
-               f"{member.id} {msg}"]
+            change = "removed"
 
+        msg = EMOJI_NICK_CHANGE.format(member=member, id=member.id, change=change, previous=previous, current=current)
         if moderator:
-            safe_mod = escape_markdown_and_mentions(str(moderator))
-            msg.append(f"\n\N{BLUE BOOK} __Moderator__: "
-                       f"{safe_mod} ({moderator.id})")
+            msg += EMOJI_MODERATOR.format(name=escape_markdown_and_mentions(str(moderator)), id=moderator.id)
 
-        return ''.join(msg)
+        return msg
 
     @staticmethod
     def infraction_update(event: InfractionUpdateEvent) -> str:
@@ -296,6 +298,15 @@ def format_timestamp(dt: datetime):
     return discord.utils.format_dt(dt, style="T")
 
 
+def nickname_change(previous: Optional[str], current: Optional[str]) -> tuple[str, str]:
+    """Returns the title and description of a nickname change"""
+    if current and previous:
+        return "Member Nickname Update", NICK_UPDATE.format(previous=previous, current=current)
+    elif previous is None and current is not None:
+        return "Member Nickname Add", NICK_ADD.format(current=current)
+    return "Member Nickname Removed", NICK_REMOVE.format(previous=previous)
+
+
 class MinimalisticFormat(BaseFormat):
     @staticmethod
     def format_user(user) -> str:
@@ -306,21 +317,16 @@ class MinimalisticFormat(BaseFormat):
 
     @staticmethod
     def role_change(event: MemberRolesUpdateEvent, *, with_timestamp=True) -> str:
-        time = event.entry.created_at if event.entry else discord.utils.utcnow()
-
+        name = escape_markdown_and_mentions(str(event.after))
         if with_timestamp:
-            base = [f"[{format_timestamp(time)}] **Role Change**\n"
-                    f"**User**: {escape_markdown_and_mentions(str(event.after))} ({event.after.id})\n"]
+            time = event.entry.created_at if event.entry else discord.utils.utcnow()
+            base = [MINIMAL_ROLE_CHANGE.format(timestamp=format_timestamp(time), name=name, id=event.after.id)]
         else:
-            base = ["**Role Change**\n**User**:"
-                    f"{escape_markdown_and_mentions(str(event.after))} ({event.after.id})\n"]
+            base = [MINIMAL_ROLE_CHANGE_NO_TIMESTAMP.format(name=name, id=event.after.id)]
 
-        if event.added_roles != 0:
-            for role in event.added_roles:
-                base.append(f"**Role Added**: {escape_markdown_and_mentions(str(role))} ({role.id})\n")
-        if event.removed_roles != 0:
-            for role in event.removed_roles:
-                base.append(f"**Role Removed**: {escape_markdown_and_mentions(str(role))} ({role.id})\n")
+        for change, roles in (("Added", event.added_roles), ("Removed", event.removed_roles)):
+            base.extend(MINIMAL_ROLE.format(change=change, name=escape_markdown_and_mentions(str(role)), id=role.id)
+                        for role in roles)
 
         if event.moderator is not None:
             base.append(f"**Moderator**: {escape_markdown_and_mentions(str(event.moderator))} ({event.moderator.id})")
@@ -360,59 +366,39 @@ class MinimalisticFormat(BaseFormat):
 
     @staticmethod
     def join_leave(log_type: str, member) -> str:
+        name = discord.utils.escape_markdown(str(member))
         if log_type == "MEMBER_JOIN":
-            msg = f"[{format_timestamp(member.joined_at)}]"\
-                  f" **Member Join**: {discord.utils.escape_markdown(str(member))} ({member.id})\n"\
-                  "__Account Creation Date__: "\
-                  f"{discord.utils.format_dt(member.created_at)}"
-        else:
-            msg = f"[{format_timestamp(discord.utils.utcnow())}]"\
-                  f" **Member Leave**: {discord.utils.escape_markdown(str(member))} ({member.id})"
-        return msg
+            return MINIMAL_JOIN.format(timestamp=format_timestamp(member.joined_at), name=name, id=member.id,
+                                       created=discord.utils.format_dt(member.created_at))
+
+        return MINIMAL_LEAVE.format(timestamp=format_timestamp(discord.utils.utcnow()), name=name, id=member.id)
 
     @staticmethod
     def completed_screening(member, *, with_timestamp: bool = True):
+        msg = MINIMAL_SCREENING.format(name=discord.utils.escape_markdown(str(member)), id=member.id)
         if with_timestamp:
-            base = [f"[{format_timestamp(discord.utils.utcnow())}] "]
-        else:
-            base = []
-
-        base.append(f"**Member Passed Screening**: {discord.utils.escape_markdown(str(member))} ({member.id})")
-        return ''.join(base)
+            return MINIMAL_TIMESTAMP.format(timestamp=format_timestamp(discord.utils.utcnow())) + msg
+        return msg
 
     @staticmethod
     def command_ran(ctx, *, with_timestamp: bool = True) -> str:
+        msg = MINIMAL_COMMAND.format(command=ctx.command.qualified_name,
+                                     user=MinimalisticFormat.format_user(ctx.author),
+                                     channel=base_user_format(ctx.channel))
         if with_timestamp:
-            base = [f"[{format_timestamp(ctx.message.created_at)}] "]
-        else:
-            base = []
-
-        base.append(f"**Command Ran**\n**Command**: {ctx.command.qualified_name}\n**User**: "
-                    f"{MinimalisticFormat.format_user(ctx.author)}\n"
-                    f"**Channel**: {base_user_format(ctx.channel)}")
-
-        return ''.join(base)
+            return MINIMAL_TIMESTAMP.format(timestamp=format_timestamp(ctx.message.created_at)) + msg
+        return msg
 
     @staticmethod
     def nick_change(member, previous: str, current: Optional[str], moderator=None, *, with_timestamp: bool = True):
-        if with_timestamp:
-            base = [f"[{format_timestamp(discord.utils.utcnow())}] "]
-        else:
-            base = []
-
-        if current and previous:
-            base.append(f"**Member Nickname Update**\n**Old Nickname**: {previous}\n**New Nickname**: {current}")
-        elif previous is None and current is not None:
-            base.append(f"**Member Nickname Add**\n**New Nickname**: {current}")
-        elif current is None and previous is not None:
-            base.append(f"**Member Nickname Removed**\n**Old Nickname**: {previous}")
-
-        base.append(f"\n**Member**: {MinimalisticFormat.format_user(member)}")
-
+        title, change = nickname_change(previous, current)
+        msg = MINIMAL_NICK_CHANGE.format(title=title, change=change, member=MinimalisticFormat.format_user(member))
         if moderator:
-            base.append(f"\n**Moderator**: {MinimalisticFormat.format_user(moderator)}")
+            msg += MINIMAL_MODERATOR.format(moderator=MinimalisticFormat.format_user(moderator))
 
-        return ''.join(base)
+        if with_timestamp:
+            return MINIMAL_TIMESTAMP.format(timestamp=format_timestamp(discord.utils.utcnow())) + msg
+        return msg
 
     @staticmethod
     def infraction_update(event: InfractionUpdateEvent, *,
@@ -448,25 +434,19 @@ class MinimalisticFormat(BaseFormat):
         """Formats a log entry."""
         log_action = log_actions[str(self.log_action).lower()]
 
-        if with_timestamp:
-            base = [f"[{format_timestamp(self.timestamp)}] "]
-        else:
-            base = []
-
-        base.append(f"**{log_action.title}** | Infraction ID {self.infraction_id}"
-                    f"\n**User**: {self.format_user(self.target)}\n**Moderator**: {self.format_user(self.moderator)}")
-
         if self.expiry:
-            if isinstance(self.expiry, datetime):
-                # TZINFO should not be stripped at this point.
-                expy = discord.utils.format_dt(self.expiry)
-            else:
-                expy = self.expiry
-
-            base.append(f"\n**Expiry**: {expy}")
+            # TZINFO should not be stripped at this point.
+            expy = discord.utils.format_dt(self.expiry) if isinstance(self.expiry, datetime) else self.expiry
+            expiry = EXPIRY.format(expiry=expy)
+        else:
+            expiry = ""
 
-        base.append(f"\n**Reason**: {escape_markdown_and_mentions(self.reason)}")
-        return ''.join(base)
+        msg = MINIMAL_ACTION.format(title=log_action.title, id=self.infraction_id, user=self.format_user(self.target),
+                                    moderator=self.format_user(self.moderator), expiry=expiry,
+                                    reason=escape_markdown_and_mentions(self.reason))
+        if with_timestamp:
+            return MINIMAL_TIMESTAMP.format(timestamp=format_timestamp(self.timestamp)) + msg
+        return msg
 
 
 class EmbedFormat(BaseFormat):
@@ -482,23 +462,19 @@ class EmbedFormat(BaseFormat):
             embed.color = discord.Color.red()
 
         embed.set_author(name=member, icon_url=member.display_avatar.url)
-        embed.description = f"**User**: {member.mention} ({member.id}) \n**Created at**: "\
-                            f"{natural_timedelta(member.created_at)}"
+        embed.description = EMBED_JOIN_LEAVE.format(mention=member.mention, id=member.id,
+                                                    created=natural_timedelta(member.created_at))
         return embed
 
     def format_message(self) -> discord.Embed:
         action = log_actions[str(self.log_action).lower()]
         embed = discord.Embed(title=action.title, color=action.color)
         reason = truncate_text(self.reason, 512)
-
-        base = [f"**User**: {base_user_format(self.target)} <@!{self.target.id}>\n"
-                f"**Moderator**: {base_user_format(self.moderator)} <@!{self.moderator.id}>"]
-
-        if self.expiry:
-            base.append(f"\n**Expiry**: {self.expiry}")
-
-        base.append(f"\n**Reason**: {discord.utils.escape_markdown(reason)}")
-        embed.description = ''.join(base)
+        embed.description = EMBED_ACTION.format(user=base_user_format(self.target), user_id=self.target.id,
+                                                moderator=base_user_format(self.moderator),
+                                                moderator_id=self.moderator.id,
+                                                expiry=EXPIRY.format(expiry=self.expiry) if self.expiry else "",
+                                                reason=discord.utils.escape_markdown(reason))
         embed.set_footer(text=f"Infraction ID: {self.infraction_id}")
         embed.timestamp = self.timestamp
         return embed
@@ -522,9 +498,6 @@ class EmbedFormat(BaseFormat):
 
     @staticmethod
     def role_change(event: MemberRolesUpdateEvent) -> discord.Embed:
-        embed = discord.Embed(title="Role Change", color=discord.Color.dark_gold(),
-                              description=f"User: {event.after.mention} ({event.after.id})")
-
         if event.entry:
             removed = event.entry.changes.before.roles
             added = event.entry.changes.after.roles
@@ -534,18 +507,19 @@ class EmbedFormat(BaseFormat):
             removed = event.removed_roles
             time = discord.utils.utcnow()
 
-        if event.moderator:
-            embed.add_field(name="Moderator", value=base_user_format(event.moderator))
-
+        description = [f"User: {event.after.mention} ({event.after.id})"]
         if added:
-            added = "".join(r.mention for r in added)
-            embed.description += f"\nAdded: {added}"
+            description.append(f"Added: {''.join(r.mention for r in added)}")
 
         if removed:
-            removed = "".join(r.mention for r in removed)
-            embed.description += f"\nRemoved: {removed}"
+            description.append(f"Removed: {''.join(r.mention for r in removed)}")
+
+        embed = discord.Embed(title="Role Change", color=discord.Color.dark_gold(), description="\n".join(description),
+                              timestamp=time)
+
+        if event.moderator:
+            embed.add_field(name="Moderator", value=base_user_format(event.moderator))
 
-        embed.timestamp = time
         return embed
 
     @staticmethod
@@ -555,26 +529,16 @@ class EmbedFormat(BaseFormat):
     @staticmethod
     def command_ran(ctx) -> discord.Embed:
         embed = discord.Embed(title="Command Ran", color=0xf74b06, timestamp=ctx.message.created_at)
-        user = ctx.author
-        embed.description = f"**Command**: {ctx.command.qualified_name}\n**User**: {user.mention} ({user.id})"\
-                            f"\n**Channel**: {ctx.channel.mention} ({ctx.channel.id})"
+        embed.description = EMBED_COMMAND.format(command=ctx.command.qualified_name, mention=ctx.author.mention,
+                                                 id=ctx.author.id, channel=ctx.channel.mention,
+                                                 channel_id=ctx.channel.id)
         return embed
 
     @staticmethod
     def nick_change(member, previous: str, current: Optional[str], moderator=None) -> discord.Embed:
-        embed = discord.Embed(color=discord.Color.blurple(), timestamp=discord.utils.utcnow())
-
-        if current and previous:
-            embed.title = "Member Nickname Update"
-            embed.description = f"**Old Nickname**: {previous}\n**New Nickname**: {current}"
-        elif previous is None and current is not None:
-            embed.title = "Member Nickname Add"
-            embed.description = f"**New Nickname**: {current}"
-        elif current is None and previous is not None:
-            embed.title = "Member Nickname Removed"
-            embed.description = f"**Old Nickname**: {previous}"
-
-        embed.description += f"\n**Member**: {base_user_format(member)}"
+        title, change = nickname_change(previous, current)
+        embed = discord.Embed(title=title, color=discord.Color.blurple(), timestamp=discord.utils.utcnow(),
+                              description=EMBED_NICK_CHANGE.format(change=change, member=base_user_format(member)))
 
         if moderator:
             embed.add_field(name="Moderator", value=base_user_format(moderator))
@@ -0,0 +1,174 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import asyncpg
+
+__all__ = ("MonthlyPartitioner", )
+log = logging.getLogger(__name__)
+
+
+def add_months(month: date, months: int) -> date:
+    """Returns the first day of the month that is ``months`` away from ``month``"""
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class MonthlyPartitioner:
+    """Manages the monthly partitions of a table that is range partitioned by a timestamp column.
+
+    Partitions are named ``<table>_pYYYY_MM`` and the table is expected to have a ``<table>_default`` partition.
+
+    Parameters
+    ----------
+    table : str
+        The partitioned table.
+    column : str
+        The partition key.
+    premake : int
+        How many months of partitions to keep created ahead of the current month.
+    """
+    __slots__ = ("table", "column", "premake", "_name_regex")
+
+    def __init__(self, table: str, column: str, *, premake: int = 3) -> None:
+        self.table = table
+        self.column = column
+        self.premake = premake
+        self._name_regex = re.compile(rf"^{re.escape(table)}_p(\d{{4}})_(\d{{2}})$")
+
+    @property
+    def default_partition(self) -> str:
+        return f"{self.table}_default"
+
+    @property
+    def expired_table(self) -> str:
+        return f"{self.table}_expired"
+
+    def partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month.year:04}_{month.month:02}"
+
+    async def get_partitions(self, conn: asyncpg.Connection) -> Dict[date, str]:
+        """Returns the table's monthly partitions, keyed by the month they start at"""
+        query = """SELECT c.relname FROM pg_inherits i
+                   INNER JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = $1::regclass;"""
+        partitions = {}
+        for record in await conn.fetch(query, self.table):
+            if match := self._name_regex.match(record['relname']):
+                partitions[date(int(match[1]), int(match[2]), 1)] = record['relname']
+        return partitions
+
+    async def create_partition(self, conn: asyncpg.Connection, month: date) -> str:
+        """Creates the partition for a month.
+
+        Rows that ended up in the default partition for that month are moved into the new partition, as Postgres
+        refuses to attach a partition that overlaps rows in the default partition.
+        """
+        name = self.partition_name(month)
+        start, end = month.isoformat(), add_months(month, 1).isoformat()
+        async with conn.transaction():
+            await conn.execute(f"CREATE TABLE {name} (LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+            await conn.execute(f"""WITH moved AS (
+                                       DELETE FROM {self.default_partition}
+                                       WHERE {self.column} >= '{start}' AND {self.column} < '{end}'
+                                       RETURNING *
+                                   )
+                                   INSERT INTO {name} SELECT * FROM moved;""")
+            await conn.execute(f"ALTER TABLE {self.table} ATTACH PARTITION {name} "
+                               f"FOR VALUES FROM ('{start}') TO ('{end}');")
+        return name
+
+    async def create_partitions(self, conn: asyncpg.Connection, *, now: Optional[datetime] = None) -> List[str]:
+        """Creates any missing partitions from the current month up to :attr:`premake` months ahead.
+
+        Returns
+        -------
+        List[str]
+            The names of the partitions that were created.
+        """
+        now = now or datetime.utcnow()
+        current = date(now.year, now.month, 1)
+        existing = await self.get_partitions(conn)
+
+        created = []
+        for offset in range(self.premake + 1):
+            month = add_months(current, offset)
+            if month in existing:
+                continue
+
+            created.append(await self.create_partition(conn, month))
+            log.info(f"Created partition {created[-1]}")
+        return created
+
+    async def expire_partitions(self, conn: asyncpg.Connection, retention: int, *, drop: bool = False,
+                                now: Optional[datetime] = None) -> List[str]:
+        """Detaches partitions that only hold rows older than ``retention`` months.
+
+        Rows older than that in the default partition are moved to ``<table>_expired``, or deleted if ``drop`` is
+        set.
+
+        Parameters
+        ----------
+        conn : asyncpg.Connection
+            The connection to use.
+        retention : int
+            How many months of history to keep, not counting the current month.
+        drop : bool
+            Whether to drop the partitions after detaching them.
+
+        Returns
+        -------
+        List[str]
+            The names of the partitions that were expired.
+        """
+        now = now or datetime.utcnow()
+        cutoff = add_months(date(now.year, now.month, 1), -retention)
+
+        expired = []
+        for month, name in sorted((await self.get_partitions(conn)).items()):
+            if add_months(month, 1) > cutoff:
+                break
+
+            await conn.execute(f"ALTER TABLE {self.table} DETACH PARTITION {name};")
+            if drop:
+                await conn.execute(f"DROP TABLE {name};")
+            log.info(f"{'Dropped' if drop else 'Detached'} partition {name}")
+            expired.append(name)
+
+        # Rows can end up in the default partition long after their month expired, e.g. when they're replayed
+        condition = f"{self.column} < '{cutoff.isoformat()}'"
+        if drop:
+            status = await conn.execute(f"DELETE FROM {self.default_partition} WHERE {condition};")
+        else:
+            async with conn.transaction():
+                await conn.execute(f"CREATE TABLE IF NOT EXISTS {self.expired_table} "
+                                   f"(LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+                status = await conn.execute(f"""WITH moved AS (
+                                                    DELETE FROM {self.default_partition} WHERE {condition}
+                                                    RETURNING *
+                                                )
+                                                INSERT INTO {self.expired_table} SELECT * FROM moved;""")
+
+        if rows := int(status.rsplit(" ", 1)[1]):
+            log.info(f"{'Deleted' if drop else 'Moved'} {rows} expired rows from {self.default_partition}")
+
+        return expired
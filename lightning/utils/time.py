@@ -22,13 +22,14 @@ from __future__ import annotations
 
 import datetime
 import re
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 import parsedatetime as pdt
 from dateutil.relativedelta import relativedelta
 from discord.ext import commands
 from discord.utils import format_dt
+from lru import LRU
 
 from lightning.formatters import human_join, plural
 
@@ -38,6 +39,176 @@ if TYPE_CHECKING:
 
 UTC_TZ = ZoneInfo("UTC")
 
+# A parsed expression: the naive datetime, whether it had a date and whether it had a time
+ParseResult = Tuple[datetime.datetime, bool, bool]
+
+# Units are limited to ones parsedatetime reads the same way, so both paths agree
+RELATIVE_UNITS = {
+    **dict.fromkeys(("s", "sec", "secs", "second", "seconds"), "seconds"),
+    **dict.fromkeys(("m", "min", "mins", "minute", "minutes"), "minutes"),
+    **dict.fromkeys(("h", "hour", "hours"), "hours"),
+    **dict.fromkeys(("d", "day", "days"), "days"),
+    **dict.fromkeys(("w", "week", "weeks"), "weeks"),
+}
+RELATIVE_PART = re.compile(r"(?:(?P<amount>[0-9]{1,4}) ?|an? )(?P<unit>[a-z]+)(?: |$)")
+CLOCK_EXPRESSION = re.compile(r"""(?:(?P<day>today|tomorrow)(?:\ |$))?         # e.g. tomorrow
+                                  (?:(?:at\ )?(?:
+                                      (?P<hour>[0-9]{1,2})(?::(?P<minute>[0-5][0-9]))?(?P<meridiem>am|pm)  # 5:30pm
+                                      |(?P<hour24>[0-9]{1,2}):(?P<minute24>[0-5][0-9])                     # 17:30
+                                      |(?P<noon>noon)
+                                  ))?
+                               """, re.VERBOSE)
+ISO_EXPRESSION = re.compile(r"(?P<year>[0-9]{4})-(?P<month>[0-9]{2})-(?P<day>[0-9]{2})"
+                            r"(?:[ t](?P<hour>[0-9]{2}):(?P<minute>[0-9]{2})(?::(?P<second>[0-9]{2}))?)?")
+
+# (expression, wall clock minute) -> (is relative, datetime or offset from now, has date, has time)
+_parse_memo: LRU = LRU(1024)
+
+
+def _normalize_expression(argument: str) -> str:
+    return " ".join(argument.casefold().split())
+
+
+def _parse_relative(argument: str, now: datetime.datetime) -> Optional[ParseResult]:
+    if argument.startswith("in "):
+        argument = argument[3:]
+
+    delta = {}
+    position = 0
+    while position < len(argument):
+        match = RELATIVE_PART.match(argument, position)
+        if match is None:
+            return None
+
+        unit = RELATIVE_UNITS.get(match["unit"])
+        if unit is None or unit in delta:
+            return None
+
+        delta[unit] = int(match["amount"] or 1)
+        position = match.end()
+
+    if not delta:
+        return None
+
+    has_date = "days" in delta or "weeks" in delta
+    has_time = "hours" in delta or "minutes" in delta or "seconds" in delta
+    return now + datetime.timedelta(**delta), has_date, has_time
+
+
+def _parse_clock(argument: str, now: datetime.datetime) -> Optional[ParseResult]:
+    match = CLOCK_EXPRESSION.fullmatch(argument)
+    if match is None or not match.group(0):
+        return None
+
+    date = now.date()
+    if match["day"] == "tomorrow":
+        date += datetime.timedelta(days=1)
+
+    if match["noon"]:
+        hour, minute = 12, 0
+    elif match["meridiem"]:
+        hour, minute = int(match["hour"]), int(match["minute"] or 0)
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if match["meridiem"] == "pm" else 0)
+    elif match["hour24"]:
+        hour, minute = int(match["hour24"]), int(match["minute24"])
+        if hour > 23:
+            return None
+    else:
+        # Just a day, parsedatetime picks 9 AM
+        return datetime.datetime.combine(date, datetime.time(9)), True, False
+
+    return datetime.datetime.combine(date, datetime.time(hour, minute)), match["day"] is not None, True
+
+
+def _parse_iso(argument: str, now: datetime.datetime) -> Optional[ParseResult]:
+    match = ISO_EXPRESSION.fullmatch(argument)
+    if match is None:
+        return None
+
+    try:
+        date = datetime.date(int(match["year"]), int(match["month"]), int(match["day"]))
+        if match["hour"] is None:
+            return datetime.datetime.combine(date, now.time()), True, False
+        time = datetime.time(int(match["hour"]), int(match["minute"]), int(match["second"] or 0))
+    except ValueError:
+        return None
+
+    return datetime.datetime.combine(date, time), True, True
+
+
+def fast_parse(argument: str, now: datetime.datetime) -> Optional[ParseResult]:
+    """Parses common time expressions like "in 2h", "tomorrow 5pm" or "2024-05-01" without parsedatetime.
+
+    Parameters
+    ----------
+    argument : str
+        The time expression.
+    now : datetime.datetime
+        The time to parse relative to. Only its wall clock is used.
+
+    Returns
+    -------
+    Optional[ParseResult]
+        The same result :func:`parse_expression` would give, or None if the expression isn't a common form.
+    """
+    argument = _normalize_expression(argument)
+    now = now.replace(tzinfo=None, microsecond=0)
+    return _parse_relative(argument, now) or _parse_clock(argument, now) or _parse_iso(argument, now)
+
+
+def _parse_with_calendar(argument: str, now: datetime.datetime) -> ParseResult:
+    dt, status = HumanTime.calendar.parseDT(argument, sourceTime=now)
+    return dt, bool(status.hasDate), bool(status.hasTime)
+
+
+def parse_expression(argument: str, now: datetime.datetime) -> ParseResult:
+    """Parses a time expression like parsedatetime's ``parseDT``.
+
+    Common forms are handled by :func:`fast_parse`. Everything else goes through parsedatetime, whose results are
+    memoized for the rest of the minute.
+
+    Parameters
+    ----------
+    argument : str
+        The time expression.
+    now : datetime.datetime
+        The time to parse relative to. Only its wall clock is used.
+
+    Returns
+    -------
+    ParseResult
+        The naive datetime, whether the expression had a date and whether it had a time.
+    """
+    result = fast_parse(argument, now)
+    if result is not None:
+        return result
+
+    argument = _normalize_expression(argument)
+    # The wall clock already reflects the timezone, so it doubles as the timezone part of the key
+    now = now.replace(tzinfo=None, microsecond=0)
+    bucket = now.replace(second=0)
+    key = (argument, bucket)
+
+    try:
+        relative, value, has_date, has_time = _parse_memo[key]
+    except KeyError:
+        # Parsing at both ends of the minute tells whether the result moves with the current time
+        first = _parse_with_calendar(argument, bucket)
+        last = _parse_with_calendar(argument, bucket + datetime.timedelta(seconds=59))
+        if first == last:
+            relative, value = False, first[0]
+        elif first[1:] == last[1:] and last[0] - first[0] == datetime.timedelta(seconds=59):
+            relative, value = True, first[0] - bucket
+        else:
+            return _parse_with_calendar(argument, now)
+
+        has_date, has_time = first[1:]
+        _parse_memo[key] = (relative, value, has_date, has_time)
+
+    return (now + value if relative else value), has_date, has_time
+
 
 class ShortTime:
     compiled = re.compile("""(?:(?P<years>[0-9])(?:years?|y))?             # e.g. 2y
@@ -66,11 +237,7 @@ class ShortTime:
 
     @classmethod
     async def convert(cls, ctx: LightningContext, argument: str):
-        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id)
-        if tzinfo:
-            tzinfo = ZoneInfo(tzinfo)
-        else:
-            tzinfo = UTC_TZ
+        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id) or UTC_TZ
 
         return cls(argument, now=ctx.message.created_at, tz=tzinfo)
 
@@ -81,11 +248,11 @@ class HumanTime:
     def __init__(self, argument: str, *, now: Optional[datetime.datetime] = None,
                  tz: datetime.tzinfo = datetime.timezone.utc):
         now = now or datetime.datetime.now(tz)
-        dt, status = self.calendar.parseDT(argument, sourceTime=now)
-        if not status.hasDateOrTime:
+        dt, has_date, has_time = parse_expression(argument, now)
+        if not has_date and not has_time:
             raise commands.BadArgument('Invalid time provided, try e.g. "tomorrow" or "3 days"')
 
-        if not status.hasTime:
+        if not has_time:
             # replace it with the current time
             dt = dt.replace(hour=now.hour, minute=now.minute, second=now.second, microsecond=now.microsecond)
 
@@ -94,11 +261,7 @@ class HumanTime:
 
     @classmethod
     async def convert(cls, ctx: LightningContext, argument: str):
-        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id)
-        if tzinfo:
-            tzinfo = ZoneInfo(tzinfo)
-        else:
-            tzinfo = UTC_TZ
+        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id) or UTC_TZ
 
         return cls(argument, now=ctx.message.created_at, tz=tzinfo)
 
@@ -164,11 +327,7 @@ class UserFriendlyTime(commands.Converter):
         regex = ShortTime.compiled
         now = ctx.message.created_at
 
-        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id)
-        if tzinfo:
-            tzinfo = ZoneInfo(tzinfo)
-        else:
-            tzinfo = UTC_TZ
+        tzinfo = await ctx.bot.get_user_timezone(ctx.author.id) or UTC_TZ
 
         match = regex.match(argument)
         if match is not None and match.group(0):
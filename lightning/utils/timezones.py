@@ -0,0 +1,333 @@
+"""
+Lightning.py - A Discord bot
+Copyright (C) 2019-2024 LightSage
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation at version 3 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+import asyncpg
+import redis.asyncio as aioredis
+from lru import LRU
+from prometheus_client import Counter
+from rapidfuzz import fuzz, process
+from redis.exceptions import RedisError
+
+__all__ = ("UserTimezoneCache", "TimezoneIndex")
+log = logging.getLogger(__name__)
+
+TIMEZONE_LOOKUPS_COUNTER = Counter("lightning_user_timezone_lookups", "User timezone lookups", ['result'])
+
+TIMEZONES_KEY = "lightning:user_settings:timezones"
+INVALIDATION_CHANNEL = "lightning:user_settings:timezones:invalidate"
+
+# Areas used by canonical IANA keys. Anything else (US/Eastern, Etc/GMT+5, EST5EDT) is a legacy alias.
+CANONICAL_AREAS = frozenset({"Africa", "America", "Antarctica", "Arctic", "Asia", "Atlantic", "Australia", "Europe",
+                             "Indian", "Pacific"})
+
+
+class UserTimezoneCache:
+    """Resolves users' configured timezones.
+
+    Timezones are kept in a single Redis hash that is filled from ``user_settings`` at startup. Lookups go through an
+    in-process LRU of :class:`ZoneInfo` objects first. Changes are published over Redis pub/sub, so every process
+    evicts its copy.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The pool to read ``user_settings`` from.
+    redis_pool : redis.asyncio.Redis
+        The Redis client. It should decode responses.
+    max_size : int
+        How many users' timezones to keep in memory.
+    """
+    def __init__(self, pool: asyncpg.Pool, redis_pool: aioredis.Redis, *, max_size: int = 10_000) -> None:
+        self.pool = pool
+        self.redis_pool = redis_pool
+        self._cache: LRU = LRU(max_size)
+        self._task: Optional[asyncio.Task] = None
+        # Users whose timezone changed since the current warm started
+        self._changed: Optional[Set[int]] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="lightning-timezone-invalidations")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def warm(self, *, chunk_size: int = 1000) -> int:
+        """Copies every configured timezone from the database to Redis.
+
+        Rows are streamed with a server-side cursor and merged into the hash in chunks. Users that are in the hash, but
+        no longer have a timezone, are removed afterwards.
+
+        Users whose timezone changes while warming, in this process or another, are skipped and copied again from the
+        database at the end, so warming never reverts a newer change.
+
+        Returns
+        -------
+        int
+            How many timezones were copied.
+        """
+        self._changed = changed = set()
+        try:
+            total = 0
+            seen: Set[int] = set()
+            chunk: Dict[str, str] = {}
+            async with self.pool.acquire() as connection, connection.transaction():
+                query = "SELECT user_id, timezone FROM user_settings WHERE timezone IS NOT NULL;"
+                async for record in connection.cursor(query, prefetch=chunk_size):
+                    seen.add(record['user_id'])
+                    chunk[str(record['user_id'])] = record['timezone']
+                    if len(chunk) >= chunk_size:
+                        await self._merge(chunk)
+                        total += len(chunk)
+                        chunk.clear()
+
+            if chunk:
+                await self._merge(chunk)
+                total += len(chunk)
+
+            stale = [field async for field, _ in self.redis_pool.hscan_iter(TIMEZONES_KEY, count=chunk_size)
+                     if int(field) not in seen]
+            for index in range(0, len(stale), chunk_size):
+                fields = [field for field in stale[index:index + chunk_size] if int(field) not in changed]
+                if fields:
+                    await self.redis_pool.hdel(TIMEZONES_KEY, *fields)
+
+            while changed:
+                user_ids = list(changed)
+                changed.clear()
+                await self._replay(user_ids)
+        finally:
+            self._changed = None
+
+        self._cache.clear()
+        return total
+
+    async def _merge(self, chunk: Dict[str, str]) -> None:
+        mapping = {user_id: timezone for user_id, timezone in chunk.items() if int(user_id) not in self._changed}
+        if mapping:
+            await self.redis_pool.hset(TIMEZONES_KEY, mapping=mapping)
+
+    async def _replay(self, user_ids: List[int]) -> None:
+        query = """SELECT user_id, timezone FROM user_settings
+                   WHERE user_id = ANY($1::bigint[]) AND timezone IS NOT NULL;"""
+        timezones = {str(record['user_id']): record['timezone'] for record in await self.pool.fetch(query, user_ids)}
+        if timezones:
+            await self.redis_pool.hset(TIMEZONES_KEY, mapping=timezones)
+
+        removed = [str(user_id) for user_id in user_ids if str(user_id) not in timezones]
+        if removed:
+            await self.redis_pool.hdel(TIMEZONES_KEY, *removed)
+
+    async def get(self, user_id: int) -> Optional[ZoneInfo]:
+        """Gets a user's timezone, or None if they haven't set one."""
+        try:
+            timezone = self._cache[user_id]
+        except KeyError:
+            pass
+        else:
+            TIMEZONE_LOOKUPS_COUNTER.labels("hit").inc()
+            return timezone
+
+        TIMEZONE_LOOKUPS_COUNTER.labels("miss").inc()
+        key = await self.redis_pool.hget(TIMEZONES_KEY, str(user_id))
+        timezone = ZoneInfo(key) if key else None
+        self._cache[user_id] = timezone
+        return timezone
+
+    async def set(self, user_id: int, timezone: Optional[str]) -> None:
+        """Updates or removes a user's timezone in Redis and tells every process about it.
+
+        This does not update the database.
+        """
+        if self._changed is not None:
+            self._changed.add(user_id)
+
+        if timezone:
+            await self.redis_pool.hset(TIMEZONES_KEY, str(user_id), timezone)
+        else:
+            await self.redis_pool.hdel(TIMEZONES_KEY, str(user_id))
+
+        self._cache.pop(user_id, None)
+        await self.redis_pool.publish(INVALIDATION_CHANNEL, str(user_id))
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis_pool.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything could have changed while we weren't subscribed
+                self._cache.clear()
+                async for message in pubsub.listen():
+                    user_id = int(message['data'])
+                    self._cache.pop(user_id, None)
+                    if self._changed is not None:
+                        self._changed.add(user_id)
+            except RedisError as e:
+                log.warning("Lost the timezone invalidation subscription, resubscribing in 5 seconds", exc_info=e)
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.casefold().replace("_", " ").split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "ranked", "results")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        self.ranked: List[Tuple[int, int, int, str]] = []
+        self.results: Tuple[str, ...] = ()
+
+
+class TimezoneIndex:
+    """A search index over IANA timezone keys for autocomplete.
+
+    Every key is indexed under its full name, its city, each word of the city and its abbreviations (e.g. ``EST``).
+    Each trie node stores its best results up front, so a prefix lookup does not depend on the number of timezones.
+    Queries that match no prefix fall back to fuzzy matching against the same normalized terms.
+
+    Parameters
+    ----------
+    keys : Iterable[str]
+        The timezone keys to index, usually :func:`zoneinfo.available_timezones`.
+    limit : int
+        The maximum number of results to return for a query.
+    """
+    def __init__(self, keys: Iterable[str], *, limit: int = 25) -> None:
+        self.limit = limit
+        self.keys: Set[str] = set(keys)
+        self._root = _TrieNode()
+        # normalized term -> keys, used for exact lookups and the fuzzy fallback
+        self._terms: Dict[str, List[str]] = {}
+
+        for key in sorted(self.keys):
+            for term, kind in self._terms_for(key).items():
+                self._add(term, kind, key)
+
+        self._choices = list(self._terms)
+        self._finalize(self._root)
+
+    @staticmethod
+    def _terms_for(key: str) -> Dict[str, int]:
+        # term -> kind, where a lower kind is a better match
+        terms: Dict[str, int] = {}
+        city = _normalize(key.rsplit("/", 1)[-1])
+        for word in city.split():
+            # Skip particles like "la" and "of"
+            if len(word) > 2:
+                terms[word] = 2
+        terms[city] = 1
+        terms[_normalize(key)] = 0
+
+        try:
+            zone = ZoneInfo(key)
+        except Exception:
+            return terms
+
+        year = datetime.now().year
+        for month in (1, 7):
+            abbreviation = datetime(year, month, 1, tzinfo=zone).tzname()
+            # Zones without a real abbreviation report offsets like "+03"
+            if abbreviation and abbreviation.isalpha():
+                terms.setdefault(_normalize(abbreviation), 3)
+        return terms
+
+    @staticmethod
+    def _priority(key: str) -> int:
+        return 0 if key.split("/", 1)[0] in CANONICAL_AREAS and "/" in key else 1
+
+    def _add(self, term: str, kind: int, key: str) -> None:
+        self._terms.setdefault(term, []).append(key)
+
+        # Shorter terms rank first, so an exact match beats a longer name that merely starts with the query
+        rank = (len(term), kind, self._priority(key), key)
+        node = self._root
+        node.ranked.append(rank)
+        for char in term:
+            node = node.children.setdefault(char, _TrieNode())
+            node.ranked.append(rank)
+
+    def _finalize(self, node: _TrieNode) -> None:
+        results: List[str] = []
+        for *_, key in sorted(node.ranked):
+            if key not in results:
+                results.append(key)
+                if len(results) == self.limit:
+                    break
+        node.results = tuple(results)
+        node.ranked = []
+
+        for child in node.children.values():
+            self._finalize(child)
+
+    def _prefix(self, query: str) -> Tuple[str, ...]:
+        node = self._root
+        for char in query:
+            try:
+                node = node.children[char]
+            except KeyError:
+                return ()
+        return node.results
+
+    def search(self, query: str) -> List[str]:
+        """Searches for timezone keys matching a query, best matches first.
+
+        An empty query returns the shortest names, which are mostly abbreviations like ``UTC``.
+        """
+        query = _normalize(query)
+        results = self._prefix(query)
+        if results:
+            return list(results)
+
+        # Most likely a typo
+        matches: List[str] = []
+        for term, _, _ in process.extract(query, self._choices, scorer=fuzz.ratio, processor=None,
+                                          limit=self.limit, score_cutoff=75):
+            for key in self._terms[term]:
+                if key not in matches:
+                    matches.append(key)
+        return matches[:self.limit]
+
+    def resolve(self, query: str) -> Optional[str]:
+        """Resolves a query to a single timezone key.
+
+        This matches keys case-insensitively, cities and abbreviations that only belong to one timezone.
+        """
+        if query in self.keys:
+            return query
+
+        keys = self._terms.get(_normalize(query), [])
+        if len(keys) == 1:
+            return keys[0]
+
+        # "America/New_York" also matches the "new york" city term, so prefer the key it spells out
+        for key in keys:
+            if _normalize(key) == _normalize(query):
+                return key
+        return None
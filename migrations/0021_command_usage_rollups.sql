@@ -0,0 +1,26 @@
+-- Pre-aggregated command usage, maintained by the command stats bulk inserter.
+-- Existing history can be loaded with `lightning db backfill-rollups`.
+
+-- guild_id and channel_id are 0 for commands used in DMs (primary keys can't contain NULL)
+CREATE TABLE IF NOT EXISTS command_usage_daily
+(
+    guild_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    command_name TEXT NOT NULL,
+    channel_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    uses BIGINT NOT NULL DEFAULT 0,
+    first_used_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (guild_id, user_id, command_name, channel_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS command_usage_daily_user_id_idx ON command_usage_daily (user_id, day);
+
+CREATE TABLE IF NOT EXISTS command_usage_hourly
+(
+    day DATE NOT NULL,
+    hour SMALLINT NOT NULL,
+    command_name TEXT NOT NULL,
+    uses BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, hour, command_name)
+);
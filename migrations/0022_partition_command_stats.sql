@@ -0,0 +1,50 @@
+-- Range partition command_stats by month of used_at.
+-- The Stats cog keeps creating partitions ahead of time and expires old ones (see bot.command_stats_retention).
+
+ALTER TABLE command_stats RENAME TO command_stats_unpartitioned;
+
+CREATE TABLE command_stats
+(
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    guild_id BIGINT,
+    channel_id BIGINT,
+    user_id BIGINT,
+    used_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    command_name TEXT,
+    failure BOOLEAN,
+    application_command BOOLEAN,
+    PRIMARY KEY (id, used_at)
+) PARTITION BY RANGE (used_at);
+
+CREATE INDEX IF NOT EXISTS command_stats_user_id_idx ON command_stats (user_id, used_at, command_name);
+CREATE INDEX IF NOT EXISTS command_stats_guild_id_idx ON command_stats (guild_id, used_at);
+
+-- Catches anything outside of the monthly partitions (clock skew, replayed rows older than retention, etc.)
+CREATE TABLE IF NOT EXISTS command_stats_default PARTITION OF command_stats DEFAULT;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT MIN(used_at) FROM command_stats_unpartitioned),
+                                         timezone('UTC', now()))),
+            date_trunc('month', timezone('UTC', now())) + INTERVAL '3 months',
+            INTERVAL '1 month')::date
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF command_stats FOR VALUES FROM (%L) TO (%L);',
+                       'command_stats_p' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month');
+    END LOOP;
+END $$;
+
+-- Rows without a timestamp can't be placed in a partition and are skipped by every stats query anyways.
+INSERT INTO command_stats (id, guild_id, channel_id, user_id, used_at, command_name, failure, application_command)
+SELECT id, guild_id, channel_id, user_id, used_at, command_name, failure, application_command
+FROM command_stats_unpartitioned
+WHERE used_at IS NOT NULL;
+
+SELECT setval(pg_get_serial_sequence('command_stats', 'id'),
+              GREATEST((SELECT MAX(id) FROM command_stats_unpartitioned), 1));
+
+DROP TABLE command_stats_unpartitioned;
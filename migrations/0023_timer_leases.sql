@@ -0,0 +1,4 @@
+-- Timers are leased to the bot process that will fire them, so several processes can split the work.
+-- A lease runs out shortly after the timer's expiry, after which another process can pick it up.
+ALTER TABLE timers ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE timers ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITHOUT TIME ZONE;
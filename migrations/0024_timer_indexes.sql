@@ -0,0 +1,9 @@
+-- Reminders were looked up by extra ->> 'author', which can't use a plain index.
+-- author_id is generated from extra, so rows written by the API get it too.
+ALTER TABLE timers ADD COLUMN IF NOT EXISTS author_id BIGINT
+    GENERATED ALWAYS AS (CASE WHEN event = 'reminder' THEN (extra ->> 'author')::bigint END) STORED;
+
+CREATE INDEX IF NOT EXISTS timers_author_id_idx ON timers (author_id, expiry) WHERE author_id IS NOT NULL;
+
+-- expiry is stored as UTC, so due timers can be found without converting each row
+CREATE INDEX IF NOT EXISTS timers_expiry_idx ON timers (expiry, id);
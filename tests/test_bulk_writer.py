@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from lightning.utils.bulk import BulkBuffer, BulkWriter
+from tests.database import DatabaseTestCase
+
+WRITER = BulkWriter("bulk_spoke", ("user_id", "guild_id", "first_spoke_at", "last_spoke_at"),
+                    conflict="""ON CONFLICT (user_id, guild_id) DO UPDATE
+                                SET last_spoke_at = EXCLUDED.last_spoke_at,
+                                    first_spoke_at = LEAST(bulk_spoke.first_spoke_at, EXCLUDED.first_spoke_at)""")
+
+
+class TestBulkWriter(DatabaseTestCase):
+    schema = "bulk_writer_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        query = """CREATE TABLE bulk_spoke (user_id BIGINT NOT NULL, guild_id BIGINT NOT NULL,
+                                            first_spoke_at TIMESTAMP, last_spoke_at TIMESTAMP,
+                                            PRIMARY KEY (user_id, guild_id));"""
+        await self.pool.execute(query)
+
+    async def test_write_and_merge(self):
+        now = datetime(2024, 1, 1)
+        later = now + timedelta(hours=1)
+
+        total = await WRITER.write(self.pool, [(1, 1, now, now), (2, 1, now, now)])
+        self.assertEqual(total, 2)
+
+        await WRITER.write(self.pool, [(1, 1, later, later)])
+
+        record = await self.pool.fetchrow("SELECT * FROM bulk_spoke WHERE user_id=1 AND guild_id=1;")
+        self.assertEqual(record['first_spoke_at'], now)
+        self.assertEqual(record['last_spoke_at'], later)
+        self.assertEqual(await self.pool.fetchval("SELECT COUNT(*) FROM bulk_spoke;"), 2)
+
+    async def test_write_nothing(self):
+        self.assertEqual(await WRITER.write(self.pool, []), 0)
+
+
+class FlakyWriter:
+    def __init__(self):
+        self.available = False
+        self.written = []
+        # Rows with this ID make the database reject their batch
+        self.invalid = None
+        # How many more batches can be written before the database goes away
+        self.budget = None
+
+    async def write(self, conn, records):
+        if not self.available or self.budget == 0:
+            raise ConnectionRefusedError
+        if any(record[0] == self.invalid for record in records):
+            raise ValueError("invalid input syntax")
+        if self.budget is not None:
+            self.budget -= 1
+        self.written.extend(records)
+        return len(records)
+
+
+class TestBulkBuffer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.writer = FlakyWriter()
+        self.buffer = BulkBuffer(self.writer, name="test", max_pending_rows=2,
+                                 spill_path=os.path.join(self.tmp.name, "spill.jsonl"))
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_retry_and_spill(self):
+        now = datetime(2024, 1, 1, 12, 30)
+        for batch in range(3):
+            self.buffer.append((batch, now))
+            self.buffer.append((batch, now))
+            self.assertEqual(await self.buffer.flush(None), 0)
+
+        # Only the newest batch stays in memory, the rest goes to disk
+        self.assertEqual(len(self.buffer), 2)
+        self.assertTrue(self.buffer.has_spilled_rows)
+
+        self.writer.available = True
+        self.assertEqual(await self.buffer.flush(None), 6)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertFalse(self.buffer.has_spilled_rows)
+        self.assertIn([0, now], self.writer.written)
+        self.assertIn((2, now), self.writer.written)
+
+    async def test_replay_chunks(self):
+        buffer = BulkBuffer(self.writer, name="test", max_pending_rows=0, replay_chunk_size=2,
+                            spill_path=self.buffer.spill_path)
+        now = datetime(2024, 1, 1, 12, 30)
+        for row in range(8):
+            buffer.append((row, now))
+            await buffer.flush(None)
+        await buffer.spill()
+
+        # An outage partway through the replay resumes where it left off
+        self.writer.available = True
+        self.writer.invalid = 3
+        self.writer.budget = 1
+        await buffer.flush(None)
+        self.assertEqual(len(self.writer.written), 2)
+        self.assertTrue(buffer.has_spilled_rows)
+
+        self.writer.budget = None
+        self.assertEqual(await buffer.flush(None), 4)
+        self.assertFalse(buffer.has_spilled_rows)
+        self.assertEqual(sorted(row for row, _ in self.writer.written), [0, 1, 4, 5, 6, 7])
+        with open(f"{buffer.spill_path}.rejected", "rb") as fp:
+            self.assertEqual(len(fp.readlines()), 2)
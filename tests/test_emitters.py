@@ -0,0 +1,170 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from lightning.utils.emitters import (EmitterScheduler, TextChannelEmitter,
+                                      WebhookChannelEmitter, pack_entries)
+
+
+class FakeChannel:
+    def __init__(self, channel_id=1):
+        self.id = channel_id
+        self._state = SimpleNamespace(http=SimpleNamespace())
+        self.sent = []
+
+    async def send(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+class TestPackEntries(unittest.TestCase):
+    def test_text(self):
+        entries = [{'content': "x" * 99} for _ in range(50)]
+        messages = pack_entries(entries)
+        self.assertEqual([len(m['content']) for m in messages], [1999, 1999, 999])
+
+    def test_embeds(self):
+        entries = [{'content': None, 'embed': discord.Embed(title=str(i))} for i in range(25)]
+        entries.insert(12, {'content': "with an embed", 'embed': discord.Embed(title="details")})
+        messages = pack_entries(entries)
+        self.assertEqual([len(m['embeds']) for m in messages], [10, 2, 1, 10, 3])
+        self.assertEqual(messages[2]['content'], "with an embed")
+
+    def test_mentions(self):
+        first, second = discord.Object(1), discord.Object(2)
+        entries = [{'content': "a", 'allowed_mentions': discord.AllowedMentions(users=[first])},
+                   {'content': "b", 'allowed_mentions': discord.AllowedMentions(users=[second])},
+                   {'content': "c"}]
+        messages = pack_entries(entries)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[0]['content'], "a\nb")
+        self.assertEqual(messages[0]['allowed_mentions'].users, [first, second])
+
+
+class TestTextChannelEmitter(unittest.IsolatedAsyncioTestCase):
+    async def test_overflow(self):
+        channel = FakeChannel()
+        emitter = TextChannelEmitter(channel, max_size=5)
+        for i in range(12):
+            await emitter.put(str(i))
+
+        emitter.start()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        emitter.close()
+
+        self.assertEqual(channel.sent, [{'content': "0\n1\n2\n3\n4\n\N{HORIZONTAL ELLIPSIS}and 7 more events"}])
+
+    async def test_webhook_fallback(self):
+        channel = FakeChannel()
+        emitter = WebhookChannelEmitter(channel, "https://discord.com/api/webhooks/123456789012345678/" + "a" * 68,
+                                        session=None)
+        sent = []
+
+        async def send(**kwargs):
+            if sent:
+                raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Webhook")
+            sent.append(kwargs)
+
+        emitter.webhook = SimpleNamespace(send=send)
+        await emitter.deliver({'content': "first"})
+        await emitter.deliver({'content': "second"})
+        await emitter.deliver({'content': "third"})
+
+        self.assertEqual(sent, [{'content': "first"}])
+        self.assertEqual(channel.sent, [{'content': "second"}, {'content': "third"}])
+        self.assertIsNone(emitter.webhook)
+
+    async def test_delivery_result(self):
+        channel = FakeChannel()
+        emitter = TextChannelEmitter(channel)
+        errors = [discord.DiscordServerError(SimpleNamespace(status=503, reason="Unavailable"), "Unavailable"),
+                  asyncio.TimeoutError(),
+                  discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")]
+
+        async def send(**kwargs):
+            raise errors.pop(0)
+
+        channel.send = send
+        # Only failures that might go away are worth retrying
+        self.assertFalse(await emitter.deliver({'content': "a"}))
+        self.assertFalse(await emitter.deliver({'content': "a"}))
+        self.assertTrue(await emitter.deliver({'content': "a"}))
+
+    async def test_deliver_batch(self):
+        channel = FakeChannel()
+        emitter = EmitterScheduler().add(channel.id, TextChannelEmitter(channel))
+        entries = [{'content': "a"}, {'embed': discord.Embed(title="b")}, {'content': "c"}]
+
+        async def send(**kwargs):
+            channel.sent.append(kwargs)
+            emitter.close()
+
+        # Entries after the emitter was closed are left to be delivered elsewhere
+        channel.send = send
+        self.assertEqual(await emitter.deliver_batch(entries), 1)
+
+        async def send(**kwargs):
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Channel")
+
+        # Nothing can be delivered to a channel that's gone
+        channel.send = send
+        emitter = EmitterScheduler().add(channel.id, TextChannelEmitter(channel))
+        self.assertEqual(await emitter.deliver_batch(entries), 3)
+        self.assertTrue(emitter.gone)
+
+
+class RateLimitedEmitter(TextChannelEmitter):
+    def __init__(self, channel, delay):
+        super().__init__(channel)
+        self.delay = delay
+
+    def ratelimit_delay(self):
+        delay, self.delay = self.delay, 0.0
+        return delay
+
+
+class TestEmitterScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_delivery(self):
+        scheduler = EmitterScheduler(workers=1, idle_timeout=60)
+        scheduler.start()
+        self.addCleanup(scheduler.close)
+
+        slow, fast = FakeChannel(1), FakeChannel(2)
+        scheduler.add(slow.id, RateLimitedEmitter(slow, 0.05))
+        scheduler.add(fast.id, TextChannelEmitter(fast))
+        await scheduler.get(slow.id).put("a")
+        await scheduler.get(fast.id).put("b")
+        await scheduler.get(fast.id).put("c")
+        self.assertEqual((scheduler.active, scheduler.idle), (2, 0))
+
+        # The rate limited emitter doesn't hold up the worker
+        await asyncio.sleep(0.01)
+        self.assertEqual((slow.sent, fast.sent), ([], [{'content': "b\nc"}]))
+        await scheduler.get(slow.id).put("d")
+        await asyncio.sleep(0.1)
+        self.assertEqual(slow.sent, [{'content': "a\nd"}])
+        self.assertEqual((scheduler.active, scheduler.idle), (0, 2))
+
+    async def test_reap(self):
+        scheduler = EmitterScheduler(idle_timeout=0)
+        busy, delivering, idle = (TextChannelEmitter(FakeChannel(i)) for i in range(1, 4))
+        scheduler.add(1, busy)
+        scheduler.add(2, delivering)
+        scheduler.add(3, idle)
+        await busy.put("pending")
+
+        async with delivering.lock:
+            self.assertEqual(scheduler.reap(), 1)
+        self.assertIs(scheduler.get(1), busy)
+        self.assertIs(scheduler.get(2), delivering)
+        self.assertIsNone(scheduler.get(3))
+        # Anything still holding the reaped emitter can't queue entries that would never be delivered
+        self.assertTrue(idle.closed)
+        await idle.put("late")
+        self.assertEqual(idle.pending, 0)
+
+        busy.close()
+        delivering.close()
+        self.assertEqual(scheduler.emitters, {})
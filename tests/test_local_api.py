@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sanctum.exceptions import DataConflict, HTTPException, NotFound
+
+from lightning.utils.localapi import LocalHTTPClient
+from tests.database import DatabaseTestCase
+
+
+class TestLocalHTTPClient(DatabaseTestCase):
+    schema = "sanctum_local_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.api = LocalHTTPClient(self.pool, ttls={}, max_retries=0)
+        await self.api.request("PUT", "/guilds/1", data={"name": "Test", "owner_id": 2})
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await super().asyncTearDown()
+
+    async def test_reminders(self):
+        now = datetime(2024, 1, 1)
+        data = {"event": "reminder", "created": now.isoformat(), "expiry": (now + timedelta(hours=1)).isoformat(),
+                "timezone": "UTC", "extra": {"author": 5, "channel": 6, "reminder_text": "hi"}}
+        timer = await self.api.request("PUT", "/timers", data=data)
+        self.assertEqual(timer['expiry'], "2024-01-01T01:00:00")
+
+        reminders = await self.api.request("GET", "/users/5/reminders")
+        self.assertEqual([r['id'] for r in reminders], [timer['id']])
+
+        edited = await self.api.request("PATCH", f"/users/5/reminders/{timer['id']}", data={"reminder_text": "bye"})
+        self.assertEqual(edited['extra']['reminder_text'], "bye")
+
+        with self.assertRaises(NotFound):
+            await self.api.request("GET", f"/users/7/reminders/{timer['id']}")
+
+        await self.api.request("DELETE", f"/users/5/reminders/{timer['id']}")
+        with self.assertRaises(NotFound):
+            await self.api.request("GET", "/timers", params={"limit": 1})
+
+    async def test_infractions(self):
+        data = {"user_id": 10, "moderator_id": 2, "action": 1, "reason": "test"}
+        infraction = await self.api.request("PUT", "/guilds/1/infractions", data=data)
+        await self.api.request("PUT", "/guilds/1/infractions", data={**data, "action": 2})
+
+        warns = await self.api.request("GET", "/guilds/1/users/10/infractions", params={"action": 1})
+        self.assertEqual([i['id'] for i in warns], [infraction['id']])
+
+        edited = await self.api.request("PATCH", f"/guilds/1/infractions/{infraction['id']}",
+                                        data={"reason": "edited"})
+        self.assertEqual(edited['reason'], "edited")
+
+        deleted = await self.api.request("DELETE", "/guilds/1/users/10/infractions")
+        self.assertEqual(len(deleted), 2)
+
+    async def test_automod(self):
+        with self.assertRaises(NotFound):
+            await self.api.request("GET", "/guilds/1/automod")
+
+        await self.api.request("PUT", "/guilds/1/automod/ignores", data=[3])
+        rule = {"type": "mass-mentions", "count": 5, "seconds": 0, "punishment": {"type": "BAN", "duration": None}}
+        await self.api.request("PUT", "/guilds/1/automod/rules", data=rule)
+        with self.assertRaises(DataConflict):
+            await self.api.request("PUT", "/guilds/1/automod/rules", data=rule)
+
+        config = await self.api.request("GET", "/guilds/1/automod")
+        self.assertEqual(config['default_ignores'], [3])
+        self.assertEqual(config['rules'][0]['punishment'], {"type": "BAN", "duration": None})
+
+        await self.api.request("DELETE", "/guilds/1/automod/rules/mass-mentions")
+        with self.assertRaises(NotFound):
+            await self.api.request("GET", "/guilds/1/automod/rules")
+
+    async def test_injected_errors(self):
+        self.api.error_rate = 1.0
+        with self.assertRaises(HTTPException) as cm:
+            await self.api.request("GET", "/guilds/1")
+        self.assertEqual(cm.exception.status_code, 503)
+
+    async def test_retries(self):
+        self.api.max_retries = 1
+        self.api.retry_backoff = 0
+        perform = self.api._perform
+        attempts = []
+
+        async def lost_response(method, path, **kwargs):
+            # The first attempt goes through, but its response never arrives
+            attempts.append(method)
+            result = await perform(method, path, **kwargs)
+            if len(attempts) == 1:
+                raise asyncio.TimeoutError()
+            return result
+
+        self.api._perform = lost_response
+        data = {"user_id": 10, "moderator_id": 2, "action": 1, "reason": "test"}
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.api.request("PUT", "/guilds/1/infractions", data=data)
+        self.api._perform = perform
+        infractions = await self.api.request("GET", "/guilds/1/infractions")
+        self.assertEqual(len(infractions), 1)
+
+        attempts.clear()
+        self.api._perform = lost_response
+        self.assertIsNone(await self.api.request("DELETE", f"/guilds/1/infractions/{infractions[0]['id']}"))
+        self.assertEqual(attempts, ["DELETE", "DELETE"])
+
+        attempts.clear()
+        guild = await self.api.request("GET", "/guilds/1")
+        self.assertEqual(guild['name'], "Test")
+        self.assertEqual(attempts, ["GET", "GET"])
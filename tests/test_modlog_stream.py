@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from lightning.cogs.modlog.stream import (ModLogStream, dump_entry,
+                                          load_entry)
+from lightning.utils.emitters import BatchingEmitter
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def xack(self, key, group, *ids):
+        self.redis.acked.extend(ids)
+
+    def xdel(self, key, *ids):
+        self.redis.deleted.extend(ids)
+
+    async def execute(self, raise_on_error=True):
+        return []
+
+
+class FakeRedis:
+    def __init__(self):
+        self.acked = []
+        self.deleted = []
+        self.reaped = []
+
+    def register_script(self, script):
+        async def run(keys, args):
+            self.reaped.append(keys[0])
+        return run
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakeEmitter(BatchingEmitter):
+    def __init__(self, *, result=True):
+        super().__init__()
+        self.result = result
+        self.delivered = []
+        self.sending = False
+
+    async def deliver(self, message):
+        # Two deliveries posting in the channel at once would overlap here
+        assert not self.sending
+        self.sending = True
+        await asyncio.sleep(0)
+        self.sending = False
+        if self.result:
+            self.delivered.append(message)
+        return self.result
+
+
+class TestEntries(unittest.TestCase):
+    def test_round_trip(self):
+        timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        embed = discord.Embed(title="Ban", description="spam", timestamp=timestamp)
+        entry = {'content': "hello", 'embed': embed,
+                 'allowed_mentions': discord.AllowedMentions(users=[discord.Object(1), discord.Object(2)])}
+        loaded = load_entry(dump_entry(entry))
+        self.assertEqual(loaded['content'], "hello")
+        self.assertEqual(loaded['embed'].to_dict(), embed.to_dict())
+        self.assertEqual([user.id for user in loaded['allowed_mentions'].users], [1, 2])
+        # Defaults still defer to the bot's allowed mentions
+        merged = discord.AllowedMentions.none().merge(loaded['allowed_mentions'])
+        self.assertEqual(merged.to_dict(), {'parse': [], 'users': [1, 2]})
+
+        loaded = load_entry(dump_entry({'content': None, 'embeds': [embed, discord.Embed(title="Message")]}))
+        self.assertEqual([e.title for e in loaded['embeds']], ["Ban", "Message"])
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            dump_entry({'content': "a", 'file': object()})
+
+
+class TestModLogStream(unittest.IsolatedAsyncioTestCase):
+    async def test_deliver(self):
+        redis = FakeRedis()
+        emitter = FakeEmitter()
+
+        async def resolve(guild_id, channel_id):
+            return emitter if (guild_id, channel_id) == (10, 1) else None
+
+        stream = ModLogStream(SimpleNamespace(redis_pool=redis), resolve)
+        key = "lightning:modlog:stream:10"
+        await emitter.put("queued")
+        await asyncio.gather(emitter.flush(),
+                             stream.deliver([(key, "1-0", {'channel': "1", 'entry': dump_entry({'content': "a"})}),
+                                             (key, "2-0", {'channel': "2", 'entry': dump_entry({'content': "b"})}),
+                                             (key, "3-0", None),
+                                             (key, "4-0", {'channel': "1", 'entry': dump_entry({'content': "c"})})]))
+
+        self.assertEqual(emitter.delivered, [{'content': "queued"}, {'content': "a\nc"}])
+        # Entries for channels that stopped logging, or that were trimmed, are acknowledged too
+        self.assertEqual(sorted(redis.acked), ["1-0", "2-0", "3-0", "4-0"])
+        self.assertEqual(redis.deleted, redis.acked)
+        self.assertEqual(redis.reaped, [key])
+
+    async def test_transient_failure(self):
+        redis = FakeRedis()
+        emitter = FakeEmitter(result=False)
+
+        async def resolve(guild_id, channel_id):
+            return emitter
+
+        stream = ModLogStream(SimpleNamespace(redis_pool=redis), resolve)
+        key = "lightning:modlog:stream:10"
+        entries = [(key, "1-0", {'channel': "1", 'entry': dump_entry({'content': "a"})})]
+        await stream.deliver(entries)
+        # Left pending so it's claimed and retried
+        self.assertEqual(redis.acked, [])
+        self.assertEqual(redis.reaped, [])
+
+        emitter.result = True
+        await stream.deliver(entries)
+        self.assertEqual(redis.acked, ["1-0"])
+
+    async def test_partial_failure(self):
+        redis = FakeRedis()
+        emitter = FakeEmitter()
+
+        async def deliver(message):
+            if len(emitter.delivered) == 1:
+                return False
+            emitter.delivered.append(message)
+            return True
+
+        emitter.deliver = deliver
+
+        async def resolve(guild_id, channel_id):
+            return emitter
+
+        stream = ModLogStream(SimpleNamespace(redis_pool=redis), resolve)
+        key = "lightning:modlog:stream:10"
+        # Text and embeds aren't packed together, so each entry is its own message
+        entries = [{'content': "a"}, {'embed': discord.Embed(title="b")}, {'content': "c"}]
+        await stream.deliver([(key, f"{i}-0", {'channel': "1", 'entry': dump_entry(entry)})
+                              for i, entry in enumerate(entries, 1)])
+        # Only the entries that were sent are acknowledged, the rest are retried without sending the first again
+        self.assertEqual(redis.acked, ["1-0"])
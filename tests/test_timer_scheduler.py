@@ -0,0 +1,235 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import orjson
+from redis.exceptions import RedisError
+
+from lightning.cogs.reminders.scheduler import SHORT_TIMERS_KEY, TimerScheduler
+from lightning.models import Timer
+from tests.database import DatabaseTestCase
+
+
+class FakeAPI:
+    def invalidate(self, prefix):
+        return 0
+
+
+class FakeRedis:
+    def __init__(self):
+        self.zsets = {}
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zrange(self, key, start, end, *, byscore=False, offset=None, num=None, withscores=False):
+        start = float(start.lstrip("("))
+        members = [(member, score) for member, score in sorted(self.zsets.get(key, {}).items(), key=lambda m: m[1])
+                   if start < score <= float(end)][:num]
+        return members if withscores else [member for member, _ in members]
+
+    async def zrem(self, key, *members):
+        return sum(self.zsets.get(key, {}).pop(member, None) is not None for member in members)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def zrem(self, key, *members):
+        self.commands.append(self.redis.zrem(key, *members))
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+
+class FakeBot:
+    def __init__(self, pool):
+        self.pool = pool
+        self.api = FakeAPI()
+        self.redis_pool = FakeRedis()
+        self.dispatched = []
+        self.shard_ids = None
+        self.shard_count = 1
+
+    def dispatch(self, event, timer):
+        self.dispatched.append((event, timer.id))
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_closed(self):
+        return False
+
+
+class TestTimerScheduler(DatabaseTestCase):
+    schema = "timer_scheduler_test"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.bot = FakeBot(self.pool)
+
+    async def insert_timers(self, expiries):
+        query = "INSERT INTO timers (event, expiry, extra) SELECT 'test', unnest($1::timestamp[]), '{}' RETURNING id;"
+        return [record['id'] for record in await self.pool.fetch(query, expiries)]
+
+    async def test_fire_and_acknowledge(self):
+        now = datetime.utcnow()
+        due = await self.insert_timers([now - timedelta(seconds=1)] * 150)
+        later = await self.insert_timers([now + timedelta(seconds=0.3), now + timedelta(hours=1)])
+
+        scheduler = TimerScheduler(self.bot, window=timedelta(minutes=10), batch_size=100, ack_batch_size=50)
+        scheduler.start()
+        try:
+            await asyncio.sleep(0.1)
+            self.assertEqual(sorted(i for _, i in self.bot.dispatched), due)
+
+            # Timers created while running are scheduled without polling
+            expiry = datetime.utcnow() + timedelta(seconds=0.1)
+            timer = Timer((await self.insert_timers([expiry]))[0], "test", now, expiry, "UTC", {})
+            self.assertTrue(await scheduler.schedule(timer))
+            scheduler.discard(later[0])
+            await asyncio.sleep(0.5)
+        finally:
+            await scheduler.close()
+
+        # Nothing is left running to take leases after they were released
+        self.assertTrue(scheduler._task.done() and scheduler._ack_task.done())
+        fired = [i for _, i in self.bot.dispatched]
+        self.assertEqual(len(fired), len(set(fired)))
+        self.assertIn(timer.id, fired)
+        self.assertNotIn(later[0], fired)
+        self.assertNotIn(later[1], fired)
+
+        remaining = await self.pool.fetch("SELECT id FROM timers ORDER BY id;")
+        self.assertEqual([r['id'] for r in remaining], later)
+
+    async def test_short_timers_survive_restart(self):
+        now = datetime.utcnow()
+        scheduler = TimerScheduler(self.bot)
+        await scheduler.add_short_timer(Timer(None, "short", now, now + timedelta(seconds=0.2), "UTC", {"a": 1}))
+        await scheduler.close()
+        self.assertEqual(self.bot.dispatched, [])
+
+        scheduler = TimerScheduler(self.bot, short_timer_grace=timedelta(0))
+        scheduler.start()
+        try:
+            await asyncio.sleep(0.4)
+        finally:
+            await scheduler.close()
+
+        self.assertEqual(self.bot.dispatched, [("lightning_short_complete", None)])
+        self.assertEqual(self.bot.redis_pool.zsets["lightning:timers:short"], {})
+
+    async def test_workers_split_timers(self):
+        now = datetime.utcnow()
+        due = await self.insert_timers([now - timedelta(seconds=1)] * 300)
+
+        workers = [TimerScheduler(self.bot, batch_size=50) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        try:
+            await asyncio.sleep(0.5)
+        finally:
+            for worker in workers:
+                await worker.close()
+
+        self.assertEqual(sorted(i for _, i in self.bot.dispatched), due)
+        self.assertEqual(await self.pool.fetchval("SELECT COUNT(*) FROM timers;"), 0)
+
+    async def test_recover_expired_leases(self):
+        now = datetime.utcnow()
+        ids = await self.insert_timers([now + timedelta(seconds=0.2)] * 5)
+
+        # This worker leases the timers, then dies before they fire
+        dead = TimerScheduler(self.bot, lease=timedelta(seconds=0.3))
+        await dead.refill()
+        self.assertEqual(len(dead), 5)
+
+        worker = TimerScheduler(self.bot, lease=timedelta(seconds=0.3))
+        await worker.refill()
+        self.assertEqual(len(worker), 0)
+
+        worker.start()
+        try:
+            await asyncio.sleep(1)
+        finally:
+            await worker.close()
+
+        self.assertEqual(sorted(i for _, i in self.bot.dispatched), ids)
+
+    async def test_acknowledge_without_redis(self):
+        now = datetime.utcnow()
+        ids = await self.insert_timers([now - timedelta(seconds=1)] * 3)
+        scheduler = TimerScheduler(self.bot)
+        await scheduler.add_short_timer(Timer(None, "short", now, now - timedelta(seconds=1), "UTC", {}))
+        await scheduler.refill()
+        self.assertEqual(await scheduler.fire_due(datetime.utcnow()), 4)
+
+        async def zrem(key, *members):
+            raise RedisError("unavailable")
+
+        self.bot.redis_pool.zrem = zrem
+        self.assertEqual(await scheduler.flush(), 3)
+        self.assertEqual(await self.pool.fetchval("SELECT COUNT(*) FROM timers WHERE id = ANY($1::int[]);", ids), 0)
+        # The short timer is kept until Redis comes back
+        self.assertEqual(len(scheduler._unacknowledged_short), 1)
+
+    async def test_timers_routed_by_guild(self):
+        now = datetime.utcnow()
+        # Guild IDs 0 and 1 << 22 land on shards 0 and 1 of 2
+        query = "INSERT INTO timers (event, expiry, extra) SELECT 'test', $1, unnest($2::jsonb[]) RETURNING id;"
+        records = await self.pool.fetch(query, now - timedelta(seconds=1),
+                                        [{"channel": 1, "guild_id": 0}, {"channel": 1, "guild_id": 1 << 22}, {}])
+        ours, theirs, anyone = [record['id'] for record in records]
+
+        scheduler = TimerScheduler(self.bot, short_timer_grace=timedelta(0))
+        for guild_id in (0, 1 << 22, None):
+            extra = {"guild_id": guild_id} if guild_id is not None else {}
+            await scheduler.add_short_timer(Timer(None, "short", now, now - timedelta(seconds=1), "UTC", extra))
+        await scheduler.close()
+
+        self.bot.shard_ids = [0]
+        self.bot.shard_count = 2
+        worker = TimerScheduler(self.bot, short_timer_grace=timedelta(0))
+        await worker.refill()
+        self.assertIn(ours, worker)
+        self.assertIn(anyone, worker)
+        self.assertNotIn(theirs, worker)
+        # The short timer for the other shard's guild is left in Redis for that shard
+        self.assertEqual(len(worker), 4)
+        self.assertEqual([orjson.loads(member)['extra'] for member in self.bot.redis_pool.zsets[SHORT_TIMERS_KEY]],
+                         [{"guild_id": 1 << 22}])
+
+    async def test_changes_from_other_workers(self):
+        now = datetime.utcnow()
+        query = "INSERT INTO timers (event, expiry, extra) SELECT 'test', $1, unnest($2::jsonb[]) RETURNING id;"
+        records = await self.pool.fetch(query, now + timedelta(seconds=0.2), [{"text": "a"}, {"text": "b"}])
+        deleted, edited = [record['id'] for record in records]
+
+        owner = TimerScheduler(self.bot)
+        await owner.refill()
+        self.assertEqual(len(owner), 2)
+
+        # The commands to delete and edit these reminders ran on a process that doesn't hold their leases
+        other = TimerScheduler(self.bot)
+        await self.pool.execute("DELETE FROM timers WHERE id=$1;", deleted)
+        other.discard(deleted)
+        await self.pool.execute("UPDATE timers SET extra=$2 WHERE id=$1;", edited, {"text": "c"})
+        other.update(edited, {"text": "c"})
+
+        fired = []
+        self.bot.dispatch = lambda event, timer: fired.append((timer.id, timer.extra))
+        self.assertEqual(await owner.fire_due(now + timedelta(seconds=1)), 1)
+        self.assertEqual(fired, [(edited, {"text": "c"})])
+        await owner.close()
+        await other.close()
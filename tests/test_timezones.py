@@ -0,0 +1,104 @@
+import unittest
+from zoneinfo import ZoneInfo, available_timezones
+
+from lightning.utils.timezones import (TIMEZONES_KEY, TimezoneIndex,
+                                       UserTimezoneCache)
+from tests.database import DatabaseTestCase
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.published = []
+        self.hgets = 0
+
+    async def hset(self, key, field=None, value=None, *, mapping=None):
+        data = self.hashes.setdefault(key, {})
+        if field is not None:
+            data[field] = value
+        data.update(mapping or {})
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    async def hscan_iter(self, key, count=None):
+        for item in list(self.hashes.get(key, {}).items()):
+            yield item
+
+    async def hget(self, key, field):
+        self.hgets += 1
+        return self.hashes.get(key, {}).get(field)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class TestUserTimezoneCache(DatabaseTestCase):
+    schema = "user_timezones_test"
+
+    async def test_warm_and_lookup(self):
+        await self.pool.execute("INSERT INTO user_settings (user_id, timezone) "
+                                "SELECT i, 'America/New_York' FROM generate_series(1, 2500) AS i;")
+        await self.pool.execute("INSERT INTO user_settings (user_id, timezone) VALUES (3000, NULL);")
+
+        redis = FakeRedis()
+        redis.hashes[TIMEZONES_KEY] = {"9999": "Europe/London"}
+        timezones = UserTimezoneCache(self.pool, redis)
+        self.assertEqual(await timezones.warm(chunk_size=1000), 2500)
+        # Stale entries are removed
+        self.assertEqual(len(redis.hashes[TIMEZONES_KEY]), 2500)
+        self.assertNotIn("9999", redis.hashes[TIMEZONES_KEY])
+
+        self.assertEqual(await timezones.get(1), ZoneInfo("America/New_York"))
+        self.assertIsNone(await timezones.get(3000))
+        self.assertIsNone(await timezones.get(3000))
+        await timezones.get(1)
+        self.assertEqual(redis.hgets, 2)
+
+        await timezones.set(1, "Asia/Tokyo")
+        self.assertEqual(await timezones.get(1), ZoneInfo("Asia/Tokyo"))
+        await timezones.set(1, None)
+        self.assertIsNone(await timezones.get(1))
+        self.assertEqual(redis.published, [("lightning:user_settings:timezones:invalidate", "1")] * 2)
+
+    async def test_warm_keeps_concurrent_changes(self):
+        await self.pool.execute("INSERT INTO user_settings (user_id, timezone) "
+                                "SELECT i, 'America/New_York' FROM generate_series(1, 2500) AS i;")
+        redis = FakeRedis()
+        timezones = UserTimezoneCache(self.pool, redis)
+        hset = redis.hset
+
+        async def change_during_warm(key, field=None, value=None, *, mapping=None):
+            await hset(key, field, value, mapping=mapping)
+            if mapping and "1" in mapping:
+                # Users change their timezone after the warm read the old one
+                await self.pool.execute("UPDATE user_settings SET timezone='Asia/Tokyo' WHERE user_id=2000;")
+                await timezones.set(2000, "Asia/Tokyo")
+                await self.pool.execute("UPDATE user_settings SET timezone=NULL WHERE user_id=2;")
+                await timezones.set(2, None)
+
+        redis.hset = change_during_warm
+        await timezones.warm(chunk_size=1000)
+        self.assertEqual(redis.hashes[TIMEZONES_KEY]["2000"], "Asia/Tokyo")
+        self.assertNotIn("2", redis.hashes[TIMEZONES_KEY])
+        self.assertEqual(len(redis.hashes[TIMEZONES_KEY]), 2499)
+
+
+class TestTimezoneIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = TimezoneIndex(available_timezones())
+
+    def test_search(self):
+        self.assertEqual(self.index.search("new york"), ["America/New_York"])
+        self.assertEqual(self.index.search("lon")[0], "Europe/London")
+        self.assertIn("America/Los_Angeles", self.index.search("PST"))
+        self.assertEqual(self.index.search("berln")[0], "Europe/Berlin")
+        self.assertEqual(len(self.index.search("america/")), 25)
+
+    def test_resolve(self):
+        self.assertEqual(self.index.resolve("america/new_york"), "America/New_York")
+        self.assertEqual(self.index.resolve("Tokyo"), "Asia/Tokyo")
+        self.assertEqual(self.index.resolve("UTC"), "UTC")
+        self.assertIsNone(self.index.resolve("PST"))